@@ -1,23 +1,50 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse
+import os
+
+# Thread pools of numpy, TFLite and friends are sized when they load, so
+# INFERENCE_THREADS has to reach their environment variables before the imports
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "TF_NUM_INTRAOP_THREADS")
+if os.environ.get("INFERENCE_THREADS"):
+    for var in THREAD_ENV_VARS:
+        os.environ.setdefault(var, os.environ["INFERENCE_THREADS"])
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks, Request
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-import os
 import uuid
 import shutil
 import cv2
 import tempfile
-import mediapipe as mp
+try:
+    import mediapipe as mp
+except ImportError:  # Only the MediaPipe pose backend needs it
+    mp = None
 import numpy as np
 import base64
-from enum import Enum
-from typing import Optional, Dict
+import json
+from enum import Enum, IntEnum
+from typing import Optional, Dict, List
 import time
+import asyncio
 from starlette.middleware.base import BaseHTTPMiddleware
 import math
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 import traceback
+import threading
+import signal
+import socket
+import argparse
+import subprocess
+import queue
+import sqlite3
+import gzip
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, Future, wait
+from starlette.concurrency import run_in_threadpool
 
 # Create FastAPI app with documentation configuration
 app = FastAPI(
@@ -65,13 +92,686 @@ class LimitUploadSize(BaseHTTPMiddleware):
 # Add file size limit middleware - 100MB
 app.add_middleware(LimitUploadSize)
 
+class WorkerRecycler(BaseHTTPMiddleware):
+    """
+    Count video analyses submitted to this worker and ask it to drain and exit
+    after MAX_JOBS_PER_WORKER of them, so the launcher replaces it with a
+    fresh process. Position checks don't count. The exit waits until the
+    worker's background analyses have finished. Does nothing unless that
+    variable is set.
+    """
+    JOB_PATHS = ("/api/analyze", "/api/analyze-video")
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.jobs = 0
+
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        
+        max_jobs = int(os.environ.get("MAX_JOBS_PER_WORKER", 0))
+        if request.method == "POST" and request.url.path in self.JOB_PATHS and max_jobs:
+            self.jobs += 1
+            if self.jobs == max_jobs:
+                threading.Thread(target=self._recycle_when_idle, name="worker-recycler", daemon=True).start()
+        
+        return response
+
+    def _recycle_when_idle(self):
+        # Queued and running analyses of this worker are registered for cancellation
+        while cancellations.active_count() > 0:
+            time.sleep(1)
+        print(f"Worker {os.getpid()} handled {self.jobs} jobs; recycling")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+app.add_middleware(WorkerRecycler)
+
+class SynchronousAnalysisTracker(BaseHTTPMiddleware):
+    """
+    Count /api/analyze requests in progress. They never enter the result
+    store, so count_active_analyses adds them to the load that tier selection
+    and processing estimates see. The counter lives in shared memory created
+    at import, so workers forked by run_preforked all count into the same one.
+    """
+    PATH = "/api/analyze"
+    in_flight = multiprocessing.Value("i", 0)
+
+    async def dispatch(self, request, call_next):
+        if request.method != "POST" or request.url.path != self.PATH:
+            return await call_next(request)
+        
+        with self.in_flight.get_lock():
+            self.in_flight.value += 1
+        try:
+            return await call_next(request)
+        finally:
+            with self.in_flight.get_lock():
+                self.in_flight.value -= 1
+
+app.add_middleware(SynchronousAnalysisTracker)
+
 # Define exercise types
 class ExerciseType(str, Enum):
     QUADRUPED = "quadruped"
     TOE_DRIVE = "toeDrive"
 
-# In-memory storage for analysis results
-analysis_results = {}
+# BlazePose landmark indices (same order as mp.solutions.pose.PoseLandmark),
+# defined here so analyzers don't need MediaPipe installed
+class PoseLandmark(IntEnum):
+    NOSE = 0
+    LEFT_EYE_INNER = 1
+    LEFT_EYE = 2
+    LEFT_EYE_OUTER = 3
+    RIGHT_EYE_INNER = 4
+    RIGHT_EYE = 5
+    RIGHT_EYE_OUTER = 6
+    LEFT_EAR = 7
+    RIGHT_EAR = 8
+    MOUTH_LEFT = 9
+    MOUTH_RIGHT = 10
+    LEFT_SHOULDER = 11
+    RIGHT_SHOULDER = 12
+    LEFT_ELBOW = 13
+    RIGHT_ELBOW = 14
+    LEFT_WRIST = 15
+    RIGHT_WRIST = 16
+    LEFT_PINKY = 17
+    RIGHT_PINKY = 18
+    LEFT_INDEX = 19
+    RIGHT_INDEX = 20
+    LEFT_THUMB = 21
+    RIGHT_THUMB = 22
+    LEFT_HIP = 23
+    RIGHT_HIP = 24
+    LEFT_KNEE = 25
+    RIGHT_KNEE = 26
+    LEFT_ANKLE = 27
+    RIGHT_ANKLE = 28
+    LEFT_HEEL = 29
+    RIGHT_HEEL = 30
+    LEFT_FOOT_INDEX = 31
+    RIGHT_FOOT_INDEX = 32
+
+# --- Analysis result store ---
+
+class ResultStore:
+    """
+    Status and results of background analyses, keyed by analysis ID.
+    Behaves like a dict of entries, but every access goes through the store so
+    implementations can lock or persist them. Entries returned by `get` are
+    snapshots: change them through `patch` or by assigning a whole entry.
+    Every write bumps the entry's version, which lets readers tell whether
+    anything changed since they last looked.
+    """
+    def get_versioned(self, analysis_id):
+        """
+        Return (entry, version, updated_at), or (None, 0, None) if there is no such entry.
+        """
+        raise NotImplementedError
+
+    def stat(self, analysis_id):
+        """
+        Return (version, updated_at) without loading the entry, or (0, None).
+        """
+        _, version, updated_at = self.get_versioned(analysis_id)
+        return version, updated_at
+
+    def get(self, analysis_id, default=None):
+        entry, _, _ = self.get_versioned(analysis_id)
+        return entry if entry is not None else default
+
+    def __setitem__(self, analysis_id, entry):
+        raise NotImplementedError
+
+    def patch(self, analysis_id, **fields):
+        """
+        Atomically merge `fields` into an existing entry.
+        Returns False (and writes nothing) if the entry doesn't exist, so a
+        late progress write can't resurrect a deleted analysis.
+        """
+        raise NotImplementedError
+
+    def touch(self, analysis_id):
+        """
+        Refresh an entry's last-write time without changing it or its version,
+        so a long silent stretch of a live analysis doesn't look abandoned.
+        """
+        raise NotImplementedError
+
+    def delete(self, analysis_id):
+        """
+        Remove an entry. Returns False if it didn't exist.
+        """
+        raise NotImplementedError
+
+    def values(self):
+        raise NotImplementedError
+
+    def count_active(self):
+        """
+        Number of analyses currently queued or processing.
+        """
+        raise NotImplementedError
+
+    def report(self):
+        return {"backend": self.name}
+
+    def __getitem__(self, analysis_id):
+        entry = self.get(analysis_id)
+        if entry is None:
+            raise KeyError(analysis_id)
+        return entry
+
+    def __contains__(self, analysis_id):
+        return self.get(analysis_id) is not None
+
+    def __delitem__(self, analysis_id):
+        if not self.delete(analysis_id):
+            raise KeyError(analysis_id)
+
+class InMemoryResultStore(ResultStore):
+    """
+    Entries in a dict guarded by a lock. Only visible to this process.
+    Finished analyses (not queued or processing) are evicted once they haven't
+    been written for `ttl_seconds`, and least recently used first whenever the
+    entries' serialized size exceeds `max_bytes`. With a `spill_dir`, evicted
+    entries are written there gzip-compressed and still served from disk until
+    `spill_ttl_seconds` after they were spilled.
+    """
+    name = "memory"
+
+    def __init__(self, max_bytes=None, ttl_seconds=None, spill_dir=None, spill_ttl_seconds=86400):
+        self.entries = OrderedDict()  # analysis_id -> entry, least recently used first
+        self.sizes = {}
+        self.written_at = {}
+        self.versions = {}
+        self.total_bytes = 0
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.spill_dir = spill_dir
+        self.spill_ttl_seconds = spill_ttl_seconds
+        self.evictions = {"ttl": 0, "lru": 0}
+        self.spills = 0
+        self.spill_hits = 0
+        self.last_spill_sweep = 0
+        self.lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    @staticmethod
+    def entry_size(entry):
+        """
+        Approximate memory cost of an entry: its JSON-serialized size.
+        """
+        return len(json.dumps(entry, default=str))
+
+    def _spill_path(self, analysis_id):
+        return os.path.join(self.spill_dir, f"{analysis_id}.json.gz")
+
+    def _write(self, analysis_id, entry):
+        self.total_bytes -= self.sizes.get(analysis_id, 0)
+        self.entries[analysis_id] = entry
+        self.entries.move_to_end(analysis_id)
+        self.sizes[analysis_id] = self.entry_size(entry)
+        self.total_bytes += self.sizes[analysis_id]
+        self.written_at[analysis_id] = time.time()
+        self.versions[analysis_id] = self.versions.get(analysis_id, 0) + 1
+
+    def _drop(self, analysis_id):
+        entry = self.entries.pop(analysis_id, None)
+        version, updated_at = 0, None
+        if entry is not None:
+            self.total_bytes -= self.sizes.pop(analysis_id)
+            updated_at = self.written_at.pop(analysis_id)
+            version = self.versions.pop(analysis_id)
+        return entry, version, updated_at
+
+    def _evict(self, analysis_id, reason):
+        entry, version, updated_at = self._drop(analysis_id)
+        self.evictions[reason] += 1
+        if self.spill_dir:
+            try:
+                with gzip.open(self._spill_path(analysis_id), "wt", encoding="utf-8") as f:
+                    json.dump({"version": version, "updated_at": updated_at, "entry": entry}, f, default=str)
+                self.spills += 1
+            except Exception as e:
+                print(f"Error spilling analysis {analysis_id} to disk: {e}")
+
+    def _expire_entry(self, analysis_id):
+        # Reads check their own entry, so a read-only stretch can't serve it past the TTL
+        entry = self.entries.get(analysis_id)
+        if (entry is not None and self.ttl_seconds is not None
+                and entry.get("status") not in ("queued", "processing")
+                and time.time() - self.written_at[analysis_id] > self.ttl_seconds):
+            self._evict(analysis_id, "ttl")
+
+    def _enforce_limits(self):
+        now = time.time()
+        # Only finished analyses are evictable; running ones are still being written
+        evictable = [analysis_id for analysis_id, entry in self.entries.items()
+                     if entry.get("status") not in ("queued", "processing")]
+        if self.ttl_seconds is not None:
+            for analysis_id in evictable:
+                if now - self.written_at[analysis_id] > self.ttl_seconds:
+                    self._evict(analysis_id, "ttl")
+        if self.max_bytes is not None:
+            for analysis_id in evictable:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                if analysis_id in self.entries:
+                    self._evict(analysis_id, "lru")
+        # Spilled results expire too, checked at most once a minute
+        if self.spill_dir and now - self.last_spill_sweep > 60:
+            self.last_spill_sweep = now
+            for filename in os.listdir(self.spill_dir):
+                path = os.path.join(self.spill_dir, filename)
+                try:
+                    if now - os.path.getmtime(path) > self.spill_ttl_seconds:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def _read_spilled(self, analysis_id):
+        if not self.spill_dir:
+            return None, 0, None
+        path = self._spill_path(analysis_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.spill_ttl_seconds:
+                os.remove(path)
+                return None, 0, None
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                spilled = json.load(f)
+        except (OSError, ValueError):
+            return None, 0, None
+        self.spill_hits += 1
+        return spilled["entry"], spilled["version"], spilled["updated_at"]
+
+    def get_versioned(self, analysis_id):
+        with self.lock:
+            self._expire_entry(analysis_id)
+            entry = self.entries.get(analysis_id)
+            if entry is not None:
+                self.entries.move_to_end(analysis_id)
+                return dict(entry), self.versions[analysis_id], self.written_at[analysis_id]
+            # Served from disk without re-admitting, so a poll can't push out fresher results
+            return self._read_spilled(analysis_id)
+
+    def stat(self, analysis_id):
+        with self.lock:
+            self._expire_entry(analysis_id)
+            if analysis_id in self.entries:
+                return self.versions[analysis_id], self.written_at[analysis_id]
+        return super().stat(analysis_id)
+
+    def __setitem__(self, analysis_id, entry):
+        with self.lock:
+            self._write(analysis_id, dict(entry))
+            self._enforce_limits()
+
+    def patch(self, analysis_id, **fields):
+        with self.lock:
+            if analysis_id not in self.entries:
+                return False
+            entry = self.entries[analysis_id]
+            entry.update(fields)
+            self._write(analysis_id, entry)
+            return True
+
+    def touch(self, analysis_id):
+        # Entries die with this process, so only the TTL clock needs refreshing
+        with self.lock:
+            if analysis_id in self.entries:
+                self.written_at[analysis_id] = time.time()
+
+    def delete(self, analysis_id):
+        with self.lock:
+            found = self._drop(analysis_id)[0] is not None
+            if self.spill_dir:
+                try:
+                    os.remove(self._spill_path(analysis_id))
+                    found = True
+                except OSError:
+                    pass
+            return found
+
+    def values(self):
+        with self.lock:
+            return [dict(entry) for entry in self.entries.values()]
+
+    def count_active(self):
+        with self.lock:
+            return sum(1 for entry in self.entries.values()
+                       if entry.get("status") in ("queued", "processing"))
+
+    def report(self):
+        with self.lock:
+            self._enforce_limits()
+            report = {
+                "backend": self.name,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": dict(self.evictions)
+            }
+            if self.spill_dir:
+                spilled = [os.path.join(self.spill_dir, f) for f in os.listdir(self.spill_dir)]
+                report["spill"] = {
+                    "dir": self.spill_dir,
+                    "spilled": self.spills,
+                    "hits": self.spill_hits,
+                    "files": len(spilled),
+                    "bytes": sum(os.path.getsize(path) for path in spilled if os.path.exists(path))
+                }
+            return report
+
+class SQLiteResultStore(ResultStore):
+    """
+    Entries as JSON rows in a local SQLite database, so every worker process
+    on the host sees the same analyses. Each thread (and each forked process)
+    opens its own connection; patches run in an IMMEDIATE transaction so
+    concurrent read-modify-writes don't lose updates. Finished analyses are
+    deleted `ttl_seconds` after their last write. The file outlives worker
+    processes, so queued or processing rows not written (or touched) for
+    `stale_seconds` belong to a worker that died and are marked as errors.
+    """
+    name = "sqlite"
+
+    def __init__(self, path, ttl_seconds=None, stale_seconds=None, sweep_interval=30):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.sweep_interval = sweep_interval
+        self.last_sweep = 0
+        self.evictions = {"ttl": 0, "stale": 0}
+        self.local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analyses ("
+                "analysis_id TEXT PRIMARY KEY, entry TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "version INTEGER NOT NULL DEFAULT 1)")
+
+    def _connection(self):
+        conn = getattr(self.local, "conn", None)
+        # Connections must not cross a fork
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=10000")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def _unexpired(self):
+        # Reads skip rows past the TTL, which are only deleted on the next write
+        if self.ttl_seconds is None:
+            return "", ()
+        return (" AND (updated_at >= ? "
+                "OR COALESCE(json_extract(entry, '$.status'), '') IN ('queued', 'processing'))",
+                (time.time() - self.ttl_seconds,))
+
+    def _sweep(self):
+        # Reads may go on for a long time without a write: expire at most every `sweep_interval`
+        if time.time() - self.last_sweep > self.sweep_interval:
+            self._expire()
+
+    def get_versioned(self, analysis_id):
+        self._sweep()
+        clause, params = self._unexpired()
+        row = self._connection().execute(
+            "SELECT entry, version, updated_at FROM analyses WHERE analysis_id = ?" + clause,
+            (analysis_id,) + params).fetchone()
+        return (json.loads(row[0]), row[1], row[2]) if row else (None, 0, None)
+
+    def stat(self, analysis_id):
+        self._sweep()
+        clause, params = self._unexpired()
+        row = self._connection().execute(
+            "SELECT version, updated_at FROM analyses WHERE analysis_id = ?" + clause,
+            (analysis_id,) + params).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def _expire(self):
+        now = time.time()
+        self.last_sweep = now
+        if self.stale_seconds is not None:
+            cursor = self._connection().execute(
+                "UPDATE analyses SET entry = json_set(entry, '$.status', 'error', '$.progress', 100, "
+                "'$.message', 'Error analyzing video: the worker running it stopped responding.'), "
+                "updated_at = ?, version = version + 1 "
+                "WHERE updated_at < ? AND json_extract(entry, '$.status') IN ('queued', 'processing')",
+                (now, now - self.stale_seconds))
+            self.evictions["stale"] += cursor.rowcount
+        if self.ttl_seconds is None:
+            return
+        cursor = self._connection().execute(
+            "DELETE FROM analyses WHERE updated_at < ? "
+            "AND COALESCE(json_extract(entry, '$.status'), '') NOT IN ('queued', 'processing')",
+            (now - self.ttl_seconds,))
+        self.evictions["ttl"] += cursor.rowcount
+
+    def __setitem__(self, analysis_id, entry):
+        self._connection().execute(
+            "INSERT INTO analyses (analysis_id, entry, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(analysis_id) DO UPDATE SET entry = excluded.entry, "
+            "updated_at = excluded.updated_at, version = version + 1",
+            (analysis_id, json.dumps(entry), time.time()))
+        self._expire()
+
+    def patch(self, analysis_id, **fields):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT entry FROM analyses WHERE analysis_id = ?", (analysis_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return False
+            entry = json.loads(row[0])
+            entry.update(fields)
+            conn.execute(
+                "UPDATE analyses SET entry = ?, updated_at = ?, version = version + 1 WHERE analysis_id = ?",
+                (json.dumps(entry), time.time(), analysis_id))
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def touch(self, analysis_id):
+        self._connection().execute(
+            "UPDATE analyses SET updated_at = ? WHERE analysis_id = ?", (time.time(), analysis_id))
+
+    def delete(self, analysis_id):
+        cursor = self._connection().execute(
+            "DELETE FROM analyses WHERE analysis_id = ?", (analysis_id,))
+        return cursor.rowcount > 0
+
+    def values(self):
+        rows = self._connection().execute("SELECT entry FROM analyses").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count_active(self):
+        # Counted in SQLite, without decoding the (possibly large) entries
+        self._sweep()
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM analyses WHERE json_extract(entry, '$.status') IN ('queued', 'processing')"
+        ).fetchone()[0]
+
+    def report(self):
+        self._expire()
+        count, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(entry)), 0) FROM analyses").fetchone()
+        return {
+            "backend": self.name,
+            "entries": count,
+            "bytes": size,
+            "path": self.path,
+            "ttl_seconds": self.ttl_seconds,
+            "stale_seconds": self.stale_seconds,
+            # Counted by this process only
+            "evictions": dict(self.evictions)
+        }
+
+RESULT_STORES = {
+    InMemoryResultStore.name: InMemoryResultStore,
+    SQLiteResultStore.name: SQLiteResultStore
+}
+DEFAULT_RESULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "analysis_results.sqlite3")
+
+# Retention of finished analyses. Clients rarely delete results themselves
+RESULT_TTL_SECONDS = float(os.environ.get("RESULT_TTL_SECONDS", 3600))
+RESULT_STORE_MAX_MB = float(os.environ.get("RESULT_STORE_MAX_MB", 256))
+RESULT_SPILL_DIR = os.environ.get("RESULT_SPILL_DIR") or None  # Unset: evicted results are dropped
+# Running analyses touch their entry every RESULT_HEARTBEAT_SECONDS; shared-store
+# entries silent for RESULT_STALE_SECONDS are taken to belong to a dead worker
+RESULT_HEARTBEAT_SECONDS = 60
+RESULT_STALE_SECONDS = float(os.environ.get("RESULT_STALE_SECONDS", 900))
+
+def create_result_store(backend=None, path=None):
+    """
+    Build the result store named by `backend` (default: env RESULT_STORE, else
+    in-memory). Multi-worker deployments need "sqlite" so a status poll can
+    land on any worker.
+    """
+    backend = backend or os.environ.get("RESULT_STORE", InMemoryResultStore.name)
+    if backend not in RESULT_STORES:
+        raise ValueError(f"Unknown result store '{backend}'. Available: {', '.join(RESULT_STORES)}")
+    if backend == SQLiteResultStore.name:
+        return SQLiteResultStore(path or os.environ.get("RESULT_STORE_PATH", DEFAULT_RESULT_STORE_PATH),
+                                 ttl_seconds=RESULT_TTL_SECONDS,
+                                 stale_seconds=RESULT_STALE_SECONDS)
+    return InMemoryResultStore(max_bytes=int(RESULT_STORE_MAX_MB * 1024 * 1024),
+                               ttl_seconds=RESULT_TTL_SECONDS,
+                               spill_dir=RESULT_SPILL_DIR)
+
+# Status and results of background analyses
+analysis_results = create_result_store()
+
+def start_heartbeat(analysis_id, interval=RESULT_HEARTBEAT_SECONDS):
+    """
+    Touch an analysis's entry every `interval` seconds until the returned
+    event is set, so stretches without progress writes (model loading,
+    parallel segments) don't get it marked stale.
+    """
+    stop = threading.Event()
+    def beat():
+        while not stop.wait(interval):
+            try:
+                analysis_results.touch(analysis_id)
+            except Exception as e:
+                print(f"Error refreshing analysis {analysis_id}: {e}")
+    threading.Thread(target=beat, name=f"heartbeat-{analysis_id}", daemon=True).start()
+    return stop
+
+# --- Cancellation ---
+
+class AnalysisCancelled(Exception):
+    """
+    Raised inside an analysis once its cancel token is set.
+    """
+
+class CancelToken:
+    """
+    Cooperative cancellation flag for one running analysis. DELETE sets it
+    directly when it reaches the worker running the job; otherwise the job
+    notices the `cancel_requested_at` marker in the shared result store, which
+    is checked at most every `poll_interval` seconds. Cheap enough to call per frame.
+    """
+    def __init__(self, analysis_id=None, poll_interval=0.5):
+        self.analysis_id = analysis_id
+        self.poll_interval = poll_interval
+        self.event = threading.Event()
+        self.requested_at = None
+        self.last_poll = 0
+
+    def cancel(self, requested_at=None):
+        if not self.event.is_set():
+            self.requested_at = requested_at or time.time()
+            self.event.set()
+
+    def cancelled(self):
+        if self.event.is_set():
+            return True
+        now = time.time()
+        if self.analysis_id and now - self.last_poll > self.poll_interval:
+            self.last_poll = now
+            entry = analysis_results.get(self.analysis_id)
+            # A vanished entry means nobody can read the result any more
+            if entry is None or entry.get("cancel_requested_at"):
+                self.cancel(entry.get("cancel_requested_at") if entry else None)
+        return self.event.is_set()
+
+    def check(self):
+        """
+        Raise AnalysisCancelled if cancellation was requested.
+        """
+        if self.cancelled():
+            raise AnalysisCancelled()
+
+class CancellationRegistry:
+    """
+    Cancel tokens of the analyses this worker runs, plus how long cancelled
+    jobs took to actually stop (request to resources released).
+    """
+    def __init__(self, history=200):
+        self.tokens = {}
+        self.latencies = deque(maxlen=history)
+        self.cancelled_total = 0
+        self.lock = threading.Lock()
+
+    def token(self, analysis_id):
+        with self.lock:
+            if analysis_id not in self.tokens:
+                self.tokens[analysis_id] = CancelToken(analysis_id)
+            return self.tokens[analysis_id]
+
+    def active_count(self):
+        """
+        Number of analyses queued or running in this worker.
+        """
+        with self.lock:
+            return len(self.tokens)
+
+    def cancel(self, analysis_id, requested_at=None):
+        """
+        Set the token of an analysis running here. Returns False if it isn't.
+        """
+        with self.lock:
+            token = self.tokens.get(analysis_id)
+        if token is None:
+            return False
+        token.cancel(requested_at)
+        return True
+
+    def release(self, analysis_id, cancelled=False):
+        """
+        Forget a finished analysis. For a cancelled one, record and return the
+        cancellation latency in seconds.
+        """
+        with self.lock:
+            token = self.tokens.pop(analysis_id, None)
+            if not cancelled or token is None or token.requested_at is None:
+                return None
+            latency = max(0.0, time.time() - token.requested_at)
+            self.latencies.append(latency)
+            self.cancelled_total += 1
+            return latency
+
+    def report(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            report = {"running": len(self.tokens), "cancelled": self.cancelled_total}
+        if latencies:
+            report["latency_seconds"] = {
+                "mean": round(sum(latencies) / len(latencies), 3),
+                "p50": round(latencies[len(latencies) // 2], 3),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                "max": round(latencies[-1], 3)
+            }
+        return report
+
+cancellations = CancellationRegistry()
 
 def calculate_angle(a, b, c):
     a = np.array(a)  # First
@@ -91,824 +791,3346 @@ async def root():
     """Health check endpoint"""
     return {"status": "API is running"}
 
-@app.post("/api/check-position")
-async def check_position(
-    image: UploadFile = File(...),
-    exercise_type: str = Form(default=ExerciseType.QUADRUPED)
-):
+def evaluate_position(img, exercise_type, get_pose):
     """
-    Analyze a single frame to verify the starting position.
-    Returns feedback on the correctness of the position and detailed position metrics.
+    Check the starting position in one BGR frame.
+    `get_pose` returns the Pose instance to use; it is only called once the
+    frame has passed the quality gate.
+    Returns the is_position_correct / feedback / position_details response dict.
     """
-    if exercise_type not in [e.value for e in ExerciseType]:
-        exercise_type = ExerciseType.QUADRUPED
+    # Cheap quality gate first: hopeless frames never reach pose inference
+    frame_quality = assess_frame_quality(img)
     
-    temp_dir = tempfile.mkdtemp()
-    image_path = os.path.join(temp_dir, f"position_check_{str(uuid.uuid4())}.jpg")
+    # Initialize position details with more criteria
+    position_details = {
+        "hands_under_shoulders": False,
+        "knees_under_hips": False,
+        "back_alignment": False,
+        "feet_position_correct": False,
+        "toe_position": exercise_type == ExerciseType.TOE_DRIVE,  # Only relevant for toe drive
+        "visibility": {
+            "shoulders": 0,
+            "wrists": 0,
+            "hips": 0,
+            "knees": 0,
+            "ankles": 0
+        },
+        "lighting_quality": frame_quality["lighting_quality"],
+        "frame_quality": frame_quality
+    }
     
-    try:
-        with open(image_path, "wb") as buffer:
-            shutil.copyfileobj(image.file, buffer)
+    if not frame_quality["usable"]:
+        return {
+            "is_position_correct": False,
+            "feedback": frame_quality["issues"][0],
+            "position_details": position_details
+        }
+    
+    # Process with MediaPipe
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    landmarks = get_pose().infer(img_rgb)
+    
+    if landmarks is None:
+        # If no pose detected, point at the lighting if that's the likely cause
+        if frame_quality["lighting_quality"] == "poor":
+            return {
+                "is_position_correct": False,
+                "feedback": "⚠️ Lighting is too dark. Move to a brighter area or turn on more lights.",
+                "position_details": position_details
+            }
         
-        # Load the image
-        img = cv2.imread(image_path)
-        if img is None:
-            raise HTTPException(status_code=400, detail="Unable to read image file")
+        return {
+            "is_position_correct": False,
+            "feedback": "⚠️ Pose not detected. Please ensure your full body is visible.",
+            "position_details": position_details
+        }
+    
+    # Get key landmarks for position verification
+    left_shoulder = landmarks[PoseLandmark.LEFT_SHOULDER.value]
+    right_shoulder = landmarks[PoseLandmark.RIGHT_SHOULDER.value]
+    left_wrist = landmarks[PoseLandmark.LEFT_WRIST.value]
+    right_wrist = landmarks[PoseLandmark.RIGHT_WRIST.value]
+    left_hip = landmarks[PoseLandmark.LEFT_HIP.value]
+    right_hip = landmarks[PoseLandmark.RIGHT_HIP.value]
+    left_knee = landmarks[PoseLandmark.LEFT_KNEE.value]
+    right_knee = landmarks[PoseLandmark.RIGHT_KNEE.value]
+    left_ankle = landmarks[PoseLandmark.LEFT_ANKLE.value]
+    right_ankle = landmarks[PoseLandmark.RIGHT_ANKLE.value]
+    left_foot_index = landmarks[PoseLandmark.LEFT_FOOT_INDEX.value]
+    right_foot_index = landmarks[PoseLandmark.RIGHT_FOOT_INDEX.value]
+    left_heel = landmarks[PoseLandmark.LEFT_HEEL.value]
+    right_heel = landmarks[PoseLandmark.RIGHT_HEEL.value]
+    
+    # If lighting is poor, that's the first thing to fix
+    if frame_quality["lighting_quality"] == "poor":
+        return {
+            "is_position_correct": False,
+            "feedback": "⚠️ Lighting is too dark. Move to a brighter area for better tracking.",
+            "position_details": position_details
+        }
+    
+    # Track visibility of key body parts
+    position_details["visibility"]["shoulders"] = (left_shoulder["visibility"] + right_shoulder["visibility"]) / 2
+    position_details["visibility"]["wrists"] = (left_wrist["visibility"] + right_wrist["visibility"]) / 2
+    position_details["visibility"]["hips"] = (left_hip["visibility"] + right_hip["visibility"]) / 2
+    position_details["visibility"]["knees"] = (left_knee["visibility"] + right_knee["visibility"]) / 2
+    position_details["visibility"]["ankles"] = (left_ankle["visibility"] + right_ankle["visibility"]) / 2
+    
+    # Check hands under shoulders - improved criteria
+    if left_shoulder["visibility"] > 0.5 and right_shoulder["visibility"] > 0.5 and left_wrist["visibility"] > 0.5 and right_wrist["visibility"] > 0.5:
+        # Calculate alignment score using horizontal distance
+        left_shoulder_wrist_horizontal_diff = abs(left_shoulder["x"] - left_wrist["x"])
+        right_shoulder_wrist_horizontal_diff = abs(right_shoulder["x"] - right_wrist["x"])
         
-        # Process with MediaPipe
-        mp_pose = mp.solutions.pose
-        with mp_pose.Pose(static_image_mode=True, min_detection_confidence=0.5) as pose:
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            results = pose.process(img_rgb)
-            
-            # Initialize position details with more criteria
-            position_details = {
-                "hands_under_shoulders": False,
-                "knees_under_hips": False,
-                "back_alignment": False,
-                "feet_position_correct": False,
-                "toe_position": exercise_type == ExerciseType.TOE_DRIVE,  # Only relevant for toe drive
-                "visibility": {
-                    "shoulders": 0,
-                    "wrists": 0,
-                    "hips": 0,
-                    "knees": 0,
-                    "ankles": 0
-                },
-                "lighting_quality": "unknown"
-            }
-            
-            if not results.pose_landmarks:
-                # If no pose detected, try to assess lighting
-                lighting_quality = assess_lighting_quality(img)
-                position_details["lighting_quality"] = lighting_quality
-                
-                if lighting_quality == "poor":
-                    return JSONResponse({
-                        "is_position_correct": False,
-                        "feedback": "⚠️ Lighting is too dark. Move to a brighter area or turn on more lights.",
-                        "position_details": position_details
-                    })
-                
-                return JSONResponse({
-                    "is_position_correct": False,
-                    "feedback": "⚠️ Pose not detected. Please ensure your full body is visible.",
-                    "position_details": position_details
-                })
-            
-            landmarks = results.pose_landmarks.landmark
-            
-            # Get key landmarks for position verification
-            left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-            right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
-            left_wrist = landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value]
-            right_wrist = landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value]
-            left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-            right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
-            left_knee = landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value]
-            right_knee = landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value]
-            left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value]
-            right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value]
-            left_foot_index = landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value]
-            right_foot_index = landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value]
-            left_heel = landmarks[mp_pose.PoseLandmark.LEFT_HEEL.value]
-            right_heel = landmarks[mp_pose.PoseLandmark.RIGHT_HEEL.value]
-            
-            # Also evaluate lighting
-            lighting_quality = assess_lighting_quality(img)
-            position_details["lighting_quality"] = lighting_quality
-            
-            # If lighting is poor, that's the first thing to fix
-            if lighting_quality == "poor":
-                return JSONResponse({
-                    "is_position_correct": False,
-                    "feedback": "⚠️ Lighting is too dark. Move to a brighter area for better tracking.",
-                    "position_details": position_details
-                })
-            
-            # Track visibility of key body parts
-            position_details["visibility"]["shoulders"] = (left_shoulder.visibility + right_shoulder.visibility) / 2
-            position_details["visibility"]["wrists"] = (left_wrist.visibility + right_wrist.visibility) / 2
-            position_details["visibility"]["hips"] = (left_hip.visibility + right_hip.visibility) / 2
-            position_details["visibility"]["knees"] = (left_knee.visibility + right_knee.visibility) / 2
-            position_details["visibility"]["ankles"] = (left_ankle.visibility + right_ankle.visibility) / 2
+        # More accurate horizontal alignment check
+        shoulder_wrist_alignment = (
+            left_shoulder_wrist_horizontal_diff < 0.1 and  # Threshold for horizontal alignment
+            right_shoulder_wrist_horizontal_diff < 0.1
+        )
+        
+        position_details["hands_under_shoulders"] = shoulder_wrist_alignment
+    
+    # Check knees under hips alignment
+    if left_hip["visibility"] > 0.5 and right_hip["visibility"] > 0.5 and left_knee["visibility"] > 0.5 and right_knee["visibility"] > 0.5:
+        # Calculate alignment score using horizontal distance
+        left_hip_knee_horizontal_diff = abs(left_hip["x"] - left_knee["x"])
+        right_hip_knee_horizontal_diff = abs(right_hip["x"] - right_knee["x"])
+        
+        # Horizontal alignment check
+        hip_knee_alignment = (
+            left_hip_knee_horizontal_diff < 0.1 and  # Threshold for horizontal alignment
+            right_hip_knee_horizontal_diff < 0.1
+        )
+        
+        position_details["knees_under_hips"] = hip_knee_alignment
+    
+    # Check back alignment (should be approximately parallel to ground)
+    if left_shoulder["visibility"] > 0.5 and right_shoulder["visibility"] > 0.5 and left_hip["visibility"] > 0.5 and right_hip["visibility"] > 0.5:
+        # Calculate the angle of the back relative to horizontal
+        left_shoulder_y = (left_shoulder["y"] + right_shoulder["y"]) / 2
+        hip_y = (left_hip["y"] + right_hip["y"]) / 2
+        
+        # Back should be approximately horizontal (parallel to ground)
+        # A small angle difference is acceptable
+        back_angle_threshold = 0.1  # Threshold for back angle (in normalized coordinates)
+        back_alignment = abs(left_shoulder_y - hip_y) < back_angle_threshold
+        
+        position_details["back_alignment"] = back_alignment
+    
+    # Check feet position - different for each exercise type
+    if exercise_type == ExerciseType.QUADRUPED:
+        # For quadruped, feet should be hip-width apart and flat
+        if left_ankle["visibility"] > 0.5 and right_ankle["visibility"] > 0.5:
+            ankle_distance = abs(left_ankle["x"] - right_ankle["x"])
+            hip_distance = abs(left_hip["x"] - right_hip["x"])
             
-            # Check hands under shoulders - improved criteria
-            if left_shoulder.visibility > 0.5 and right_shoulder.visibility > 0.5 and left_wrist.visibility > 0.5 and right_wrist.visibility > 0.5:
-                # Calculate alignment score using horizontal distance
-                left_shoulder_wrist_horizontal_diff = abs(left_shoulder.x - left_wrist.x)
-                right_shoulder_wrist_horizontal_diff = abs(right_shoulder.x - right_wrist.x)
-                
-                # More accurate horizontal alignment check
-                shoulder_wrist_alignment = (
-                    left_shoulder_wrist_horizontal_diff < 0.1 and  # Threshold for horizontal alignment
-                    right_shoulder_wrist_horizontal_diff < 0.1
-                )
-                
-                position_details["hands_under_shoulders"] = shoulder_wrist_alignment
+            # Ankles should be approximately hip-width apart
+            feet_width_correct = abs(ankle_distance - hip_distance) < 0.1
             
-            # Check knees under hips alignment
-            if left_hip.visibility > 0.5 and right_hip.visibility > 0.5 and left_knee.visibility > 0.5 and right_knee.visibility > 0.5:
-                # Calculate alignment score using horizontal distance
-                left_hip_knee_horizontal_diff = abs(left_hip.x - left_knee.x)
-                right_hip_knee_horizontal_diff = abs(right_hip.x - right_knee.x)
-                
-                # Horizontal alignment check
-                hip_knee_alignment = (
-                    left_hip_knee_horizontal_diff < 0.1 and  # Threshold for horizontal alignment
-                    right_hip_knee_horizontal_diff < 0.1
-                )
-                
-                position_details["knees_under_hips"] = hip_knee_alignment
+            position_details["feet_position_correct"] = feet_width_correct
+    
+    elif exercise_type == ExerciseType.TOE_DRIVE:
+        # For toe drive, check if toes are pointed (foot_index lower than heel)
+        if (left_foot_index["visibility"] > 0.5 and left_heel["visibility"] > 0.5 and
+            right_foot_index["visibility"] > 0.5 and right_heel["visibility"] > 0.5):
             
-            # Check back alignment (should be approximately parallel to ground)
-            if left_shoulder.visibility > 0.5 and right_shoulder.visibility > 0.5 and left_hip.visibility > 0.5 and right_hip.visibility > 0.5:
-                # Calculate the angle of the back relative to horizontal
-                left_shoulder_y = (left_shoulder.y + right_shoulder.y) / 2
-                hip_y = (left_hip.y + right_hip.y) / 2
-                
-                # Back should be approximately horizontal (parallel to ground)
-                # A small angle difference is acceptable
-                back_angle_threshold = 0.1  # Threshold for back angle (in normalized coordinates)
-                back_alignment = abs(left_shoulder_y - hip_y) < back_angle_threshold
-                
-                position_details["back_alignment"] = back_alignment
+            left_toe_pointed = left_foot_index["y"] > left_heel["y"]
+            right_toe_pointed = right_foot_index["y"] > right_heel["y"]
             
-            # Check feet position - different for each exercise type
-            if exercise_type == ExerciseType.QUADRUPED:
-                # For quadruped, feet should be hip-width apart and flat
-                if left_ankle.visibility > 0.5 and right_ankle.visibility > 0.5:
-                    ankle_distance = abs(left_ankle.x - right_ankle.x)
-                    hip_distance = abs(left_hip.x - right_hip.x)
-                    
-                    # Ankles should be approximately hip-width apart
-                    feet_width_correct = abs(ankle_distance - hip_distance) < 0.1
-                    
-                    position_details["feet_position_correct"] = feet_width_correct
-            
-            elif exercise_type == ExerciseType.TOE_DRIVE:
-                # For toe drive, check if toes are pointed (foot_index lower than heel)
-                if (left_foot_index.visibility > 0.5 and left_heel.visibility > 0.5 and
-                    right_foot_index.visibility > 0.5 and right_heel.visibility > 0.5):
-                    
-                    left_toe_pointed = left_foot_index.y > left_heel.y
-                    right_toe_pointed = right_foot_index.y > right_heel.y
-                    
-                    position_details["toe_position"] = left_toe_pointed and right_toe_pointed
-                    position_details["feet_position_correct"] = left_toe_pointed and right_toe_pointed
-            
-            # Determine overall position correctness - be more lenient to avoid frustrating users
-            # For quadruped, prioritize hands and knees position
-            if exercise_type == ExerciseType.QUADRUPED:
-                position_correct = (
-                    position_details["hands_under_shoulders"] and
-                    position_details["knees_under_hips"]
-                    # Not requiring back alignment and feet position to be perfect
-                )
-            else:  # Toe drive
-                position_correct = (
-                    position_details["knees_under_hips"] and
-                    position_details["hands_under_shoulders"]
-                    # Not requiring perfect toe position to proceed
-                )
-            
-            # Generate appropriate feedback message
-            if position_correct:
-                feedback = "✅ Great starting position! You're ready to begin."
-            else:
-                # Prioritize feedback based on what's most important to fix first
-                if not position_details["hands_under_shoulders"]:
-                    feedback = "⚠️ Position your hands directly under your shoulders."
-                elif not position_details["knees_under_hips"]:
-                    feedback = "⚠️ Position your knees directly under your hips."
-                elif not position_details["back_alignment"]:
-                    feedback = "⚠️ Keep your back flat and parallel to the floor."
-                elif not position_details["feet_position_correct"]:
-                    if exercise_type == ExerciseType.TOE_DRIVE:
-                        feedback = "⚠️ Point your toes downward for proper toe drive position."
-                    else:
-                        feedback = "⚠️ Position your feet hip-width apart."
-                else:
-                    # If we can't determine a specific issue, give general guidance
-                    feedback = "⚠️ Adjust your position to match the guide shown."
-            
-            return JSONResponse({
-                "is_position_correct": position_correct,
-                "feedback": feedback,
-                "position_details": position_details
-            })
-            
-    except Exception as e:
-        print(f"Error checking position: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error checking position: {str(e)}")
-    finally:
-        try:
-            shutil.rmtree(temp_dir, ignore_errors=True)
-        except:
-            pass
-
-def assess_lighting_quality(image):
-    """
-    Assess the lighting quality of an image.
-    Returns: "good", "medium", or "poor"
-    """
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    # Calculate brightness (mean pixel value)
-    brightness = np.mean(gray)
-    
-    # Calculate contrast (standard deviation of pixel values)
-    contrast = np.std(gray)
-    
-    # Thresholds for lighting quality
-    if brightness < 50:  # Very dark
-        return "poor"
-    elif brightness < 100 or contrast < 30:  # Moderately dark or low contrast
-        return "medium"
-    else:
-        return "good"
-
-def process_video_async(video_path, exercise_type, video_id):
-    """
-    Process video asynchronously and store results
-    """
-    try:
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            analysis_results[video_id] = {"error": "Unable to open video file"}
-            return
-
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        if fps <= 0:
-            fps = 30  # Fallback to 30fps if detection fails
-        
-        mp_pose = mp.solutions.pose
-        pose = mp_pose.Pose(min_detection_confidence=0.2, min_tracking_confidence=0.2)  # Even lower thresholds
-
-        all_landmarks = []
-        foot_lift_frames = 0
-        head_drop_frames = 0
-        ankle_collapse_frames = 0
-        toe_drive_frames = 0
-        repetitions = 0
-        hip_positions = []
-        in_rock_back_phase = False
-        
-        valid_frames = 0
-        total_processed_frames = 0
-        
-        baseline_left_ankle_z = []
-        baseline_right_ankle_z = []
-        baseline_left_foot_y = []
-        baseline_right_foot_y = []
-        
-        # Track visibility of key body parts for specific feedback
-        visibility_issues = {
-            "left_shoulder": 0,
-            "right_shoulder": 0,
-            "left_wrist": 0,
-            "right_wrist": 0,
-            "left_hip": 0,
-            "right_hip": 0,
-            "left_knee": 0,
-            "right_knee": 0,
-            "left_ankle": 0,
-            "right_ankle": 0,
-            "head": 0
-        }
-        
-        frame_num = 0
-        max_frames = 300  # Limit processing to 10 seconds of 30fps video
-        frame_sample_rate = 10  # Process every 10th frame for even faster analysis
-        
-        while frame_num < max_frames:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            frame_num += 1
-            
-            # Sample frames for efficiency
-            if frame_num % frame_sample_rate != 0:
-                # Still add a placeholder to maintain correct frame indexing
-                all_landmarks.append(None)
-                continue
-
-            total_processed_frames += 1
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = pose.process(image_rgb)
-            
-            frame_landmarks = results.pose_landmarks
-            if frame_landmarks:
-                valid_frames += 1
-                landmarks = frame_landmarks.landmark
-                all_landmarks.append([{'x': l.x, 'y': l.y, 'z': l.z, 'visibility': l.visibility} for l in landmarks])
-
-                # Key landmarks
-                left_shoulder = landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]
-                right_shoulder = landmarks[mp_pose.PoseLandmark.RIGHT_SHOULDER.value]
-                left_ear = landmarks[mp_pose.PoseLandmark.LEFT_EAR.value]
-                right_ear = landmarks[mp_pose.PoseLandmark.RIGHT_EAR.value]
-                nose = landmarks[mp_pose.PoseLandmark.NOSE.value]
-                left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value]
-                right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value]
-                left_foot_index = landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value]
-                right_foot_index = landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value]
-                left_heel = landmarks[mp_pose.PoseLandmark.LEFT_HEEL.value]
-                right_heel = landmarks[mp_pose.PoseLandmark.RIGHT_HEEL.value]
-                left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-                right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
-                left_knee = landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value]
-                right_knee = landmarks[mp_pose.PoseLandmark.RIGHT_KNEE.value]
-
-                # Track visibility issues for specific feedback
-                key_parts = {
-                    "left_shoulder": left_shoulder,
-                    "right_shoulder": right_shoulder,
-                    "left_wrist": landmarks[mp_pose.PoseLandmark.LEFT_WRIST.value],
-                    "right_wrist": landmarks[mp_pose.PoseLandmark.RIGHT_WRIST.value],
-                    "left_hip": left_hip,
-                    "right_hip": right_hip,
-                    "left_knee": left_knee,
-                    "right_knee": right_knee,
-                    "left_ankle": left_ankle,
-                    "right_ankle": right_ankle,
-                    "head": nose
-                }
-                
-                for part_name, landmark in key_parts.items():
-                    if landmark.visibility < 0.3:
-                        visibility_issues[part_name] += 1
-
-                # Head Drop Logic
-                if left_shoulder.visibility > 0.3 and (left_ear.visibility > 0.3 or right_ear.visibility > 0.3) and nose.visibility > 0.3:
-                    # Use whichever ear is more visible
-                    ear = left_ear if left_ear.visibility > right_ear.visibility else right_ear
-                    neck_angle = calculate_angle((left_shoulder.x, left_shoulder.y), (ear.x, ear.y), (nose.x, nose.y))
-                    if neck_angle < 140:  # More lenient
-                        head_drop_frames += 1
-                
-                # Foot Lift Logic
-                if len(baseline_left_ankle_z) < 3 and left_ankle.visibility > 0.3:
-                     baseline_left_ankle_z.append(left_ankle.z)
-                     baseline_left_foot_y.append(left_foot_index.y)
-                elif left_ankle.visibility > 0.3:
-                    avg_baseline_z = np.mean(baseline_left_ankle_z)
-                    if abs(left_ankle.z - avg_baseline_z) > 0.15:
-                        foot_lift_frames += 1
-                
-                # Ankle Collapse Logic
-                if left_ankle.visibility > 0.3 and left_foot_index.visibility > 0.3 and left_heel.visibility > 0.3:
-                    ankle_angle = calculate_angle(
-                        (left_heel.x, left_heel.y), 
-                        (left_ankle.x, left_ankle.y), 
-                        (left_foot_index.x, left_foot_index.y)
-                    )
-                    if ankle_angle < 65:
-                        ankle_collapse_frames += 1
-                
-                # Toe Drive Detection (specifically for toe drive exercise)
-                if exercise_type == ExerciseType.TOE_DRIVE:
-                    if len(baseline_left_foot_y) > 0 and left_foot_index.visibility > 0.3:
-                        avg_baseline_y = np.mean(baseline_left_foot_y)
-                        # Detect if toes are pressing down (y position increases)
-                        if left_foot_index.y > avg_baseline_y + 0.015:
-                            toe_drive_frames += 1
-
-                # Repetition Counting
-                if left_hip.visibility > 0.3 and right_hip.visibility > 0.3:
-                    hip_x = (left_hip.x + right_hip.x) / 2
-                    hip_positions.append(hip_x)
-                    if len(hip_positions) > 5:
-                        if hip_positions[-3] > hip_positions[-1] and hip_positions[-3] > hip_positions[-5] and not in_rock_back_phase:
-                            repetitions += 1
-                            in_rock_back_phase = True
-                        elif hip_positions[-3] < hip_positions[-1]:
-                            in_rock_back_phase = False
-            else:
-                all_landmarks.append(None)
-        
-        cap.release()
-        pose.close()
-
-        total_frames = frame_num
-        if total_frames == 0:
-            analysis_results[video_id] = {"error": "Video file appears to be empty."}
-            return
-
-        # --- Generate Feedback ---
-        feedback = []
-        positive_cues = 0
-        total_cues = 0
-        MIN_VALID_FRAMES_FOR_FEEDBACK = 5  # Reduced threshold
-        
-        # Specific visibility feedback
-        if valid_frames < MIN_VALID_FRAMES_FOR_FEEDBACK:
-            problematic_parts = []
-            for part, count in visibility_issues.items():
-                if count > total_processed_frames * 0.5:  # If part was invisible in >50% of frames
-                    problematic_parts.append(part.replace("_", " "))
-            
-            if problematic_parts:
-                if len(problematic_parts) <= 3:
-                    # Specific feedback for a few problematic parts
-                    parts_str = ", ".join(problematic_parts)
-                    feedback.append(f"⚠️ Your {parts_str} {'were' if len(problematic_parts) > 1 else 'was'} not clearly visible. Adjust camera or position.")
-                else:
-                    # General feedback for many problematic parts
-                    feedback.append("⚠️ Multiple body parts weren't visible. Try repositioning the camera for a clearer view.")
-            else:
-                feedback.append("⚠️ Pose detection was limited. Please ensure good lighting and camera positioning.")
-
-        # Foot Stability
-        total_cues += 1
-        if valid_frames < MIN_VALID_FRAMES_FOR_FEEDBACK or not baseline_left_ankle_z:
-            if visibility_issues["left_ankle"] > total_processed_frames * 0.5 or visibility_issues["right_ankle"] > total_processed_frames * 0.5:
-                feedback.append("⚠️ Feet weren't fully visible - try to keep them in frame for better analysis.")
-        elif foot_lift_frames / valid_frames > 0.25:
-            feedback.append("❌ Feet lifted during exercise – try to stay grounded.")
-        else:
-            feedback.append("✅ Good foot stability throughout movement.")
-            positive_cues += 1
-            
-        # Head Position
-        total_cues += 1
-        if visibility_issues["head"] > total_processed_frames * 0.5:
-            feedback.append("⚠️ Your head wasn't consistently visible in the frame.")
-        elif head_drop_frames / valid_frames > 0.3:
-            feedback.append("❌ Head dropped – try to keep your gaze forward.")
-        else:
-            feedback.append("✅ Excellent head and neck alignment maintained.")
-            positive_cues += 1
-        
-        # Ankle Position
-        total_cues += 1
-        if visibility_issues["left_ankle"] > total_processed_frames * 0.5 and visibility_issues["right_ankle"] > total_processed_frames * 0.5:
-            feedback.append("⚠️ Ankles weren't clearly visible - try to ensure they're in frame.")
-        elif ankle_collapse_frames / valid_frames > 0.25:
-            feedback.append("❌ Ankle collapse detected – maintain firm ankle position.")
-        else:
-            feedback.append("✅ Great ankle stability throughout the exercise.")
-            positive_cues += 1
-        
-        # Exercise-specific feedback
-        if exercise_type == ExerciseType.TOE_DRIVE:
-            total_cues += 1
-            if visibility_issues["left_ankle"] > total_processed_frames * 0.5:
-                feedback.append("⚠️ Feet weren't clearly visible to assess toe drive technique.")
-            elif toe_drive_frames / valid_frames < 0.08:
-                feedback.append("❌ More toe drive needed – press toes into the ground during movement.")
-            else:
-                feedback.append("✅ Excellent toe drive technique.")
-                positive_cues += 1
-                
-        # Add randomized positive reinforcement if needed
-        if positive_cues == 0:
-            positive_feedback_options = [
-                "✅ Your effort is commendable - keep practicing!",
-                "✅ Good attempt - consistency will improve your form.",
-                "✅ You're on the right track with this exercise."
-            ]
-            import random
-            feedback.append(random.choice(positive_feedback_options))
-            positive_cues += 1
-            total_cues += 1
-
-        # --- Calculate Summary ---
-        # Ensure form quality is at least 60% to improve user experience
-        raw_form_quality = int((valid_frames / total_processed_frames) * 100) if total_processed_frames > 0 else 0
-        form_quality = max(60, raw_form_quality)  # Minimum form quality of 60%
-        
-        # Ensure positive feedback is at least 25%
-        raw_positive_feedback = int((positive_cues / total_cues) * 100) if total_cues > 0 else 0
-        positive_feedback_percent = max(25, raw_positive_feedback)  # Minimum positive feedback of 25%
-
-        summary = {
-            "total_time": f"{int((total_frames / fps) // 60):02d}:{int((total_frames / fps) % 60):02d}" if fps > 0 else "00:00",
-            "repetitions": max(1, repetitions),  # Ensure at least 1 repetition
-            "form_quality": form_quality,
-            "positive_feedback_percent": positive_feedback_percent
-        }
-
-        analysis_results[video_id] = {
-            "video_id": video_id,
-            "feedback": feedback,
-            "landmarks": all_landmarks,
-            "summary": summary,
-            "fps": fps,
-            "audio_feedback_url": None
-        }
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        analysis_results[video_id] = {"error": f"An error occurred during analysis: {str(e)}"}
-    finally:
-        try:
-            os.remove(video_path)
-        except:
-            pass
-
-@app.post("/api/analyze")
-async def analyze_video(
-    video: UploadFile = File(...),
-    exercise_type: str = Form(default=ExerciseType.QUADRUPED)
-):
-    """
-    Analyze a video recording of an exercise, and provide feedback on the user's form.
-    Returns timestamps with feedback points, and recommendations for improvement.
-    """
-    if exercise_type not in [e.value for e in ExerciseType]:
-        exercise_type = ExerciseType.QUADRUPED  
-    
-    temp_dir = tempfile.mkdtemp()
-    video_path = os.path.join(temp_dir, f"exercise_video_{str(uuid.uuid4())}.mp4")
-    
-    try:
-        with open(video_path, "wb") as buffer:
-            shutil.copyfileobj(video.file, buffer)
-        
-        # Basic analysis with simple sampling for performance
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        duration = frame_count / fps
-        video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        cap.release()
-        
-        print(f"Video metadata: {video_width}x{video_height}, {duration:.2f} seconds, {frame_count} frames, {fps} fps")
-        
-        # Collect pose data from video frames (improved version)
-        frame_data = []
-        landmarks_by_frame = []  # Store landmarks for visualization
-        mp_pose = mp.solutions.pose
-        
-        # Choose appropriate confidence threshold based on video quality
-        confidence_threshold = 0.3  # More permissive to ensure we capture landmarks
-        
-        with mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=1, 
-            min_detection_confidence=confidence_threshold,
-            min_tracking_confidence=confidence_threshold
-        ) as pose:
-            cap = cv2.VideoCapture(video_path)
-            frame_idx = 0
-            
-            # Simple frame skipping for faster processing
-            # Process more frames for better visualization
-            frame_skip = 2  # Process every other frame for smoother visualization
-            
-            # Process video frames
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                # Skip frames to speed up processing
-                if frame_idx % frame_skip != 0:
-                    # Still need to add empty placeholder for skipped frames
-                    # to maintain frame alignment
-                    if frame_idx // frame_skip < len(landmarks_by_frame):
-                        landmarks_by_frame.append([])  # Empty placeholder for skipped frame
-                    
-                    frame_idx += 1
-                    continue
-                
-                # Convert to RGB for MediaPipe
-                image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                results = pose.process(image_rgb)
-                
-                # Create an entry for this frame, even if no landmarks detected
-                frame_landmarks = []
-                
-                if results.pose_landmarks:
-                    # Extract basic landmark data
-                    landmarks = results.pose_landmarks.landmark
-                    time_sec = frame_idx / fps
-                    
-                    # Store frame data
-                    pose_data = {
-                        "frame": frame_idx,
-                        "time": time_sec,
-                        "landmarks": landmarks
-                    }
-                    frame_data.append(pose_data)
-                    
-                    # Store simplified landmarks for visualization
-                    for landmark in landmarks:
-                        frame_landmarks.append({
-                            "x": landmark.x,
-                            "y": landmark.y,
-                            "visibility": landmark.visibility
-                        })
-                else:
-                    # If no landmarks detected in this frame, add an empty array
-                    # This ensures frame indices stay aligned with video frames
-                    print(f"No landmarks detected at frame {frame_idx}")
-                
-                landmarks_by_frame.append(frame_landmarks)
-                frame_idx += 1
-            
-            cap.release()
-        
-        # Ensure we have some pose data before proceeding
-        if len(frame_data) < 5:
-            return JSONResponse({
-                "feedback": ["Not enough pose data detected. Please try recording in better lighting or with a clearer camera angle."],
-                "feedback_points": [],
-                "summary": "Unable to analyze exercise due to insufficient pose data.",
-                "fps": fps
-            })
-        
-        # Interpolate missing landmarks for smoother visualization
-        processed_landmarks = interpolate_missing_landmarks(landmarks_by_frame)
-        
-        # Simplified analysis based on exercise type
-        feedback = []
-        feedback_points = []
-        
-        # Add generic exercise feedback
-        feedback.append("✅ Good effort completing the exercise!")
-        
-        # Calculate basic metrics for the feedback
-        repetitions = max(1, len(frame_data) // 30)  # Simple estimation
-        
-        if exercise_type == ExerciseType.QUADRUPED:
-            feedback.append("Keep your back straight throughout the movement")
-            feedback.append("Ensure your hands stay aligned under your shoulders")
-            
-            feedback_points = [
-                {"timestamp": 2.0, "message": "Keep hands under shoulders"},
-                {"timestamp": 4.0, "message": "Maintain neutral spine position"},
-                {"timestamp": 6.0, "message": "✓ Good knee alignment"}
-            ]
-        else:  # Toe drive
-            feedback.append("Remember to point your toes downward during the movement")
-            feedback.append("Keep your knees directly under your hips")
-            
-            feedback_points = [
-                {"timestamp": 2.0, "message": "Point toes downward more"},
-                {"timestamp": 4.0, "message": "✓ Good hip position"},
-                {"timestamp": 6.0, "message": "Maintain toe position as you rock"}
-            ]
-        
-        # Add positive feedback to ensure there's always at least one positive comment
-        if not any(item.startswith("✅") for item in feedback):
-            feedback.append("✅ Good effort with the exercise!")
-        
-        # Format the time properly
-        minutes = int(duration // 60)
-        seconds = int(duration % 60)
-        formatted_time = f"{minutes}:{seconds:02d}"
-        
-        # Return results in the expected format with landmarks for visualization
-        analysis_results = {
-            "feedback": feedback,
-            "feedback_points": feedback_points,
-            "landmarks": processed_landmarks,  # Processed landmarks for visualization
-            "fps": fps,
-            "video_dimensions": {
-                "width": video_width,
-                "height": video_height
-            },
-            "repetitions": repetitions,
-            "form_quality": 80,
-            "positive_feedback_percent": 70,
-            "total_time": formatted_time,
-            "summary": {
-                "total_time": formatted_time,
-                "repetitions": repetitions,
-                "form_quality": 80,
-                "positive_feedback_percent": 70
-            }
-        }
-        
-        return JSONResponse(analysis_results)
-        
-    except Exception as e:
-        print(f"Error analyzing video: {e}")
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error analyzing video: {str(e)}")
-    finally:
-        shutil.rmtree(temp_dir, ignore_errors=True)
-
-def interpolate_missing_landmarks(landmarks_by_frame):
-    """
-    Fill in missing landmarks by interpolating between available frames.
-    This creates a smoother visualization experience.
-    """
-    if not landmarks_by_frame:
-        return []
-    
-    # Create a deep copy to avoid modifying the original
-    processed = landmarks_by_frame.copy()
-    
-    # Find the first frame with valid landmarks
-    first_valid_idx = -1
-    for i, frame in enumerate(processed):
-        if frame and len(frame) > 0:
-            first_valid_idx = i
-            break
-    
-    if first_valid_idx == -1:
-        return processed  # No valid frames found
-    
-    # Fill in any missing frames at the beginning
-    first_valid_landmarks = processed[first_valid_idx]
-    for i in range(first_valid_idx):
-        processed[i] = first_valid_landmarks
-    
-    # Find gaps (frames with no landmarks) and interpolate
-    last_valid_idx = first_valid_idx
-    last_valid_frame = processed[first_valid_idx]
+            position_details["toe_position"] = left_toe_pointed and right_toe_pointed
+            position_details["feet_position_correct"] = left_toe_pointed and right_toe_pointed
     
-    for i in range(first_valid_idx + 1, len(processed)):
-        if processed[i] and len(processed[i]) > 0:
-            # Found next valid frame - now interpolate any gap
-            if i - last_valid_idx > 1:
-                # We have a gap to fill
-                gap_size = i - last_valid_idx - 1
-                for j in range(1, gap_size + 1):
-                    # Linear interpolation between last_valid_frame and current frame
-                    weight_current = j / (gap_size + 1)
-                    weight_last = 1 - weight_current
-                    
-                    interpolated_frame = []
-                    
-                    # Ensure both frames have landmarks
-                    if last_valid_frame and processed[i] and len(last_valid_frame) > 0 and len(processed[i]) > 0:
-                        for k in range(min(len(last_valid_frame), len(processed[i]))):
-                            last_lm = last_valid_frame[k]
-                            current_lm = processed[i][k]
-                            
-                            interpolated_lm = {
-                                "x": last_lm["x"] * weight_last + current_lm["x"] * weight_current,
-                                "y": last_lm["y"] * weight_last + current_lm["y"] * weight_current,
-                                "visibility": last_lm["visibility"] * weight_last + current_lm["visibility"] * weight_current
-                            }
-                            interpolated_frame.append(interpolated_lm)
-                        
-                        processed[last_valid_idx + j] = interpolated_frame
-            
-            # Update last valid frame and index
-            last_valid_idx = i
-            last_valid_frame = processed[i]
+    # Determine overall position correctness - be more lenient to avoid frustrating users
+    # For quadruped, prioritize hands and knees position
+    if exercise_type == ExerciseType.QUADRUPED:
+        position_correct = (
+            position_details["hands_under_shoulders"] and
+            position_details["knees_under_hips"]
+            # Not requiring back alignment and feet position to be perfect
+        )
+    else:  # Toe drive
+        position_correct = (
+            position_details["knees_under_hips"] and
+            position_details["hands_under_shoulders"]
+            # Not requiring perfect toe position to proceed
+        )
     
-    # Fill in any missing frames at the end
-    if last_valid_idx < len(processed) - 1 and last_valid_frame:
-        for i in range(last_valid_idx + 1, len(processed)):
-            processed[i] = last_valid_frame
+    # Generate appropriate feedback message
+    if position_correct:
+        feedback = "✅ Great starting position! You're ready to begin."
+    else:
+        # Prioritize feedback based on what's most important to fix first
+        if not position_details["hands_under_shoulders"]:
+            feedback = "⚠️ Position your hands directly under your shoulders."
+        elif not position_details["knees_under_hips"]:
+            feedback = "⚠️ Position your knees directly under your hips."
+        elif not position_details["back_alignment"]:
+            feedback = "⚠️ Keep your back flat and parallel to the floor."
+        elif not position_details["feet_position_correct"]:
+            if exercise_type == ExerciseType.TOE_DRIVE:
+                feedback = "⚠️ Point your toes downward for proper toe drive position."
+            else:
+                feedback = "⚠️ Position your feet hip-width apart."
+        else:
+            # If we can't determine a specific issue, give general guidance
+            feedback = "⚠️ Adjust your position to match the guide shown."
     
-    return processed
+    return {
+        "is_position_correct": position_correct,
+        "feedback": feedback,
+        "position_details": position_details
+    }
 
-def calculate_estimated_time(video_duration, optimization_level):
+# Upper bound on frames accepted in one position-check burst
+MAX_POSITION_BURST = 16
+
+def perceptual_hash(image):
     """
-    Calculate an estimated processing time based on video duration and optimization level.
-    Returns estimate in seconds.
+    64-bit difference hash of a BGR image: compares neighbouring pixels of a
+    9x8 grayscale thumbnail, so near-identical frames hash to nearby values.
     """
-    # Base processing factor (processing time relative to video duration)
-    if optimization_level == 1:
-        base_factor = 4.0  # Low optimization: ~4x video duration
-    elif optimization_level == 2:
-        base_factor = 2.5  # Medium optimization: ~2.5x video duration
-    else:
-        base_factor = 1.5  # High optimization: ~1.5x video duration
-    
-    # Add a small constant time for initialization
-    constant_time = 3  # seconds
-    
-    # For very short videos, processing time might be disproportionately higher
-    if video_duration < 10:
-        base_factor *= 1.5
-    
-    # Cap the duration used for estimation
-    capped_duration = min(video_duration, 120)  # Cap at 2 minutes
-    
-    # Calculate estimated time in seconds
-    estimated_time = constant_time + (capped_duration * base_factor)
-    
-    return int(estimated_time)
+    thumbnail = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return sum(1 << i for i, bit in enumerate(bits) if bit)
 
-def process_video_async(video_path, exercise_type, analysis_id, optimization_settings=None):
+class PositionCheckCache:
     """
-    Process video analysis asynchronously.
-    This function is called in a background task.
+    Short-lived per-session cache of position-check results.
+    While the user holds still the client keeps sending near-identical frames;
+    a frame whose perceptual hash is within `max_distance` bits of a cached
+    frame with the same key (exercise type and quality tier) from the same
+    session reuses that result.
     """
-    try:
-        # Update status to processing
-        analysis_results[analysis_id] = {
-            "status": "processing",
-            "progress": 0,
-            "message": "Starting video analysis..."
-        }
-        
-        # Start time for performance measurement
-        start_time = time.time()
+    def __init__(self, ttl_seconds=3.0, max_distance=4, entries_per_session=8, max_sessions=1000):
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.entries_per_session = entries_per_session
+        self.max_sessions = max_sessions
+        self.sessions = {}  # session -> deque of (expires_at, hash, key, result)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, session, frame_hash, key):
+        now = time.time()
+        with self.lock:
+            entries = self.sessions.get(session)
+            if entries:
+                while entries and entries[0][0] < now:
+                    entries.popleft()
+                for _, cached_hash, cached_key, result in reversed(entries):
+                    if cached_key == key and bin(cached_hash ^ frame_hash).count("1") <= self.max_distance:
+                        self.hits += 1
+                        return result
+            self.misses += 1
+            return None
+
+    def store(self, session, frame_hash, key, result):
+        with self.lock:
+            if session not in self.sessions and len(self.sessions) >= self.max_sessions:
+                self._evict_expired()
+                if len(self.sessions) >= self.max_sessions:
+                    # Drop the session that has gone longest without a new entry
+                    oldest = min(self.sessions, key=lambda s: self.sessions[s][-1][0] if self.sessions[s] else 0)
+                    del self.sessions[oldest]
+            entries = self.sessions.setdefault(session, deque(maxlen=self.entries_per_session))
+            entries.append((time.time() + self.ttl_seconds, frame_hash, key, result))
+
+    def _evict_expired(self):
+        now = time.time()
+        for session in [s for s, entries in self.sessions.items() if not entries or entries[-1][0] < now]:
+            del self.sessions[session]
+
+    def report(self):
+        with self.lock:
+            self._evict_expired()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0,
+                "sessions": len(self.sessions),
+                "ttl_seconds": self.ttl_seconds,
+                "max_distance": self.max_distance
+            }
+
+position_cache = PositionCheckCache()
+
+def read_position_frames(data_list):
+    """
+    Decode uploaded JPEG/PNG bytes into BGR frames, skipping unreadable ones.
+    """
+    frames = []
+    for data in data_list:
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            frames.append(frame)
+    return frames
+
+def unpack_position_frames(data):
+    """
+    Split a packed burst into individual encoded images.
+    Format: repeated [4-byte big-endian length][encoded image bytes].
+    """
+    images = []
+    offset = 0
+    while offset + 4 <= len(data):
+        length = int.from_bytes(data[offset:offset + 4], "big")
+        offset += 4
+        if length <= 0 or offset + length > len(data):
+            raise HTTPException(status_code=400, detail="Malformed packed frame data")
+        images.append(data[offset:offset + length])
+        offset += length
+    return images
+
+def stabilize_position_results(results):
+    """
+    Combine per-frame position checks into one verdict.
+    Checks are decided by majority vote over the frames where a pose was
+    found, visibility by median, so a single noisy frame can't flip the result.
+    """
+    detected = [r for r in results if r["position_details"]["visibility"]["shoulders"] > 0]
+    voters = detected or results
+    
+    majority = lambda values: sum(1 for v in values if v) * 2 > len(values)
+    is_position_correct = majority([r["is_position_correct"] for r in voters])
+    
+    details = dict(voters[len(voters) // 2]["position_details"])
+    for key in ("hands_under_shoulders", "knees_under_hips", "back_alignment", "feet_position_correct", "toe_position"):
+        details[key] = majority([r["position_details"][key] for r in voters])
+    details["visibility"] = {
+        part: float(np.median([r["position_details"]["visibility"][part] for r in voters]))
+        for part in voters[0]["position_details"]["visibility"]
+    }
+    lighting = [r["position_details"]["lighting_quality"] for r in results]
+    details["lighting_quality"] = max(set(lighting), key=lighting.count)
+    details.pop("frame_quality", None)
+    
+    # Most common feedback among the frames that agree with the verdict
+    feedback = [r["feedback"] for r in voters if r["is_position_correct"] == is_position_correct]
+    return {
+        "is_position_correct": is_position_correct,
+        "feedback": max(set(feedback), key=feedback.count),
+        "position_details": details
+    }
+
+@app.post("/api/check-position")
+async def check_position(
+    image: Optional[UploadFile] = File(default=None),
+    images: Optional[List[UploadFile]] = File(default=None),
+    packed_frames: Optional[UploadFile] = File(default=None),
+    exercise_type: str = Form(default=ExerciseType.QUADRUPED),
+    session_id: Optional[str] = Form(default=None),
+    quality_tier: Optional[str] = Form(default=None),
+    max_latency_ms: Optional[float] = Form(default=None)
+):
+    """
+    Analyze the starting position from a single frame or a short burst of frames.
+    A burst is sent either as several `images` parts or as one `packed_frames`
+    part (see unpack_position_frames). Burst frames run through one tracking
+    Pose and return a stabilized verdict plus per-frame results and timings.
+    Single frames from a session are answered from position_cache when a
+    near-identical frame was checked moments ago, and otherwise batched with
+    other requests' frames by inference_scheduler (waiting at most
+    `max_latency_ms` for a batch; backends that can't batch never wait). Unless a `quality_tier` is requested, the
+    fastest tier the current load allows is used.
+    """
+    if exercise_type not in [e.value for e in ExerciseType]:
+        exercise_type = ExerciseType.QUADRUPED
+    
+    try:
+        encoded = []
+        if image is not None:
+            encoded.append(await image.read())
+        for upload in images or []:
+            encoded.append(await upload.read())
+        if packed_frames is not None:
+            encoded.extend(unpack_position_frames(await packed_frames.read()))
+        
+        if not encoded:
+            raise HTTPException(status_code=400, detail="No image provided")
+        if len(encoded) > MAX_POSITION_BURST:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_POSITION_BURST} frames per request")
+        
+        frames = read_position_frames(encoded)
+        if not frames:
+            raise HTTPException(status_code=400, detail="Unable to read image file")
+        
+        tier = select_quality_tier("position_check", quality_tier)
+        frames = [fit_short_side(frame, tier["short_side"]) for frame in frames]
+        
+        pose_options = {
+            "model_complexity": tier["model_complexity"],
+            "smooth_landmarks": tier["smooth_landmarks"],
+            "min_detection_confidence": 0.5
+        }
+        
+        if len(frames) == 1:
+            frame_hash = perceptual_hash(frames[0]) if session_id else None
+            cache_key = (exercise_type, tier["name"])
+            if session_id:
+                cached = position_cache.lookup(session_id, frame_hash, cache_key)
+                if cached is not None:
+                    return JSONResponse(dict(cached, cached=True, quality_tier=tier["name"]))
+            
+            # Inference runs off the event loop so concurrent requests can share a batch
+            scheduled_pose = inference_scheduler.client(max_latency_ms, static_image_mode=True, **pose_options)
+            result = await run_in_threadpool(evaluate_position, frames[0], exercise_type, lambda: scheduled_pose)
+            if session_id:
+                position_cache.store(session_id, frame_hash, cache_key, result)
+            return JSONResponse(dict(result, cached=False, quality_tier=tier["name"]))
+        
+        def run_burst():
+            # One Pose for the whole burst, created only if a frame passes the quality gate.
+            # Bursts are consecutive frames, so MediaPipe can track between them
+            poses = []
+            def get_pose():
+                if not poses:
+                    poses.append(create_pose_backend(static_image_mode=False, **pose_options))
+                return poses[0]
+            
+            results = []
+            frame_reports = []
+            try:
+                for frame in frames:
+                    frame_started = time.perf_counter()
+                    result = evaluate_position(frame, exercise_type, get_pose)
+                    results.append(result)
+                    frame_reports.append({
+                        "is_position_correct": result["is_position_correct"],
+                        "feedback": result["feedback"],
+                        "processing_ms": round((time.perf_counter() - frame_started) * 1000, 2)
+                    })
+            finally:
+                for pose in poses:
+                    pose.close()
+            return results, frame_reports
+        
+        started = time.perf_counter()
+        results, frame_reports = await run_in_threadpool(run_burst)
+        
+        response = stabilize_position_results(results)
+        response["quality_tier"] = tier["name"]
+        response["frames"] = frame_reports
+        response["timings"] = {
+            "frames": len(frames),
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            "mean_frame_ms": round(sum(r["processing_ms"] for r in frame_reports) / len(frame_reports), 2)
+        }
+        return JSONResponse(response)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error checking position: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error checking position: {str(e)}")
+
+def assess_frame_quality(image, thumbnail_width=160):
+    """
+    Fast pre-flight quality check, run on a downscaled grayscale thumbnail
+    before paying for pose inference.
+    Returns brightness, contrast, sharpness and edge density, the lighting
+    quality ("good", "medium" or "poor"), whether the frame is usable at all,
+    and actionable feedback for each problem found.
+    """
+    h, w = image.shape[:2]
+    if w > thumbnail_width:
+        thumb_h = max(1, int(h * thumbnail_width / w))
+        image = cv2.resize(image, (thumbnail_width, thumb_h), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    
+    # Brightness (mean pixel value) and contrast (standard deviation)
+    brightness = float(np.mean(gray))
+    contrast = float(np.std(gray))
+    # Sharpness: variance of the Laplacian drops sharply for blurred images
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    # Quick presence check: a person against a background produces edges,
+    # a covered lens or a camera facing a blank wall/floor does not
+    edge_density = float(np.count_nonzero(cv2.Canny(gray, 50, 150))) / gray.size
+    
+    # Thresholds for lighting quality
+    if brightness < 50:  # Very dark
+        lighting_quality = "poor"
+    elif brightness < 100 or contrast < 30:  # Moderately dark or low contrast
+        lighting_quality = "medium"
+    else:
+        lighting_quality = "good"
+    
+    # Only problems that make pose detection hopeless reject the frame
+    issues = []
+    if brightness < 40:
+        issues.append("⚠️ Lighting is too dark. Move to a brighter area or turn on more lights.")
+    elif brightness > 230:
+        issues.append("⚠️ Image is overexposed. Avoid pointing the camera toward a window or bright light.")
+    elif contrast < 12:
+        issues.append("⚠️ Image is washed out. Reduce glare or backlighting behind you.")
+    if sharpness < 15:
+        issues.append("⚠️ Image is blurry. Hold the camera steady and clean the lens.")
+    if edge_density < 0.005 and not issues:
+        issues.append("⚠️ Nobody seems to be in frame. Point the camera so your full body is visible.")
+    
+    return {
+        "usable": not issues,
+        "issues": issues,
+        "lighting_quality": lighting_quality,
+        "brightness": round(brightness, 1),
+        "contrast": round(contrast, 1),
+        "sharpness": round(sharpness, 1),
+        "edge_density": round(edge_density, 4)
+    }
+
+def preflight_video_quality(video_path, samples=8, reject_fraction=0.75):
+    """
+    Check a handful of evenly spaced frames before analyzing a video.
+    The video is rejected when at least `reject_fraction` of the samples are
+    unusable, with the most common problem as feedback.
+    """
+    started = time.time()
+    cap = open_video_reader(video_path, 180)
+    try:
+        if not cap.isOpened():
+            return None
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames <= 0:
+            return None
+        
+        checks = []
+        for k in range(samples):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int((k + 0.5) * total_frames / samples))
+            ret, frame = cap.read()
+            if ret:
+                checks.append(assess_frame_quality(frame))
+    finally:
+        cap.release()
+    
+    if not checks:
+        return None
+    
+    unusable = [check for check in checks if not check["usable"]]
+    issue_counts = {}
+    for check in unusable:
+        for issue in check["issues"]:
+            issue_counts[issue] = issue_counts.get(issue, 0) + 1
+    
+    return {
+        "usable": len(unusable) < reject_fraction * len(checks),
+        "issues": sorted(issue_counts, key=issue_counts.get, reverse=True),
+        "samples": len(checks),
+        "unusable_samples": len(unusable),
+        "median_brightness": float(np.median([check["brightness"] for check in checks])),
+        "median_sharpness": float(np.median([check["sharpness"] for check in checks])),
+        "elapsed_seconds": round(time.time() - started, 3)
+    }
+
+def process_video_async(video_path, exercise_type, video_id):
+    """
+    Process video asynchronously and store results
+    """
+    try:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            analysis_results[video_id] = {"error": "Unable to open video file"}
+            return
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0:
+            fps = 30  # Fallback to 30fps if detection fails
+        
+        pose = create_pose_backend(min_detection_confidence=0.2, min_tracking_confidence=0.2)  # Even lower thresholds
+
+        all_landmarks = []
+        foot_lift_frames = 0
+        head_drop_frames = 0
+        ankle_collapse_frames = 0
+        toe_drive_frames = 0
+        repetitions = 0
+        hip_positions = []
+        in_rock_back_phase = False
+        
+        valid_frames = 0
+        total_processed_frames = 0
+        
+        baseline_left_ankle_z = []
+        baseline_right_ankle_z = []
+        baseline_left_foot_y = []
+        baseline_right_foot_y = []
+        
+        # Track visibility of key body parts for specific feedback
+        visibility_issues = {
+            "left_shoulder": 0,
+            "right_shoulder": 0,
+            "left_wrist": 0,
+            "right_wrist": 0,
+            "left_hip": 0,
+            "right_hip": 0,
+            "left_knee": 0,
+            "right_knee": 0,
+            "left_ankle": 0,
+            "right_ankle": 0,
+            "head": 0
+        }
+        
+        frame_num = 0
+        max_frames = 300  # Limit processing to 10 seconds of 30fps video
+        frame_sample_rate = 10  # Process every 10th frame for even faster analysis
+        
+        while frame_num < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+                
+            frame_num += 1
+            
+            # Sample frames for efficiency
+            if frame_num % frame_sample_rate != 0:
+                # Still add a placeholder to maintain correct frame indexing
+                all_landmarks.append(None)
+                continue
+
+            total_processed_frames += 1
+            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            landmarks = pose.infer(image_rgb, frame_num - 1)
+            
+            if landmarks:
+                valid_frames += 1
+                all_landmarks.append(landmarks)
+
+                # Key landmarks
+                left_shoulder = landmarks[PoseLandmark.LEFT_SHOULDER.value]
+                right_shoulder = landmarks[PoseLandmark.RIGHT_SHOULDER.value]
+                left_ear = landmarks[PoseLandmark.LEFT_EAR.value]
+                right_ear = landmarks[PoseLandmark.RIGHT_EAR.value]
+                nose = landmarks[PoseLandmark.NOSE.value]
+                left_ankle = landmarks[PoseLandmark.LEFT_ANKLE.value]
+                right_ankle = landmarks[PoseLandmark.RIGHT_ANKLE.value]
+                left_foot_index = landmarks[PoseLandmark.LEFT_FOOT_INDEX.value]
+                right_foot_index = landmarks[PoseLandmark.RIGHT_FOOT_INDEX.value]
+                left_heel = landmarks[PoseLandmark.LEFT_HEEL.value]
+                right_heel = landmarks[PoseLandmark.RIGHT_HEEL.value]
+                left_hip = landmarks[PoseLandmark.LEFT_HIP.value]
+                right_hip = landmarks[PoseLandmark.RIGHT_HIP.value]
+                left_knee = landmarks[PoseLandmark.LEFT_KNEE.value]
+                right_knee = landmarks[PoseLandmark.RIGHT_KNEE.value]
+
+                # Track visibility issues for specific feedback
+                key_parts = {
+                    "left_shoulder": left_shoulder,
+                    "right_shoulder": right_shoulder,
+                    "left_wrist": landmarks[PoseLandmark.LEFT_WRIST.value],
+                    "right_wrist": landmarks[PoseLandmark.RIGHT_WRIST.value],
+                    "left_hip": left_hip,
+                    "right_hip": right_hip,
+                    "left_knee": left_knee,
+                    "right_knee": right_knee,
+                    "left_ankle": left_ankle,
+                    "right_ankle": right_ankle,
+                    "head": nose
+                }
+                
+                for part_name, landmark in key_parts.items():
+                    if landmark["visibility"] < 0.3:
+                        visibility_issues[part_name] += 1
+
+                # Head Drop Logic
+                if left_shoulder["visibility"] > 0.3 and (left_ear["visibility"] > 0.3 or right_ear["visibility"] > 0.3) and nose["visibility"] > 0.3:
+                    # Use whichever ear is more visible
+                    ear = left_ear if left_ear["visibility"] > right_ear["visibility"] else right_ear
+                    neck_angle = calculate_angle((left_shoulder["x"], left_shoulder["y"]), (ear["x"], ear["y"]), (nose["x"], nose["y"]))
+                    if neck_angle < 140:  # More lenient
+                        head_drop_frames += 1
+                
+                # Foot Lift Logic
+                if len(baseline_left_ankle_z) < 3 and left_ankle["visibility"] > 0.3:
+                     baseline_left_ankle_z.append(left_ankle["z"])
+                     baseline_left_foot_y.append(left_foot_index["y"])
+                elif left_ankle["visibility"] > 0.3:
+                    avg_baseline_z = np.mean(baseline_left_ankle_z)
+                    if abs(left_ankle["z"] - avg_baseline_z) > 0.15:
+                        foot_lift_frames += 1
+                
+                # Ankle Collapse Logic
+                if left_ankle["visibility"] > 0.3 and left_foot_index["visibility"] > 0.3 and left_heel["visibility"] > 0.3:
+                    ankle_angle = calculate_angle(
+                        (left_heel["x"], left_heel["y"]), 
+                        (left_ankle["x"], left_ankle["y"]), 
+                        (left_foot_index["x"], left_foot_index["y"])
+                    )
+                    if ankle_angle < 65:
+                        ankle_collapse_frames += 1
+                
+                # Toe Drive Detection (specifically for toe drive exercise)
+                if exercise_type == ExerciseType.TOE_DRIVE:
+                    if len(baseline_left_foot_y) > 0 and left_foot_index["visibility"] > 0.3:
+                        avg_baseline_y = np.mean(baseline_left_foot_y)
+                        # Detect if toes are pressing down (y position increases)
+                        if left_foot_index["y"] > avg_baseline_y + 0.015:
+                            toe_drive_frames += 1
+
+                # Repetition Counting
+                if left_hip["visibility"] > 0.3 and right_hip["visibility"] > 0.3:
+                    hip_x = (left_hip["x"] + right_hip["x"]) / 2
+                    hip_positions.append(hip_x)
+                    if len(hip_positions) > 5:
+                        if hip_positions[-3] > hip_positions[-1] and hip_positions[-3] > hip_positions[-5] and not in_rock_back_phase:
+                            repetitions += 1
+                            in_rock_back_phase = True
+                        elif hip_positions[-3] < hip_positions[-1]:
+                            in_rock_back_phase = False
+            else:
+                all_landmarks.append(None)
+        
+        cap.release()
+        pose.close()
+
+        total_frames = frame_num
+        if total_frames == 0:
+            analysis_results[video_id] = {"error": "Video file appears to be empty."}
+            return
+
+        # --- Generate Feedback ---
+        feedback = []
+        positive_cues = 0
+        total_cues = 0
+        MIN_VALID_FRAMES_FOR_FEEDBACK = 5  # Reduced threshold
+        
+        # Specific visibility feedback
+        if valid_frames < MIN_VALID_FRAMES_FOR_FEEDBACK:
+            problematic_parts = []
+            for part, count in visibility_issues.items():
+                if count > total_processed_frames * 0.5:  # If part was invisible in >50% of frames
+                    problematic_parts.append(part.replace("_", " "))
+            
+            if problematic_parts:
+                if len(problematic_parts) <= 3:
+                    # Specific feedback for a few problematic parts
+                    parts_str = ", ".join(problematic_parts)
+                    feedback.append(f"⚠️ Your {parts_str} {'were' if len(problematic_parts) > 1 else 'was'} not clearly visible. Adjust camera or position.")
+                else:
+                    # General feedback for many problematic parts
+                    feedback.append("⚠️ Multiple body parts weren't visible. Try repositioning the camera for a clearer view.")
+            else:
+                feedback.append("⚠️ Pose detection was limited. Please ensure good lighting and camera positioning.")
+
+        # Foot Stability
+        total_cues += 1
+        if valid_frames < MIN_VALID_FRAMES_FOR_FEEDBACK or not baseline_left_ankle_z:
+            if visibility_issues["left_ankle"] > total_processed_frames * 0.5 or visibility_issues["right_ankle"] > total_processed_frames * 0.5:
+                feedback.append("⚠️ Feet weren't fully visible - try to keep them in frame for better analysis.")
+        elif foot_lift_frames / valid_frames > 0.25:
+            feedback.append("❌ Feet lifted during exercise – try to stay grounded.")
+        else:
+            feedback.append("✅ Good foot stability throughout movement.")
+            positive_cues += 1
+            
+        # Head Position
+        total_cues += 1
+        if visibility_issues["head"] > total_processed_frames * 0.5:
+            feedback.append("⚠️ Your head wasn't consistently visible in the frame.")
+        elif head_drop_frames / valid_frames > 0.3:
+            feedback.append("❌ Head dropped – try to keep your gaze forward.")
+        else:
+            feedback.append("✅ Excellent head and neck alignment maintained.")
+            positive_cues += 1
+        
+        # Ankle Position
+        total_cues += 1
+        if visibility_issues["left_ankle"] > total_processed_frames * 0.5 and visibility_issues["right_ankle"] > total_processed_frames * 0.5:
+            feedback.append("⚠️ Ankles weren't clearly visible - try to ensure they're in frame.")
+        elif ankle_collapse_frames / valid_frames > 0.25:
+            feedback.append("❌ Ankle collapse detected – maintain firm ankle position.")
+        else:
+            feedback.append("✅ Great ankle stability throughout the exercise.")
+            positive_cues += 1
+        
+        # Exercise-specific feedback
+        if exercise_type == ExerciseType.TOE_DRIVE:
+            total_cues += 1
+            if visibility_issues["left_ankle"] > total_processed_frames * 0.5:
+                feedback.append("⚠️ Feet weren't clearly visible to assess toe drive technique.")
+            elif toe_drive_frames / valid_frames < 0.08:
+                feedback.append("❌ More toe drive needed – press toes into the ground during movement.")
+            else:
+                feedback.append("✅ Excellent toe drive technique.")
+                positive_cues += 1
+                
+        # Add randomized positive reinforcement if needed
+        if positive_cues == 0:
+            positive_feedback_options = [
+                "✅ Your effort is commendable - keep practicing!",
+                "✅ Good attempt - consistency will improve your form.",
+                "✅ You're on the right track with this exercise."
+            ]
+            import random
+            feedback.append(random.choice(positive_feedback_options))
+            positive_cues += 1
+            total_cues += 1
+
+        # --- Calculate Summary ---
+        # Ensure form quality is at least 60% to improve user experience
+        raw_form_quality = int((valid_frames / total_processed_frames) * 100) if total_processed_frames > 0 else 0
+        form_quality = max(60, raw_form_quality)  # Minimum form quality of 60%
+        
+        # Ensure positive feedback is at least 25%
+        raw_positive_feedback = int((positive_cues / total_cues) * 100) if total_cues > 0 else 0
+        positive_feedback_percent = max(25, raw_positive_feedback)  # Minimum positive feedback of 25%
+
+        summary = {
+            "total_time": f"{int((total_frames / fps) // 60):02d}:{int((total_frames / fps) % 60):02d}" if fps > 0 else "00:00",
+            "repetitions": max(1, repetitions),  # Ensure at least 1 repetition
+            "form_quality": form_quality,
+            "positive_feedback_percent": positive_feedback_percent
+        }
+
+        analysis_results[video_id] = {
+            "video_id": video_id,
+            "feedback": feedback,
+            "landmarks": all_landmarks,
+            "summary": summary,
+            "fps": fps,
+            "audio_feedback_url": None
+        }
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        analysis_results[video_id] = {"error": f"An error occurred during analysis: {str(e)}"}
+    finally:
+        try:
+            os.remove(video_path)
+        except:
+            pass
+
+@app.post("/api/analyze")
+async def analyze_video(
+    video: UploadFile = File(...),
+    exercise_type: str = Form(default=ExerciseType.QUADRUPED),
+    quality_tier: Optional[str] = Form(default=None),
+    skip_duplicates: bool = Form(default=True)
+):
+    """
+    Analyze a video recording of an exercise, and provide feedback on the user's form.
+    Returns timestamps with feedback points, and recommendations for improvement.
+    Runs at the balanced quality tier unless load or `quality_tier` says otherwise.
+    `skip_duplicates=false` runs inference on every sampled frame.
+    """
+    if exercise_type not in [e.value for e in ExerciseType]:
+        exercise_type = ExerciseType.QUADRUPED  
+    
+    temp_dir = tempfile.mkdtemp()
+    video_path = os.path.join(temp_dir, f"exercise_video_{str(uuid.uuid4())}.mp4")
+    
+    try:
+        with open(video_path, "wb") as buffer:
+            shutil.copyfileobj(video.file, buffer)
+        
+        # Basic analysis with simple sampling for performance
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        duration = frame_count / fps
+        video_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        video_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        cap.release()
+        
+        print(f"Video metadata: {video_width}x{video_height}, {duration:.2f} seconds, {frame_count} frames, {fps} fps")
+        
+        # Reject dark, blurry or empty recordings before running pose inference on them
+        preflight = preflight_video_quality(video_path)
+        if preflight is not None and not preflight["usable"]:
+            return JSONResponse({
+                "feedback": preflight["issues"],
+                "feedback_points": [],
+                "summary": "Unable to analyze exercise due to poor video quality.",
+                "fps": fps,
+                "processing_metadata": {"preflight": preflight}
+            })
+        
+        # Collect pose data from video frames (improved version)
+        frame_data = []
+        landmarks_by_frame = []  # Store landmarks for visualization
+        
+        # Choose appropriate confidence threshold based on video quality
+        confidence_threshold = 0.3  # More permissive to ensure we capture landmarks
+        tier = select_quality_tier("interactive", quality_tier, counted_self=True)
+        
+        with create_pose_backend(
+            static_image_mode=False,
+            model_complexity=tier["model_complexity"],
+            smooth_landmarks=tier["smooth_landmarks"],
+            min_detection_confidence=confidence_threshold,
+            min_tracking_confidence=confidence_threshold
+        ) as pose:
+            cap = open_video_reader(video_path, tier["short_side"])
+            frame_idx = 0
+            buffers = FrameBuffers()
+            memory = MemoryMonitor()
+            roi_tracker = RoiTracker(buffers=buffers)
+            
+            # Simple frame skipping for faster processing
+            frame_skip = tier["frame_skip"]
+            duplicates = create_duplicate_filter({"skip_duplicates": skip_duplicates, "frame_skip": frame_skip})
+            
+            # Sample sparsely (up to one frame per second) while nobody is in frame
+            absence = AbsenceBackoff(base_gap=frame_skip, max_gap=int(fps) if fps > 0 else 30)
+            missed_frames = 0
+            
+            # Process video frames
+            while cap.isOpened():
+                # Skip frames to speed up processing
+                if frame_idx % frame_skip != 0:
+                    if not cap.grab():
+                        break
+                    # Still need to add empty placeholder for skipped frames
+                    # to maintain frame alignment
+                    if frame_idx // frame_skip < len(landmarks_by_frame):
+                        landmarks_by_frame.append([])  # Empty placeholder for skipped frame
+                    
+                    frame_idx += 1
+                    continue
+                
+                # Backed off while nobody is in frame; keep an empty entry so
+                # frame indices stay aligned
+                if not absence.allow(frame_idx):
+                    if not cap.grab():
+                        break
+                    landmarks_by_frame.append([])
+                    frame_idx += 1
+                    continue
+                
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                
+                # Run pose detection, cropped to the tracked person when possible
+                # and skipped for frames that repeat the previous one
+                landmarks = infer_pose(pose, frame, roi_tracker, duplicates=duplicates, frame_index=frame_idx)
+                absence.observe(frame_idx, bool(landmarks))
+                memory.sample()
+                
+                # Create an entry for this frame, even if no landmarks detected
+                frame_landmarks = []
+                
+                if landmarks:
+                    # Extract basic landmark data
+                    time_sec = frame_idx / fps
+                    
+                    # Store frame data
+                    pose_data = {
+                        "frame": frame_idx,
+                        "time": time_sec,
+                        "landmarks": landmarks
+                    }
+                    frame_data.append(pose_data)
+                    
+                    # Store simplified landmarks for visualization
+                    for landmark in landmarks:
+                        frame_landmarks.append({
+                            "x": landmark["x"],
+                            "y": landmark["y"],
+                            "visibility": landmark["visibility"]
+                        })
+                else:
+                    # If no landmarks detected in this frame, add an empty array
+                    # This ensures frame indices stay aligned with video frames
+                    missed_frames += 1
+                
+                landmarks_by_frame.append(frame_landmarks)
+                frame_idx += 1
+            
+            cap.release()
+            
+            if missed_frames or absence.skipped_frames:
+                print(f"No landmarks detected in {missed_frames} sampled frames; "
+                      f"skipped {absence.skipped_frames} frames while nobody was in frame")
+        
+        # Ensure we have some pose data before proceeding
+        if len(frame_data) < 5:
+            return JSONResponse({
+                "feedback": ["Not enough pose data detected. Please try recording in better lighting or with a clearer camera angle."],
+                "feedback_points": [],
+                "summary": "Unable to analyze exercise due to insufficient pose data.",
+                "fps": fps,
+                "quality_tier": tier["name"]
+            })
+        
+        # Interpolate missing landmarks for smoother visualization
+        processed_landmarks = interpolate_missing_landmarks(landmarks_by_frame)
+        
+        # Simplified analysis based on exercise type
+        feedback = []
+        feedback_points = []
+        
+        # Add generic exercise feedback
+        feedback.append("✅ Good effort completing the exercise!")
+        
+        # Calculate basic metrics for the feedback
+        repetitions = max(1, len(frame_data) // 30)  # Simple estimation
+        
+        if exercise_type == ExerciseType.QUADRUPED:
+            feedback.append("Keep your back straight throughout the movement")
+            feedback.append("Ensure your hands stay aligned under your shoulders")
+            
+            feedback_points = [
+                {"timestamp": 2.0, "message": "Keep hands under shoulders"},
+                {"timestamp": 4.0, "message": "Maintain neutral spine position"},
+                {"timestamp": 6.0, "message": "✓ Good knee alignment"}
+            ]
+        else:  # Toe drive
+            feedback.append("Remember to point your toes downward during the movement")
+            feedback.append("Keep your knees directly under your hips")
+            
+            feedback_points = [
+                {"timestamp": 2.0, "message": "Point toes downward more"},
+                {"timestamp": 4.0, "message": "✓ Good hip position"},
+                {"timestamp": 6.0, "message": "Maintain toe position as you rock"}
+            ]
+        
+        # Add positive feedback to ensure there's always at least one positive comment
+        if not any(item.startswith("✅") for item in feedback):
+            feedback.append("✅ Good effort with the exercise!")
+        
+        # Format the time properly
+        minutes = int(duration // 60)
+        seconds = int(duration % 60)
+        formatted_time = f"{minutes}:{seconds:02d}"
+        
+        # Return results in the expected format with landmarks for visualization
+        analysis_results = {
+            "feedback": feedback,
+            "feedback_points": feedback_points,
+            "landmarks": processed_landmarks,  # Processed landmarks for visualization
+            "fps": fps,
+            "video_dimensions": {
+                "width": video_width,
+                "height": video_height
+            },
+            "repetitions": repetitions,
+            "form_quality": 80,
+            "positive_feedback_percent": 70,
+            "total_time": formatted_time,
+            "summary": {
+                "total_time": formatted_time,
+                "repetitions": repetitions,
+                "form_quality": 80,
+                "positive_feedback_percent": 70
+            },
+            "quality_tier": tier["name"],
+            "processing_metadata": {
+                "memory": memory.report([buffers.report()]),
+                "duplicate_frames": duplicates.report() if duplicates is not None else None,
+                "absence_backoff": absence.report()
+            }
+        }
+        
+        return JSONResponse(analysis_results)
+        
+    except Exception as e:
+        print(f"Error analyzing video: {e}")
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Error analyzing video: {str(e)}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def interpolate_missing_landmarks(landmarks_by_frame):
+    """
+    Fill in missing landmarks by interpolating between available frames.
+    This creates a smoother visualization experience.
+    """
+    if not landmarks_by_frame:
+        return []
+    
+    # Create a deep copy to avoid modifying the original
+    processed = landmarks_by_frame.copy()
+    
+    # Find the first frame with valid landmarks
+    first_valid_idx = -1
+    for i, frame in enumerate(processed):
+        if frame and len(frame) > 0:
+            first_valid_idx = i
+            break
+    
+    if first_valid_idx == -1:
+        return processed  # No valid frames found
+    
+    # Fill in any missing frames at the beginning
+    first_valid_landmarks = processed[first_valid_idx]
+    for i in range(first_valid_idx):
+        processed[i] = first_valid_landmarks
+    
+    # Find gaps (frames with no landmarks) and interpolate
+    last_valid_idx = first_valid_idx
+    last_valid_frame = processed[first_valid_idx]
+    
+    for i in range(first_valid_idx + 1, len(processed)):
+        if processed[i] and len(processed[i]) > 0:
+            # Found next valid frame - now interpolate any gap
+            if i - last_valid_idx > 1:
+                # We have a gap to fill
+                gap_size = i - last_valid_idx - 1
+                for j in range(1, gap_size + 1):
+                    # Linear interpolation between last_valid_frame and current frame
+                    weight_current = j / (gap_size + 1)
+                    weight_last = 1 - weight_current
+                    
+                    interpolated_frame = []
+                    
+                    # Ensure both frames have landmarks
+                    if last_valid_frame and processed[i] and len(last_valid_frame) > 0 and len(processed[i]) > 0:
+                        for k in range(min(len(last_valid_frame), len(processed[i]))):
+                            last_lm = last_valid_frame[k]
+                            current_lm = processed[i][k]
+                            
+                            interpolated_lm = {
+                                "x": last_lm["x"] * weight_last + current_lm["x"] * weight_current,
+                                "y": last_lm["y"] * weight_last + current_lm["y"] * weight_current,
+                                "visibility": last_lm["visibility"] * weight_last + current_lm["visibility"] * weight_current
+                            }
+                            interpolated_frame.append(interpolated_lm)
+                        
+                        processed[last_valid_idx + j] = interpolated_frame
+            
+            # Update last valid frame and index
+            last_valid_idx = i
+            last_valid_frame = processed[i]
+    
+    # Fill in any missing frames at the end
+    if last_valid_idx < len(processed) - 1 and last_valid_frame:
+        for i in range(last_valid_idx + 1, len(processed)):
+            processed[i] = last_valid_frame
+    
+    return processed
+
+def calculate_estimated_time(video_duration, optimization_level):
+    """
+    Calculate an estimated processing time based on video duration and optimization level.
+    Returns estimate in seconds.
+    """
+    # Base processing factor (processing time relative to video duration)
+    if optimization_level == 1:
+        base_factor = 4.0  # Low optimization: ~4x video duration
+    elif optimization_level == 2:
+        base_factor = 2.5  # Medium optimization: ~2.5x video duration
+    else:
+        base_factor = 1.5  # High optimization: ~1.5x video duration
+    
+    # Add a small constant time for initialization
+    constant_time = 3  # seconds
+    
+    # For very short videos, processing time might be disproportionately higher
+    if video_duration < 10:
+        base_factor *= 1.5
+    
+    # Cap the duration used for estimation
+    capped_duration = min(video_duration, 120)  # Cap at 2 minutes
+    
+    # Calculate estimated time in seconds
+    estimated_time = constant_time + (capped_duration * base_factor)
+
+    return int(estimated_time)
+
+class ProcessingTimeEstimator:
+    """
+    Processing-time model that calibrates itself from completed jobs.
+    Keeps an exponentially weighted average of throughput (video frames processed
+    per second) for each optimization level, resolution bucket and model complexity,
+    normalized for how many jobs were sharing the CPU at the time. Falls back to
+    calculate_estimated_time until a configuration has been measured.
+    """
+    RESOLUTION_BUCKETS = [360, 480, 720, 1080, 1440, 2160]
+
+    def __init__(self, smoothing=0.3, overhead_seconds=1.0, error_window=50):
+        self.smoothing = smoothing
+        self.overhead_seconds = overhead_seconds
+        self.cpu_count = os.cpu_count() or 1
+        self.throughput = {}  # key -> {"fps": float, "samples": int}
+        self.errors = deque(maxlen=error_window)  # (estimated, actual) of recent jobs
+        self.lock = threading.Lock()
+
+    def _key(self, optimization_level, short_side, model_complexity):
+        bucket = next((b for b in self.RESOLUTION_BUCKETS if short_side <= b), self.RESOLUTION_BUCKETS[-1])
+        return (optimization_level, bucket, model_complexity)
+
+    def _load_factor(self, concurrent_jobs):
+        return max(1.0, concurrent_jobs / self.cpu_count)
+
+    def estimate(self, frame_count, fps, optimization_level, short_side, model_complexity=1, queue_depth=1):
+        """
+        Estimate processing time in seconds.
+        Returns (seconds, source) where source is "measured" or "default".
+        """
+        key = self._key(optimization_level, short_side, model_complexity)
+        with self.lock:
+            stats = self.throughput.get(key)
+
+        if stats is None:
+            duration = frame_count / fps if fps > 0 else 0
+            return calculate_estimated_time(duration, optimization_level), "default"
+
+        effective_fps = stats["fps"] / self._load_factor(queue_depth)
+        return int(round(self.overhead_seconds + frame_count / effective_fps)), "measured"
+
+    def record(self, frame_count, optimization_level, short_side, model_complexity,
+               concurrent_jobs, processing_seconds, estimated_seconds=None):
+        """
+        Feed back the measured processing time of a completed job.
+        """
+        if frame_count <= 0 or processing_seconds <= self.overhead_seconds:
+            return
+
+        key = self._key(optimization_level, short_side, model_complexity)
+        fps = frame_count / (processing_seconds - self.overhead_seconds) * self._load_factor(concurrent_jobs)
+
+        with self.lock:
+            stats = self.throughput.get(key)
+            if stats is None:
+                self.throughput[key] = {"fps": fps, "samples": 1}
+            else:
+                stats["fps"] += self.smoothing * (fps - stats["fps"])
+                stats["samples"] += 1
+
+            if estimated_seconds:
+                self.errors.append((estimated_seconds, processing_seconds))
+
+    def report(self):
+        """
+        Summarize calibration state and recent prediction error.
+        """
+        with self.lock:
+            errors = list(self.errors)
+            throughput = {
+                f"level{level}_{bucket}p_complexity{complexity}": {
+                    "frames_per_second": round(stats["fps"], 2),
+                    "samples": stats["samples"]
+                }
+                for (level, bucket, complexity), stats in self.throughput.items()
+            }
+
+        report = {"throughput": throughput, "jobs_measured": len(errors)}
+        if errors:
+            report["mean_absolute_error_seconds"] = round(sum(abs(e - a) for e, a in errors) / len(errors), 2)
+            report["mean_absolute_percentage_error"] = round(
+                sum(abs(e - a) / a for e, a in errors if a > 0) / len(errors) * 100, 1)
+            report["mean_bias_seconds"] = round(sum(e - a for e, a in errors) / len(errors), 2)
+        return report
+
+processing_estimator = ProcessingTimeEstimator()
+
+def count_active_analyses():
+    """
+    Number of analyses currently queued or processing: background analyses in
+    the result store plus synchronous /api/analyze requests.
+    """
+    return analysis_results.count_active() + SynchronousAnalysisTracker.in_flight.value
+
+# Quality/latency tiers, fastest first. Each bundles the pose model, the input
+# resolution (short side, pixels), the sampling interval and landmark smoothing
+QUALITY_TIERS = {
+    "fast": {"model_complexity": 0, "short_side": 480, "frame_skip": 3, "smooth_landmarks": False},
+    "balanced": {"model_complexity": 1, "short_side": 720, "frame_skip": 2, "smooth_landmarks": True},
+    "accurate": {"model_complexity": 2, "short_side": 1080, "frame_skip": 1, "smooth_landmarks": True}
+}
+TIER_ORDER = ["fast", "balanced", "accurate"]
+
+# Tier each kind of request gets on an idle server
+DEFAULT_TIERS = {
+    "position_check": "fast",  # Live feedback: latency matters most
+    "interactive": "balanced",  # Synchronous video analysis
+    "report": "accurate"  # Background analysis, nobody is waiting on each frame
+}
+
+def select_quality_tier(request_type, requested=None, counted_self=False):
+    """
+    Pick the quality tier for a request.
+    A valid explicitly requested tier wins. Otherwise start from the request
+    type's default and step down one tier for each CPU's worth of other queued
+    or running analyses (`counted_self` when the request is one of them).
+    Returns the tier settings plus its name and the reason.
+    """
+    if requested in QUALITY_TIERS:
+        return dict(QUALITY_TIERS[requested], name=requested, reason="requested")
+    
+    name = DEFAULT_TIERS.get(request_type, "balanced")
+    active = count_active_analyses() - (1 if counted_self else 0)
+    steps_down = int(active / (os.cpu_count() or 1))
+    if steps_down:
+        name = TIER_ORDER[max(0, TIER_ORDER.index(name) - steps_down)]
+        reason = f"load: {active} active analyses"
+    else:
+        reason = f"default for {request_type}"
+    return dict(QUALITY_TIERS[name], name=name, reason=reason)
+
+def apply_quality_tier(settings, tier):
+    """
+    Fold a quality tier into optimization settings. The tier decides the model
+    and smoothing; resolution and sampling never get finer than the
+    optimization level already asks for.
+    """
+    settings["model_complexity"] = tier["model_complexity"]
+    settings["smooth_landmarks"] = tier["smooth_landmarks"]
+    settings["decode_short_side"] = min(settings.get("decode_short_side") or tier["short_side"], tier["short_side"])
+    settings["frame_skip"] = max(settings.get("frame_skip", 1), tier["frame_skip"])
+    settings["quality_tier"] = tier["name"]
+    return settings
+
+def fit_short_side(image, short_side):
+    """
+    Downscale a BGR image so its short side is at most `short_side` pixels.
+    """
+    h, w = image.shape[:2]
+    if min(h, w) <= short_side:
+        return image
+    scale = short_side / min(h, w)
+    return cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+# Landmarks used to estimate how fast the body is moving between inferences
+MOTION_LANDMARKS = [11, 12, 23, 24, 25, 26, 27, 28]  # Shoulders, hips, knees, ankles
+
+class AdaptiveFrameSampler:
+    """
+    Decide which decoded frames get pose inference.
+    Combines frame-difference energy on a small grayscale thumbnail with the
+    landmark velocity from the previous inference, each relative to its running
+    average for this video, so frames are sampled densely during rocking
+    transitions and sparsely while the user holds still. Budget saved while
+    still carries over to the next motion, so a clip with motion runs about as
+    many inferences as fixed sampling every `base_interval` frames, and never
+    more than that plus the samples forced every `max_interval` frames.
+    """
+    def __init__(self, base_interval, min_interval=1, max_interval=None,
+                 thumbnail_width=64, baseline_alpha=0.02, energy_floor=0.5, velocity_floor=0.001):
+        self.base_interval = max(1, int(base_interval))
+        self.min_interval = max(1, int(min_interval))
+        self.max_interval = max_interval or self.base_interval * 4
+        self.thumbnail_width = thumbnail_width
+        self.baseline_alpha = baseline_alpha  # Weight of each new frame in the running averages
+        self.energy_floor = energy_floor  # Mean abs pixel difference below which frames count as still (sensor noise)
+        self.velocity_floor = velocity_floor  # Normalized landmark travel per frame below which the pose counts as still
+
+        # Inference budget: one credit per `base_interval` decoded frames. Unspent
+        # credits carry over; samples forced at `max_interval` may borrow against it
+        self.credits = 1.0
+
+        self.previous_thumbnail = None
+        self.energy_baseline = None
+        self.previous_landmarks = None
+        self.previous_landmark_frame = None
+        self.landmark_velocity = 0.0
+        self.velocity_baseline = None
+        self.frames_since_sample = 0
+        self.motion_since_sample = 0.0
+        self.decoded_frames = 0
+        self.sampled_frames = 0
+
+    def _motion_energy(self, frame):
+        h, w = frame.shape[:2]
+        thumb_h = max(1, int(h * self.thumbnail_width / w))
+        thumbnail = cv2.resize(frame, (self.thumbnail_width, thumb_h), interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+        if self.previous_thumbnail is None or self.previous_thumbnail.shape != thumbnail.shape:
+            self.previous_thumbnail = thumbnail
+            return None
+        energy = float(np.mean(cv2.absdiff(thumbnail, self.previous_thumbnail)))
+        self.previous_thumbnail = thumbnail
+        return energy
+
+    def _relative_motion(self, energy):
+        # Motion as a multiple of this video's average, so a steadily moving clip
+        # averages about 1 whatever its lighting, framing or camera noise
+        if energy is None:
+            return 1.0  # Treat the first frame as moving
+        if self.energy_baseline is None:
+            self.energy_baseline = energy
+        else:
+            self.energy_baseline += self.baseline_alpha * (energy - self.energy_baseline)
+        motion = energy / max(self.energy_baseline, self.energy_floor)
+        if self.velocity_baseline is not None:
+            motion = max(motion, self.landmark_velocity / max(self.velocity_baseline, self.velocity_floor))
+        return motion
+
+    def should_sample(self, frame, force=False):
+        """
+        Return True if pose inference should run on this decoded frame.
+        With force=True the frame is always sampled but still updates the motion state.
+        """
+        self.decoded_frames += 1
+        self.frames_since_sample += 1
+        self.credits += 1.0 / self.base_interval
+
+        # Motion accumulated since the last sample: average motion reaches
+        # `base_interval` every `base_interval` frames, more motion sooner
+        self.motion_since_sample += self._relative_motion(self._motion_energy(frame))
+
+        if (force or self.frames_since_sample >= self.max_interval
+                or (self.frames_since_sample >= self.min_interval
+                    and self.motion_since_sample >= self.base_interval
+                    and self.credits >= 1.0)):
+            self.credits -= 1.0
+            self.frames_since_sample = 0
+            # Keep the overshoot, so sampling isn't biased toward waiting
+            self.motion_since_sample = max(0.0, min(self.base_interval, self.motion_since_sample - self.base_interval))
+            self.sampled_frames += 1
+            return True
+
+        return False
+
+    def count_skipped(self, frames=1):
+        """
+        Count frames decoded but skipped before reaching the sampler (e.g. absence backoff).
+        """
+        self.decoded_frames += frames
+
+    def set_base_interval(self, base_interval):
+        """
+        Change the inference budget mid-run (e.g. when a deadline forces faster processing).
+        """
+        self.base_interval = max(1, int(base_interval))
+        self.max_interval = self.base_interval * 4
+
+    def observe_landmarks(self, frame_index, landmarks):
+        """
+        Record the landmarks of the latest inference (None if no pose was found).
+        """
+        if not landmarks:
+            self.landmark_velocity = 0.0
+            self.previous_landmarks = None
+            return
+
+        if self.previous_landmarks is not None and frame_index > self.previous_landmark_frame:
+            travel = [
+                math.hypot(landmarks[i]["x"] - self.previous_landmarks[i]["x"],
+                           landmarks[i]["y"] - self.previous_landmarks[i]["y"])
+                for i in MOTION_LANDMARKS
+                if i < len(landmarks) and i < len(self.previous_landmarks)
+            ]
+            if travel:
+                self.landmark_velocity = (sum(travel) / len(travel)) / (frame_index - self.previous_landmark_frame)
+                if self.velocity_baseline is None:
+                    self.velocity_baseline = self.landmark_velocity
+                else:
+                    self.velocity_baseline += self.baseline_alpha * (self.landmark_velocity - self.velocity_baseline)
+
+        self.previous_landmarks = landmarks
+        self.previous_landmark_frame = frame_index
+
+    def report(self, fps):
+        """
+        Summarize the effective sampling for processing_metadata.
+        """
+        rate = self.sampled_frames / self.decoded_frames if self.decoded_frames else 0
+        return {
+            "mode": "adaptive",
+            "base_interval": self.base_interval,
+            "decoded_frames": self.decoded_frames,
+            "sampled_frames": self.sampled_frames,
+            "unspent_credits": round(self.credits, 2),
+            "effective_sample_rate": round(rate, 4),
+            "effective_fps": round(rate * fps, 2) if fps else 0
+        }
+
+class AbsenceBackoff:
+    """
+    Back off sampling exponentially while nobody is in frame.
+    Every sampled frame without a pose doubles the gap to the next sample, up
+    to `max_gap` frames; the first detection drops straight back to normal
+    sampling. Skipped frames are only grabbed, never fully read.
+    Thread-safe, so pipelined analyses can observe from the inference workers.
+    """
+    def __init__(self, base_gap=1, max_gap=60, misses_before_backoff=2):
+        self.base_gap = max(1, int(base_gap))
+        self.max_gap = max(self.base_gap, int(max_gap))
+        self.misses_before_backoff = misses_before_backoff
+        self.misses = 0
+        self.gap = 0  # 0 while a person is visible
+        self.next_frame = 0
+        self.skipped_frames = 0
+        self.absent_stretches = 0
+        self.longest_gap = 0
+        self.lock = threading.Lock()
+
+    def allow(self, frame_index):
+        """
+        False if `frame_index` falls inside the current backoff gap.
+        """
+        with self.lock:
+            if self.gap and frame_index < self.next_frame:
+                self.skipped_frames += 1
+                return False
+            return True
+
+    def observe(self, frame_index, found):
+        """
+        Record whether the inference on `frame_index` found a pose.
+        """
+        with self.lock:
+            if found:
+                self.misses = 0
+                self.gap = 0
+                return
+
+            self.misses += 1
+            if self.misses < self.misses_before_backoff:
+                return
+            if self.gap == 0:
+                self.absent_stretches += 1
+            self.gap = min(self.max_gap, self.gap * 2 if self.gap else self.base_gap * 2)
+            self.longest_gap = max(self.longest_gap, self.gap)
+            # Workers may report out of order; never pull the gap back
+            self.next_frame = max(self.next_frame, frame_index + self.gap)
+
+    def report(self):
+        return {
+            "skipped_frames": self.skipped_frames,
+            "absent_stretches": self.absent_stretches,
+            "longest_gap_frames": self.longest_gap
+        }
+
+class DuplicateFrameFilter:
+    """
+    Reuse the previous landmarks when a sampled frame shows the same scene.
+    Compares a small grayscale thumbnail with the one from the last frame that
+    actually ran inference (not the last reused one), so slow drift still adds
+    up and triggers a fresh inference. At most `max_reuses` frames in a row are
+    reused.
+    """
+    def __init__(self, threshold=1.5, max_reuses=5, thumbnail_width=32):
+        self.threshold = threshold  # Mean abs grayscale difference below which frames count as duplicates
+        self.max_reuses = max_reuses
+        self.thumbnail_width = thumbnail_width
+        self.reference = None
+        self.pending = None
+        self.landmarks = None
+        self.consecutive_reuses = 0
+        self.reused_frames = 0
+        self.inferred_frames = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        thumb_h = max(1, int(h * self.thumbnail_width / w))
+        thumbnail = cv2.resize(frame, (self.thumbnail_width, thumb_h), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+    def is_duplicate(self, frame):
+        """
+        True if `frame` can reuse `self.landmarks` instead of running inference.
+        Otherwise the caller runs inference and passes the result to remember().
+        """
+        thumbnail = self._thumbnail(frame)
+        if (self.reference is not None
+                and self.reference.shape == thumbnail.shape
+                and self.consecutive_reuses < self.max_reuses
+                and float(np.mean(cv2.absdiff(thumbnail, self.reference))) < self.threshold):
+            self.consecutive_reuses += 1
+            self.reused_frames += 1
+            return True
+
+        self.pending = thumbnail
+        return False
+
+    def remember(self, landmarks):
+        self.reference = self.pending
+        self.landmarks = landmarks
+        self.consecutive_reuses = 0
+        self.inferred_frames += 1
+
+    def report(self):
+        total = self.reused_frames + self.inferred_frames
+        return {
+            "reused_frames": self.reused_frames,
+            "inferred_frames": self.inferred_frames,
+            "reuse_rate": round(self.reused_frames / total, 4) if total else 0
+        }
+
+def merge_duplicate_reports(reports):
+    """
+    Combine DuplicateFrameFilter reports from several workers.
+    """
+    reused = sum(report["reused_frames"] for report in reports)
+    inferred = sum(report["inferred_frames"] for report in reports)
+    return {
+        "reused_frames": reused,
+        "inferred_frames": inferred,
+        "reuse_rate": round(reused / (reused + inferred), 4) if reused + inferred else 0
+    }
+
+# Longest run of decoded frames that may pass without a real pose inference
+# once sampling intervals and duplicate reuse are combined
+MAX_INFERENCE_GAP_FRAMES = 24
+
+def duplicate_reuse_limit(settings):
+    """
+    Consecutive duplicate reuses allowed on top of the sampling interval.
+    Assumes the widest interval sampling can reach (adaptive sampling goes up
+    to 4x frame_skip), so reuse never stretches the gap between real
+    inferences past `max_inference_gap_frames`.
+    """
+    interval = max(1, int(settings.get("frame_skip", 1)))
+    if settings.get("adaptive_sampling", False):
+        interval *= 4
+    max_gap = settings.get("max_inference_gap_frames", MAX_INFERENCE_GAP_FRAMES)
+    return max(0, min(settings.get("max_duplicate_reuses", 5), max_gap // interval - 1))
+
+def create_duplicate_filter(settings):
+    """
+    DuplicateFrameFilter configured from optimization settings, or None when
+    disabled or when the sampling interval leaves no room for reuse.
+    """
+    if not settings.get("skip_duplicates", False):
+        return None
+    max_reuses = duplicate_reuse_limit(settings)
+    if max_reuses == 0:
+        return None
+    return DuplicateFrameFilter(
+        threshold=settings.get("duplicate_threshold", 1.5),
+        max_reuses=max_reuses
+    )
+
+# ffmpeg is optional; without it scaled decoding falls back to OpenCV + resize
+FFMPEG_PATH = shutil.which("ffmpeg")
+
+class ScaledVideoReader:
+    """
+    Drop-in replacement for cv2.VideoCapture that returns frames already downscaled
+    so their short side is at most `target_short_side`.
+    When ffmpeg is available the scaling happens inside the decoder process, so
+    full-resolution frames are never copied into Python, color-converted or
+    resized. Otherwise frames are decoded with OpenCV and resized with INTER_AREA.
+    """
+    def __init__(self, video_path, target_short_side, use_ffmpeg=True):
+        self.video_path = video_path
+        self.process = None
+        self.position = 0
+        self.pending_frame = None
+        
+        self.cap = cv2.VideoCapture(video_path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        # Decode the first frame to learn the real (possibly auto-rotated) frame size
+        ret, first_frame = self.cap.read()
+        self.opened = ret
+        if not ret:
+            self.cap.release()
+            return
+        
+        source_h, source_w = first_frame.shape[:2]
+        scale = min(1.0, target_short_side / min(source_w, source_h))
+        self.width = max(2, int(round(source_w * scale / 2)) * 2)
+        self.height = max(2, int(round(source_h * scale / 2)) * 2)
+        self.frame_bytes = self.width * self.height * 3
+        
+        if use_ffmpeg and FFMPEG_PATH and scale < 1.0:
+            self.decoder = "ffmpeg"
+            self.cap.release()
+            self.cap = None
+            self._start_ffmpeg(0)
+        else:
+            self.decoder = "opencv"
+            self.pending_frame = self._resize(first_frame)
+
+    def _start_ffmpeg(self, start_frame):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+        
+        command = [FFMPEG_PATH, "-nostdin", "-v", "error"]
+        if start_frame > 0 and self.fps > 0:
+            command += ["-ss", f"{start_frame / self.fps:.3f}"]
+        command += [
+            "-i", self.video_path,
+            "-an", "-sn",
+            "-vsync", "0",  # One output frame per decoded frame, no duplication
+            "-vf", f"scale={self.width}:{self.height}:flags=area",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1"
+        ]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                        bufsize=self.frame_bytes * 2)
+        self.position = start_frame
+
+    def _resize(self, frame):
+        if frame.shape[1] == self.width and frame.shape[0] == self.height:
+            return frame
+        return cv2.resize(frame, (self.width, self.height), interpolation=cv2.INTER_AREA)
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self):
+        if not self.opened:
+            return False, None
+        
+        if self.decoder == "ffmpeg":
+            data = self.process.stdout.read(self.frame_bytes)
+            if len(data) < self.frame_bytes:
+                return False, None
+            frame = np.frombuffer(data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        elif self.pending_frame is not None:
+            frame, self.pending_frame = self.pending_frame, None
+        else:
+            ret, frame = self.cap.read()
+            if not ret:
+                return False, None
+            frame = self._resize(frame)
+        
+        self.position += 1
+        return True, frame
+
+    def grab(self):
+        if self.decoder == "opencv" and self.pending_frame is None and self.opened:
+            if not self.cap.grab():
+                return False
+            self.position += 1
+            return True
+        ret, _ = self.read()
+        return ret
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return self.frame_count
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width if self.opened else 0
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height if self.opened else 0
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return self.position
+        return self.cap.get(prop) if self.cap is not None else 0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self.opened:
+            return False
+        
+        if self.decoder == "ffmpeg":
+            self._start_ffmpeg(int(value))
+        else:
+            self.pending_frame = None
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, int(value))
+            self.position = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        return True
+
+    def release(self):
+        self.opened = False
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+def open_video_reader(video_path, target_short_side=None):
+    """
+    Open a video, downscaling at decode time when a target short side is given.
+    """
+    if target_short_side:
+        return ScaledVideoReader(video_path, target_short_side)
+    return cv2.VideoCapture(video_path)
+
+class FrameBuffers:
+    """
+    Reusable destination arrays for per-frame color conversion and resizing.
+    Buffers are keyed by purpose and only reallocated when the frame size
+    changes, so a steady-state frame loop allocates no new image arrays.
+    Not thread-safe: each worker gets its own instance.
+    """
+    def __init__(self):
+        self.buffers = {}
+        self.allocations = 0
+        self.reuses = 0
+        self.allocated_bytes = 0
+        self.reused_bytes = 0
+
+    def _buffer(self, key, shape):
+        buffer = self.buffers.get(key)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            self.buffers[key] = buffer
+            self.allocations += 1
+            self.allocated_bytes += buffer.nbytes
+        else:
+            self.reuses += 1
+            self.reused_bytes += buffer.nbytes
+        return buffer
+
+    def to_rgb(self, image, key="rgb"):
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._buffer(key, image.shape))
+
+    def resize(self, image, size, interpolation=cv2.INTER_LINEAR, key="resize"):
+        width, height = size
+        dst = self._buffer(key, (height, width) + image.shape[2:])
+        return cv2.resize(image, size, dst=dst, interpolation=interpolation)
+
+    def report(self):
+        return {
+            "allocations": self.allocations,
+            "reuses": self.reuses,
+            "allocated_mb": round(self.allocated_bytes / 1048576, 1),
+            "reused_mb": round(self.reused_bytes / 1048576, 1)
+        }
+
+def merge_buffer_reports(reports):
+    """
+    Combine FrameBuffers reports from several workers.
+    """
+    return {
+        key: round(sum(report[key] for report in reports), 1)
+        for key in ("allocations", "reuses", "allocated_mb", "reused_mb")
+    }
+
+def current_rss_bytes():
+    """
+    Resident set size of this process, or None where /proc isn't available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class MemoryMonitor:
+    """
+    Track resident memory over one analysis by sampling RSS every few frames.
+    RSS is process-wide, so analyses running at the same time show up in
+    each other's numbers.
+    """
+    def __init__(self, sample_every=30):
+        self.sample_every = sample_every
+        self.samples = 0
+        self.start = current_rss_bytes()
+        self.peak = self.start
+
+    def sample(self):
+        self.samples += 1
+        if self.samples % self.sample_every == 0:
+            self._update_peak(current_rss_bytes())
+
+    def _update_peak(self, rss):
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def report(self, buffer_reports=()):
+        end = current_rss_bytes()
+        self._update_peak(end)
+        to_mb = lambda value: round(value / 1048576, 1) if value is not None else None
+        report = {
+            "rss_start_mb": to_mb(self.start),
+            "rss_peak_mb": to_mb(self.peak),
+            "rss_end_mb": to_mb(end)
+        }
+        if buffer_reports:
+            report["frame_buffers"] = merge_buffer_reports(buffer_reports)
+        return report
+
+# --- Thread layout ---
+
+# Per-process thread and CPU settings. Useful when several server workers
+# share a host: by default every OpenCV and inference runtime sizes its own
+# thread pool to all cores, and the workers oversubscribe the machine.
+INFERENCE_THREADS = int(os.environ["INFERENCE_THREADS"]) if os.environ.get("INFERENCE_THREADS") else None
+OPENCV_THREADS = int(os.environ["OPENCV_THREADS"]) if os.environ.get("OPENCV_THREADS") else None
+WORKER_CPU_AFFINITY = os.environ.get("WORKER_CPU_AFFINITY")  # CPU list like "0-3,8", or "auto"
+
+def parse_cpu_list(spec):
+    """
+    Parse a CPU list such as "0-3,8" into a sorted list of CPU numbers.
+    """
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+def configure_process_threads():
+    """
+    Apply OPENCV_THREADS to this process. Helper processes call this on start;
+    they inherit the parent's CPU affinity and thread environment variables.
+    """
+    if OPENCV_THREADS is not None:
+        cv2.setNumThreads(OPENCV_THREADS)
+
+def apply_thread_layout(worker_index=None, worker_count=None):
+    """
+    Apply the configured thread counts and CPU affinity to this process.
+    With WORKER_CPU_AFFINITY=auto the available CPUs are split evenly between
+    `worker_count` workers and this one is pinned to share `worker_index`.
+    Returns the effective layout (see thread_layout_report).
+    """
+    configure_process_threads()
+    
+    if WORKER_CPU_AFFINITY and hasattr(os, "sched_setaffinity"):
+        if WORKER_CPU_AFFINITY == "auto":
+            if worker_index is not None and worker_count:
+                available = sorted(os.sched_getaffinity(0))
+                share = max(1, len(available) // worker_count)
+                start = (worker_index * share) % len(available)
+                os.sched_setaffinity(0, available[start:start + share])
+        else:
+            os.sched_setaffinity(0, parse_cpu_list(WORKER_CPU_AFFINITY))
+    
+    return thread_layout_report(worker_index, worker_count)
+
+def thread_layout_report(worker_index=None, worker_count=None):
+    """
+    Effective thread layout of this process.
+    """
+    try:
+        os_threads = len(os.listdir("/proc/self/task"))
+    except OSError:
+        os_threads = None
+    return {
+        "pid": os.getpid(),
+        "worker_index": worker_index,
+        "worker_count": worker_count,
+        "cpu_affinity": sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None,
+        "cpu_count": os.cpu_count(),
+        "opencv_threads": cv2.getNumThreads(),
+        "inference_threads": INFERENCE_THREADS,
+        "thread_env": {var: os.environ.get(var) for var in THREAD_ENV_VARS},
+        "python_threads": threading.active_count(),
+        "os_threads": os_threads
+    }
+
+# --- Pose inference backends ---
+
+class PoseBackend:
+    """
+    Interface for pose-inference runtimes.
+    A backend is created with MediaPipe-style options (static_image_mode,
+    model_complexity, smooth_landmarks, min_detection_confidence,
+    min_tracking_confidence), loaded once, and then fed RGB frames. Results are
+    lists of 33 landmark dicts ({x, y, z, visibility}, normalized image
+    coordinates, BlazePose order) or None when no person is found. Video
+    callers pass each frame's `frame_index`, which pixel-based backends ignore.
+    Backends are context managers, so `with create_pose_backend(...) as pose:` works.
+    """
+    name = "base"
+    supports_batching = False  # True if infer_batch is faster than repeated infer
+
+    def __init__(self, **options):
+        self.options = options
+
+    @property
+    def input_size(self):
+        """
+        (width, height) of the model input frames are scaled to.
+        """
+        raise NotImplementedError
+
+    def load(self):
+        return self
+
+    def infer(self, image, frame_index=None):
+        raise NotImplementedError
+
+    def infer_batch(self, images, frame_indices=None):
+        frame_indices = frame_indices or [None] * len(images)
+        return [self.infer(image, frame_index) for image, frame_index in zip(images, frame_indices)]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+class MediaPipePoseBackend(PoseBackend):
+    """
+    MediaPipe Pose (BlazePose) through mp.solutions.pose.
+    """
+    name = "mediapipe"
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.pose = None
+
+    @property
+    def input_size(self):
+        return (256, 256)  # BlazePose landmark model input
+
+    def load(self):
+        if mp is None:
+            raise RuntimeError("MediaPipe is not installed; set POSE_BACKEND=replay to run without it")
+        self.pose = mp.solutions.pose.Pose(**self.options)
+        return self
+
+    def infer(self, image, frame_index=None):
+        results = self.pose.process(image)
+        if not results.pose_landmarks:
+            return None
+        
+        return [
+            {
+                "x": landmark.x,
+                "y": landmark.y,
+                "z": landmark.z,
+                "visibility": landmark.visibility
+            }
+            for landmark in results.pose_landmarks.landmark
+        ]
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
+
+class ReplayPoseBackend(PoseBackend):
+    """
+    Deterministic backend that ignores pixel content.
+    Replays a recorded landmark track (a JSON list of per-frame landmark lists
+    or nulls, from the `replay_path` option or POSE_REPLAY_PATH), cycling when
+    it runs out. Without a recording it synthesizes a quadruped rocking cycle.
+    Frames are looked up by their index in the video, so sampling, workers and
+    segments all see the same motion; images without one replay in call order.
+    Lets the analyzers and endpoints run and be benchmarked without MediaPipe.
+    A whole batch is answered by one lookup, so it also exercises the
+    inference scheduler's batching path.
+    """
+    name = "replay"
+    supports_batching = True
+
+    def __init__(self, replay_path=None, period_frames=60, **options):
+        super().__init__(**options)
+        self.replay_path = replay_path or os.environ.get("POSE_REPLAY_PATH")
+        self.period_frames = period_frames
+        self.track = None
+        self.calls = 0
+
+    @property
+    def input_size(self):
+        return (256, 256)
+
+    def load(self):
+        if self.replay_path:
+            with open(self.replay_path) as track_file:
+                self.track = json.load(track_file)
+        return self
+
+    def _synthetic_pose(self, step):
+        # Rocking: hips travel back toward the heels and forward again
+        rock = 0.05 * math.sin(2 * math.pi * step / self.period_frames)
+        points = {landmark: (0.5, 0.5) for landmark in PoseLandmark}
+        points.update({
+            PoseLandmark.NOSE: (0.28, 0.48),
+            PoseLandmark.LEFT_EAR: (0.31, 0.46), PoseLandmark.RIGHT_EAR: (0.31, 0.47),
+            PoseLandmark.LEFT_SHOULDER: (0.35, 0.5), PoseLandmark.RIGHT_SHOULDER: (0.35, 0.51),
+            PoseLandmark.LEFT_ELBOW: (0.35, 0.62), PoseLandmark.RIGHT_ELBOW: (0.35, 0.63),
+            PoseLandmark.LEFT_WRIST: (0.35, 0.75), PoseLandmark.RIGHT_WRIST: (0.35, 0.76),
+            PoseLandmark.LEFT_HIP: (0.62 + rock, 0.5), PoseLandmark.RIGHT_HIP: (0.62 + rock, 0.51),
+            PoseLandmark.LEFT_KNEE: (0.62, 0.75), PoseLandmark.RIGHT_KNEE: (0.62, 0.76),
+            PoseLandmark.LEFT_ANKLE: (0.8, 0.76), PoseLandmark.RIGHT_ANKLE: (0.8, 0.77),
+            PoseLandmark.LEFT_HEEL: (0.82, 0.74), PoseLandmark.RIGHT_HEEL: (0.82, 0.75),
+            PoseLandmark.LEFT_FOOT_INDEX: (0.86, 0.78), PoseLandmark.RIGHT_FOOT_INDEX: (0.86, 0.79)
+        })
+        return [
+            {"x": points[landmark][0], "y": points[landmark][1], "z": 0.0, "visibility": 0.95}
+            for landmark in PoseLandmark
+        ]
+
+    def infer(self, image, frame_index=None):
+        return self.infer_batch([image], [frame_index])[0]
+
+    def infer_batch(self, images, frame_indices=None):
+        first = self.calls
+        self.calls += len(images)
+        frame_indices = frame_indices or [None] * len(images)
+        steps = [index if index is not None else first + offset for offset, index in enumerate(frame_indices)]
+        if self.track:
+            return [self.track[step % len(self.track)] for step in steps]
+        return [self._synthetic_pose(step) for step in steps]
+
+POSE_BACKENDS = {
+    MediaPipePoseBackend.name: MediaPipePoseBackend,
+    ReplayPoseBackend.name: ReplayPoseBackend
+}
+
+# Backend used when a caller doesn't ask for one
+DEFAULT_POSE_BACKEND = os.environ.get("POSE_BACKEND", MediaPipePoseBackend.name)
+
+def create_pose_backend(backend=None, **options):
+    """
+    Create and load a pose backend by name (default: POSE_BACKEND env var).
+    """
+    name = backend or DEFAULT_POSE_BACKEND
+    if name not in POSE_BACKENDS:
+        raise ValueError(f"Unknown pose backend: {name}")
+    return POSE_BACKENDS[name](**options).load()
+
+class BatchingInferenceScheduler:
+    """
+    Micro-batch single-image pose inference across concurrent requests.
+    Callers block on infer(); a scheduler thread collects queued requests for
+    up to `max_wait_ms` (less if a queued request's latency cap runs out
+    first), groups them by backend options and runs each group through one
+    infer_batch call on a backend it keeps loaded. Only for static-image
+    inference: tracking state can't be shared between callers.
+    Backends without native batching (MediaPipe) would gain nothing from a
+    batch, so their requests skip the collection window and run on the
+    caller's thread, using one of up to `pool_size` warm backends per option set.
+    """
+    BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32]
+    WAIT_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100]
+
+    def __init__(self, max_batch_size=8, max_wait_ms=5.0, pool_size=4):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max_wait_ms
+        self.pool_size = max(1, int(pool_size))
+        self.requests = queue.Queue()
+        self.backends = {}  # Options key -> loaded PoseBackend, used only by the scheduler thread
+        self.pools = {}  # Options key -> {"idle": LifoQueue of warm backends, "created": count}
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batch_size_histogram = {bucket: 0 for bucket in self.BATCH_SIZE_BUCKETS}
+        self.wait_histogram = {bucket: 0 for bucket in self.WAIT_BUCKETS_MS + [float("inf")]}
+        self.batches = 0
+        self.requests_served = 0
+
+    def _ensure_thread(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+                self.thread.start()
+
+    def infer(self, image, max_latency_ms=None, **options):
+        """
+        Pose landmarks for one RGB image, batched with other callers' images.
+        `max_latency_ms` caps how long this request may wait for a batch to fill.
+        """
+        key = tuple(sorted(options.items()))
+        if not POSE_BACKENDS[options.get("backend") or DEFAULT_POSE_BACKEND].supports_batching:
+            return self._infer_pooled(key, options, image)
+        
+        self._ensure_thread()
+        now = time.perf_counter()
+        wait_ms = self.max_wait_ms if max_latency_ms is None else min(self.max_wait_ms, max_latency_ms)
+        future = Future()
+        self.requests.put((now, now + wait_ms / 1000, key, options, image, future))
+        return future.result()
+
+    def _infer_pooled(self, key, options, image):
+        started = time.perf_counter()
+        with self.lock:
+            pool = self.pools.setdefault(key, {"idle": queue.LifoQueue(), "created": 0})
+            create = pool["idle"].empty() and pool["created"] < self.pool_size
+            if create:
+                pool["created"] += 1
+        
+        if create:
+            try:
+                backend = create_pose_backend(**options)
+            except Exception:
+                with self.lock:
+                    pool["created"] -= 1
+                raise
+        else:
+            # All warm backends busy: wait for one rather than loading another model
+            backend = pool["idle"].get()
+        
+        waited = time.perf_counter() - started
+        try:
+            return backend.infer(image)
+        finally:
+            pool["idle"].put(backend)
+            self._record(1, [waited])
+
+    def client(self, max_latency_ms=None, **options):
+        """
+        Object with a PoseBackend-style infer() that goes through the scheduler.
+        """
+        scheduler = self
+
+        class ScheduledPose:
+            def infer(self, image, frame_index=None):
+                return scheduler.infer(image, max_latency_ms, **options)
+
+        return ScheduledPose()
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        flush_at = batch[0][1]
+        while len(batch) < self.max_batch_size:
+            timeout = flush_at - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(request)
+            flush_at = min(flush_at, request[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            groups = {}
+            for request in batch:
+                groups.setdefault(request[2], []).append(request)
+
+            for key, requests in groups.items():
+                try:
+                    if key not in self.backends:
+                        self.backends[key] = create_pose_backend(**requests[0][3])
+                    results = self.backends[key].infer_batch([request[4] for request in requests])
+                    for request, result in zip(requests, results):
+                        request[5].set_result(result)
+                except Exception as e:
+                    for request in requests:
+                        if not request[5].done():
+                            request[5].set_exception(e)
+                self._record(len(requests), [started - request[0] for request in requests])
+
+    def _record(self, batch_size, waits):
+        with self.lock:
+            self.batches += 1
+            self.requests_served += batch_size
+            size_bucket = next((b for b in self.BATCH_SIZE_BUCKETS if batch_size <= b), self.BATCH_SIZE_BUCKETS[-1])
+            self.batch_size_histogram[size_bucket] += 1
+            for waited in waits:
+                wait_bucket = next(b for b in self.wait_histogram if waited * 1000 <= b)
+                self.wait_histogram[wait_bucket] += 1
+
+    def report(self):
+        with self.lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self.batches,
+                "requests": self.requests_served,
+                "mean_batch_size": round(self.requests_served / self.batches, 2) if self.batches else 0,
+                "loaded_backends": len(self.backends) + sum(pool["created"] for pool in self.pools.values()),
+                "pool_size": self.pool_size,
+                # Whether any requests went through real batches rather than the warm-backend pool
+                "native_batching": bool(self.backends),
+                # Histogram keys are bucket upper bounds
+                "batch_size_histogram": {f"<={b}": n for b, n in self.batch_size_histogram.items()},
+                "wait_ms_histogram": {
+                    (f"<={b}" if b != float("inf") else f">{self.WAIT_BUCKETS_MS[-1]}"): n
+                    for b, n in self.wait_histogram.items()
+                }
+            }
+
+# Shared scheduler for single-frame position checks
+inference_scheduler = BatchingInferenceScheduler(
+    max_batch_size=int(os.environ.get("POSITION_BATCH_SIZE", 8)),
+    max_wait_ms=float(os.environ.get("POSITION_BATCH_WAIT_MS", 5)),
+    pool_size=int(os.environ.get("POSITION_POOL_SIZE", min(4, os.cpu_count() or 1)))
+)
+
+def detect_pose_landmarks(pose, image, buffers=None, buffer_key="rgb", frame_index=None):
+    """
+    Run pose detection on a BGR image with a PoseBackend.
+    Returns a list of landmark dicts in normalized image coordinates, or None.
+    The RGB conversion goes into `buffers` (a FrameBuffers) when given.
+    """
+    if buffers is not None:
+        return pose.infer(buffers.to_rgb(image, buffer_key), frame_index)
+    return pose.infer(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), frame_index)
+
+class RoiTracker:
+    """
+    Crop pose inference to the region around the person.
+    Uses the landmark bounding box of the previous detection (plus a margin) as
+    the region for the next inference, and maps the landmarks back to full-frame
+    normalized coordinates. The region is sticky: it is only re-centered when the
+    pose drifts toward its edge or shrinks well inside it, which keeps the crop
+    stable for MediaPipe's own frame-to-frame tracking. Falls back to full-frame
+    detection whenever the person is lost.
+    """
+    def __init__(self, margin=0.25, min_visibility=0.3, max_side=512,
+                 edge_tolerance=0.05, max_area_fraction=0.8, buffers=None):
+        self.margin = margin
+        self.min_visibility = min_visibility
+        self.max_side = max_side  # Crops are downscaled to at most this many pixels on the long side
+        self.edge_tolerance = edge_tolerance
+        self.max_area_fraction = max_area_fraction  # Above this the crop saves too little to bother
+        self.buffers = buffers  # Optional FrameBuffers for the crop resize and color conversion
+        self.roi = None  # (x0, y0, x1, y1) in normalized frame coordinates
+        self.crop_inferences = 0
+        self.full_frame_inferences = 0
+        self.tracking_lost = 0
+        self.recentered = 0
+
+    def _region_for(self, landmarks, width, height):
+        visible = [l for l in landmarks if l["visibility"] > self.min_visibility]
+        if len(visible) < 4:
+            return None
+        
+        xs = [l["x"] * width for l in visible]
+        ys = [l["y"] * height for l in visible]
+        box_w = max(xs) - min(xs)
+        box_h = max(ys) - min(ys)
+        pad = self.margin * max(box_w, box_h)
+        
+        x0 = max(0, int(min(xs) - pad))
+        y0 = max(0, int(min(ys) - pad))
+        x1 = min(width, int(max(xs) + pad))
+        y1 = min(height, int(max(ys) + pad))
+        if x1 - x0 < 32 or y1 - y0 < 32:
+            return None
+        if (x1 - x0) * (y1 - y0) > self.max_area_fraction * width * height:
+            return None
+        
+        # Stored normalized so the region survives changes in frame scale
+        return (x0 / width, y0 / height, x1 / width, y1 / height)
+
+    def _needs_recenter(self, crop_landmarks):
+        visible = [l for l in crop_landmarks if l["visibility"] > self.min_visibility]
+        if len(visible) < 4:
+            return True
+        
+        xs = [l["x"] for l in visible]
+        ys = [l["y"] for l in visible]
+        low, high = self.edge_tolerance, 1 - self.edge_tolerance
+        if min(xs) < low or min(ys) < low or max(xs) > high or max(ys) > high:
+            return True
+        
+        # Person occupies much less of the crop than when it was set
+        return (max(xs) - min(xs)) * (max(ys) - min(ys)) < 0.25
+
+    def process(self, pose, frame, frame_index=None):
+        """
+        Detect landmarks in a BGR frame. Returns full-frame landmark dicts or None.
+        """
+        height, width = frame.shape[:2]
+        
+        if self.roi is not None:
+            x0, y0 = int(self.roi[0] * width), int(self.roi[1] * height)
+            x1, y1 = int(self.roi[2] * width), int(self.roi[3] * height)
+            crop = frame[y0:y1, x0:x1]
+            crop_w, crop_h = x1 - x0, y1 - y0
+            if max(crop_w, crop_h) > self.max_side:
+                scale = self.max_side / max(crop_w, crop_h)
+                crop_size = (max(1, int(crop_w * scale)), max(1, int(crop_h * scale)))
+                if self.buffers is not None:
+                    crop = self.buffers.resize(crop, crop_size, cv2.INTER_AREA, key="crop")
+                else:
+                    crop = cv2.resize(crop, crop_size, interpolation=cv2.INTER_AREA)
+            
+            crop_landmarks = detect_pose_landmarks(pose, crop, self.buffers, "crop_rgb", frame_index)
+            if crop_landmarks is not None:
+                self.crop_inferences += 1
+                landmarks = [
+                    {
+                        "x": (l["x"] * crop_w + x0) / width,
+                        "y": (l["y"] * crop_h + y0) / height,
+                        "z": l["z"] * crop_w / width,
+                        "visibility": l["visibility"]
+                    }
+                    for l in crop_landmarks
+                ]
+                if self._needs_recenter(crop_landmarks):
+                    self.roi = self._region_for(landmarks, width, height)
+                    self.recentered += 1
+                return landmarks
+            
+            # Tracking lost: retry on the full frame
+            self.roi = None
+            self.tracking_lost += 1
+        
+        landmarks = detect_pose_landmarks(pose, frame, self.buffers, frame_index=frame_index)
+        self.full_frame_inferences += 1
+        if landmarks is not None:
+            self.roi = self._region_for(landmarks, width, height)
+        return landmarks
+
+    def report(self):
+        total = self.crop_inferences + self.full_frame_inferences
+        return {
+            "crop_inferences": self.crop_inferences,
+            "full_frame_inferences": self.full_frame_inferences,
+            "tracking_lost": self.tracking_lost,
+            "recentered": self.recentered,
+            "crop_rate": round(self.crop_inferences / total, 4) if total else 0
+        }
+
+def infer_pose(pose, frame, roi_tracker=None, buffers=None, duplicates=None, frame_index=None):
+    """
+    Pose landmarks for one BGR frame. Reuses the previous result for
+    near-duplicate frames when a DuplicateFrameFilter is given, and crops to
+    the tracked person when a RoiTracker is given.
+    """
+    if duplicates is not None and duplicates.is_duplicate(frame):
+        return duplicates.landmarks
+    
+    if roi_tracker is not None:
+        landmarks = roi_tracker.process(pose, frame, frame_index)
+    else:
+        landmarks = detect_pose_landmarks(pose, frame, buffers, frame_index=frame_index)
+    
+    if duplicates is not None:
+        duplicates.remember(landmarks)
+    return landmarks
+
+# Fewest frames with a detected pose the exercise analyzers can work with
+MIN_POSE_FRAMES = 10
+
+# Quality ladder for deadline-aware analysis, from best quality to fastest.
+# Multipliers and caps are applied on top of the caller's optimization settings.
+QUALITY_LEVELS = [
+    {"name": "full", "frame_skip_multiplier": 1, "scale_factor": 1.0, "model_complexity": 2},
+    {"name": "reduced", "frame_skip_multiplier": 2, "scale_factor": 0.75, "model_complexity": 1},
+    {"name": "fast", "frame_skip_multiplier": 3, "scale_factor": 0.5, "model_complexity": 0},
+    {"name": "minimal", "frame_skip_multiplier": 5, "scale_factor": 0.35, "model_complexity": 0}
+]
+
+# Server-wide default processing deadline (seconds); unset means no deadline
+DEFAULT_ANALYSIS_DEADLINE = float(os.environ.get("ANALYSIS_DEADLINE_SECONDS", 0)) or None
+
+class DeadlineController:
+    """
+    Track processing throughput and pick a quality level that finishes on time.
+    Projects the total run time from the decode rate measured at the current
+    level, steps down the QUALITY_LEVELS ladder when the projection overshoots
+    the deadline, and steps back up when a better level is known to fit.
+    A run is never cut off before `min_frames` frames were sent to inference,
+    so even a tiny deadline yields something to analyze.
+    """
+    def __init__(self, deadline_seconds, start_time, check_interval=1.0, min_measure_time=0.5,
+                 min_frames=MIN_POSE_FRAMES, setup_seconds=0.0):
+        self.deadline_seconds = deadline_seconds
+        self.start_time = start_time
+        self.min_frames = min_frames
+        self.setup_seconds = setup_seconds  # Preflight and coarse pass, before the clock started
+        self.check_interval = check_interval
+        self.min_measure_time = min_measure_time  # Seconds of data needed before judging a level
+        self.level = 0
+        self.lowest_level = 0
+        self.level_start_time = None
+        self.level_start_frame = None
+        self.last_check = 0.0
+        self.throughput = {}  # Level index -> measured frames per second
+        self.changes = []
+        self.truncated = False
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def expired(self, sampled_frames=None):
+        """
+        True once the deadline has passed (and at least `min_frames` of
+        `sampled_frames` went to inference); the caller should stop and analyze what it has.
+        """
+        if sampled_frames is not None and sampled_frames < self.min_frames:
+            return False
+        if self.elapsed() > self.deadline_seconds:
+            self.truncated = True
+        return self.truncated
+
+    def update(self, frame_index, end_frame):
+        """
+        Called for every decoded frame. Returns the new QUALITY_LEVELS entry when
+        the level changes, otherwise None.
+        """
+        now = time.time()
+        if self.level_start_time is None:
+            self.level_start_time = now
+            self.level_start_frame = frame_index
+            return None
+
+        if now - self.last_check < self.check_interval:
+            return None
+        self.last_check = now
+
+        measured_time = now - self.level_start_time
+        if measured_time < self.min_measure_time or frame_index <= self.level_start_frame:
+            return None
+
+        rate = (frame_index - self.level_start_frame) / measured_time
+        self.throughput[self.level] = rate
+
+        remaining_frames = end_frame - frame_index
+        if remaining_frames == float('inf'):
+            return None  # Unknown length, nothing to plan against
+
+        elapsed = now - self.start_time
+        projected = elapsed + remaining_frames / rate
+
+        new_level = self.level
+        if projected > self.deadline_seconds * 0.9 and self.level < len(QUALITY_LEVELS) - 1:
+            new_level = self.level + 1
+        elif self.level > 0 and (self.level - 1) in self.throughput:
+            # Only step back up when the better level's known speed still fits comfortably
+            if elapsed + remaining_frames / self.throughput[self.level - 1] < self.deadline_seconds * 0.7:
+                new_level = self.level - 1
+
+        if new_level == self.level:
+            return None
+
+        self.changes.append({
+            "frame": frame_index,
+            "elapsed_seconds": round(elapsed, 2),
+            "from": QUALITY_LEVELS[self.level]["name"],
+            "to": QUALITY_LEVELS[new_level]["name"]
+        })
+        self.level = new_level
+        self.lowest_level = max(self.lowest_level, new_level)
+        self.level_start_time = now
+        self.level_start_frame = frame_index
+        return QUALITY_LEVELS[new_level]
+
+    def report(self):
+        elapsed = self.elapsed()
+        return {
+            "deadline_seconds": self.deadline_seconds,
+            "setup_seconds": round(self.setup_seconds, 3),
+            "final_level": QUALITY_LEVELS[self.level]["name"],
+            "lowest_level": QUALITY_LEVELS[self.lowest_level]["name"],
+            "level_changes": self.changes,
+            "truncated": self.truncated,
+            "met_deadline": elapsed <= self.deadline_seconds
+        }
+
+class FramePipeline:
+    """
+    Run decoding, pose inference and analysis bookkeeping as overlapping stages.
+    A decoder thread pulls items from `frame_source`, one or more inference
+    workers run `infer(worker_state, item)` on them, and the calling thread
+    iterates over (item, result) pairs in source order. Both queues are bounded,
+    so a decoder that outruns inference blocks instead of buffering the video.
+    With workers=0 everything runs inline on the calling thread.
+    """
+    _DONE = object()
+
+    def __init__(self, frame_source, infer, workers=1, queue_size=8,
+                 create_worker_state=None, close_worker_state=None):
+        self.frame_source = frame_source
+        self.infer = infer
+        self.workers = max(0, int(workers))
+        self.queue_size = max(1, int(queue_size))
+        self.create_worker_state = create_worker_state or (lambda: None)
+        self.close_worker_state = close_worker_state or (lambda state: None)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.metrics = {
+            "frames": 0,
+            "decode_seconds": 0.0,
+            "decode_blocked_seconds": 0.0,  # Backpressure: decoder waiting on a full queue
+            "inference_seconds": 0.0,
+            "inference_idle_seconds": 0.0,  # Workers waiting on an empty queue
+            "consumer_wait_seconds": 0.0,
+            "frame_queue_occupancy": 0,
+            "result_queue_occupancy": 0,
+            "occupancy_samples": 0
+        }
+        self.wall_seconds = 0.0
+
+    def _add(self, key, value):
+        with self.lock:
+            self.metrics[key] += value
+
+    def _put(self, target_queue, value, blocked_key=None):
+        started = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                target_queue.put(value, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        if blocked_key:
+            self._add(blocked_key, time.perf_counter() - started)
+
+    def _get(self, source_queue, idle_key):
+        started = time.perf_counter()
+        while not self.stop_event.is_set():
+            try:
+                value = source_queue.get(timeout=0.1)
+                self._add(idle_key, time.perf_counter() - started)
+                return value
+            except queue.Empty:
+                continue
+        return self._DONE
+
+    def _decode(self):
+        try:
+            iterator = iter(self.frame_source)
+            sequence = 0
+            while not self.stop_event.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self._add("decode_seconds", time.perf_counter() - started)
+
+                with self.lock:
+                    self.metrics["frame_queue_occupancy"] += self.frame_queue.qsize()
+                    self.metrics["result_queue_occupancy"] += self.result_queue.qsize()
+                    self.metrics["occupancy_samples"] += 1
+                self._put(self.frame_queue, (sequence, item), "decode_blocked_seconds")
+                sequence += 1
+        except Exception as e:
+            self._put(self.result_queue, e)
+        finally:
+            for _ in range(self.workers):
+                self._put(self.frame_queue, self._DONE)
+
+    def _work(self):
+        state = None
+        try:
+            state = self.create_worker_state()
+            while True:
+                message = self._get(self.frame_queue, "inference_idle_seconds")
+                if message is self._DONE:
+                    break
+                sequence, item = message
+                started = time.perf_counter()
+                result = self.infer(state, item)
+                self._add("inference_seconds", time.perf_counter() - started)
+                self._put(self.result_queue, (sequence, item, result))
+        except Exception as e:
+            self._put(self.result_queue, e)
+        finally:
+            if state is not None:
+                self.close_worker_state(state)
+            self._put(self.result_queue, self._DONE)
+
+    def __iter__(self):
+        started = time.perf_counter()
+        try:
+            if self.workers == 0:
+                yield from self._run_inline()
+            else:
+                yield from self._run_threaded()
+        finally:
+            self.wall_seconds = time.perf_counter() - started
+
+    def _run_inline(self):
+        state = self.create_worker_state()
+        try:
+            iterator = iter(self.frame_source)
+            while True:
+                step_started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                inference_started = time.perf_counter()
+                self.metrics["decode_seconds"] += inference_started - step_started
+                result = self.infer(state, item)
+                self.metrics["inference_seconds"] += time.perf_counter() - inference_started
+                self.metrics["frames"] += 1
+                yield item, result
+        finally:
+            self.close_worker_state(state)
+
+    def _run_threaded(self):
+        self.frame_queue = queue.Queue(maxsize=self.queue_size)
+        self.result_queue = queue.Queue(maxsize=self.queue_size)
+        threads = [threading.Thread(target=self._decode, name="pipeline-decoder", daemon=True)]
+        threads += [threading.Thread(target=self._work, name=f"pipeline-inference-{i}", daemon=True)
+                    for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            # Workers may finish out of order; release results in source order
+            pending = {}
+            next_sequence = 0
+            finished_workers = 0
+            while finished_workers < self.workers:
+                message = self._get(self.result_queue, "consumer_wait_seconds")
+                if message is self._DONE:
+                    finished_workers += 1
+                    continue
+                if isinstance(message, Exception):
+                    raise message
+
+                sequence, item, result = message
+                pending[sequence] = (item, result)
+                while next_sequence in pending:
+                    self.metrics["frames"] += 1
+                    yield pending.pop(next_sequence)
+                    next_sequence += 1
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def report(self):
+        """
+        Stage timings and queue occupancy for processing_metadata.
+        """
+        samples = self.metrics["occupancy_samples"]
+        busy = self.metrics["inference_seconds"] / self.workers if self.workers else self.metrics["inference_seconds"]
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "frames": self.metrics["frames"],
+            "wall_seconds": round(self.wall_seconds, 3),
+            "decode_seconds": round(self.metrics["decode_seconds"], 3),
+            "decode_blocked_seconds": round(self.metrics["decode_blocked_seconds"], 3),
+            "inference_seconds": round(self.metrics["inference_seconds"], 3),
+            "inference_idle_seconds": round(self.metrics["inference_idle_seconds"], 3),
+            "consumer_wait_seconds": round(self.metrics["consumer_wait_seconds"], 3),
+            "decode_occupancy": round(self.metrics["decode_seconds"] / self.wall_seconds, 3) if self.wall_seconds else 0,
+            "inference_occupancy": round(busy / self.wall_seconds, 3) if self.wall_seconds else 0,
+            "mean_frame_queue_length": round(self.metrics["frame_queue_occupancy"] / samples, 2) if samples else 0,
+            "mean_result_queue_length": round(self.metrics["result_queue_occupancy"] / samples, 2) if samples else 0
+        }
+
+class SharedFrameRing:
+    """
+    Preallocated frame slots in shared memory. The decoder copies each frame
+    into a slot once and inference processes map the same memory, reading the
+    frame in place instead of receiving a pickled copy. A per-slot sequence
+    header lets a reader detect that its slot was overwritten under it.
+    """
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        header_bytes = slots * 8
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + slots * slot_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.headers = np.ndarray((slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((slots, slot_bytes), dtype=np.uint8, buffer=self.shm.buf, offset=header_bytes)
+        if self.owner:
+            self.headers[:] = -1
+
+    @property
+    def spec(self):
+        return {"name": self.shm.name, "slots": self.slots, "slot_bytes": self.slot_bytes}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec["slots"], spec["slot_bytes"], name=spec["name"])
+
+    def write(self, slot, frame, sequence):
+        # Invalidate the slot first so a concurrent reader sees the change
+        self.headers[slot] = -1
+        np.copyto(self.data[slot, :frame.nbytes].reshape(frame.shape), frame)
+        self.headers[slot] = sequence
+
+    def view(self, slot, shape):
+        return self.data[slot, :int(np.prod(shape))].reshape(shape)
+
+    def is_current(self, slot, sequence):
+        return int(self.headers[slot]) == sequence
+
+    def close(self):
+        # Views must be gone before the mapping can be closed
+        self.headers = None
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+def shared_memory_inference_worker(ring_spec, index_queue, result_queue, settings):
+    """
+    Inference process: read frames from the shared ring in place and send back landmarks.
+    """
+    configure_process_threads()
+    ring = SharedFrameRing.attach(ring_spec)
+    buffers = FrameBuffers()
+    roi_tracker = RoiTracker(buffers=buffers) if settings.get("roi_tracking", False) else None
+    duplicates = create_duplicate_filter(settings)
+    pose = None
+    model_complexity = None
+    try:
+        while True:
+            message = index_queue.get()
+            if message is None:
+                break
+            sequence, slot, shape, complexity, frame_index = message
+
+            if complexity != model_complexity:
+                if pose is not None:
+                    pose.close()
+                pose = create_pose_backend(
+                    settings.get("pose_backend"),
+                    static_image_mode=settings.get("static_image_mode", False),
+                    model_complexity=complexity,
+                    min_detection_confidence=settings["confidence_threshold"],
+                    smooth_landmarks=settings.get("smooth_landmarks", True)
+                )
+                model_complexity = complexity
+
+            landmarks = None
+            current = ring.is_current(slot, sequence)
+            if current:
+                landmarks = infer_pose(pose, ring.view(slot, shape), roi_tracker, buffers, duplicates, frame_index)
+                # The decoder may have reused the slot while we were reading it
+                current = ring.is_current(slot, sequence)
+            result_queue.put(("frame", sequence, slot, landmarks if current else None, current))
+    finally:
+        if pose is not None:
+            pose.close()
+        result_queue.put(("done", {
+            "roi_tracking": roi_tracker.report() if roi_tracker is not None else None,
+            "frame_buffers": buffers.report(),
+            "duplicate_frames": duplicates.report() if duplicates is not None else None
+        }))
+        ring.close()
+
+class SharedMemoryFramePipeline:
+    """
+    FramePipeline variant whose inference workers are separate processes.
+    Frames travel through a SharedFrameRing; only (sequence, slot, shape)
+    tuples go through the index queue. `overrun` decides what the decoder does
+    when every slot is in use: "block" waits for a free slot, "drop" skips the
+    new frame, and "overwrite" reuses the oldest in-flight slot, discarding
+    the frame that was in it.
+    """
+    OVERRUN_POLICIES = ("block", "drop", "overwrite")
+
+    def __init__(self, frame_source, slot_bytes, settings, workers=1, slots=8, overrun="block"):
+        if overrun not in self.OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {overrun}")
+        self.frame_source = frame_source
+        self.slot_bytes = slot_bytes
+        self.settings = settings
+        self.workers = max(1, int(workers))
+        self.slots = max(1, int(slots))
+        self.overrun = overrun
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.worker_reports = []  # One dict of roi_tracking / frame_buffers / duplicate_frames reports per process
+        # Decoder-side resize target; the ring copies the frame out right away
+        self.buffers = FrameBuffers()
+        self.metrics = {
+            "frames": 0,
+            "frames_written": 0,
+            "dropped_frames": 0,
+            "overwritten_frames": 0,
+            "max_slots_in_flight": 0,
+            "decode_seconds": 0.0,
+            "slot_wait_seconds": 0.0,
+            "consumer_wait_seconds": 0.0
+        }
+        self.wall_seconds = 0.0
+
+    def _acquire_slot(self):
+        """
+        Free slot for the next frame, or None when the frame should be dropped.
+        """
+        started = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                with self.lock:
+                    if self.free_slots:
+                        return self.free_slots.popleft()
+                    if self.overrun == "drop":
+                        self.metrics["dropped_frames"] += 1
+                        return None
+                    if self.overrun == "overwrite":
+                        # Oldest in-flight slot; its reader will see a changed header
+                        slot = next(iter(self.in_flight))
+                        del self.in_flight[slot]
+                        return slot
+                time.sleep(0.002)
+            return None
+        finally:
+            self.metrics["slot_wait_seconds"] += time.perf_counter() - started
+
+    def _decode(self):
+        try:
+            iterator = iter(self.frame_source)
+            sequence = 0
+            while not self.stop_event.is_set():
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.metrics["decode_seconds"] += time.perf_counter() - started
+
+                slot = self._acquire_slot()
+                if slot is None:
+                    continue
+                frame = item["frame"]
+                scale_factor = item.get("scale_factor", 1.0)
+                if scale_factor != 1.0:
+                    h, w = frame.shape[:2]
+                    frame = self.buffers.resize(frame, (int(w * scale_factor), int(h * scale_factor)))
+                self.ring.write(slot, frame, sequence)
+                self.items[sequence] = {key: value for key, value in item.items() if key != "frame"}
+                with self.lock:
+                    self.in_flight[slot] = sequence
+                    self.metrics["max_slots_in_flight"] = max(self.metrics["max_slots_in_flight"], len(self.in_flight))
+                self.index_queue.put((sequence, slot, frame.shape, item.get("model_complexity", 1), item.get("frame_index")))
+                self.metrics["frames_written"] += 1
+                sequence += 1
+        except Exception as e:
+            self.decoder_error = e
+        finally:
+            for _ in range(self.workers):
+                self.index_queue.put(None)
+
+    def __iter__(self):
+        started = time.perf_counter()
+        context = multiprocessing.get_context("spawn")
+        self.ring = SharedFrameRing(self.slots, self.slot_bytes)
+        self.index_queue = context.Queue()
+        self.result_queue = context.Queue()
+        self.free_slots = deque(range(self.slots))
+        self.in_flight = {}
+        self.items = {}
+        self.decoder_error = None
+
+        processes = [
+            context.Process(
+                target=shared_memory_inference_worker,
+                args=(self.ring.spec, self.index_queue, self.result_queue, self.settings),
+                daemon=True
+            )
+            for _ in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+        decoder = threading.Thread(target=self._decode, name="ring-decoder", daemon=True)
+        decoder.start()
+
+        try:
+            # Release results in source order; overwritten frames are skipped
+            pending = {}
+            next_sequence = 0
+            finished_workers = 0
+            while finished_workers < self.workers:
+                wait_started = time.perf_counter()
+                try:
+                    message = self.result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    if any(process.exitcode not in (None, 0) for process in processes):
+                        raise RuntimeError("Inference process exited unexpectedly")
+                    continue
+                finally:
+                    self.metrics["consumer_wait_seconds"] += time.perf_counter() - wait_started
+
+                if message[0] == "done":
+                    finished_workers += 1
+                    self.worker_reports.append(message[1])
+                    continue
+
+                _, sequence, slot, landmarks, current = message
+                with self.lock:
+                    if self.in_flight.get(slot) == sequence:
+                        del self.in_flight[slot]
+                        self.free_slots.append(slot)
+                if not current:
+                    self.metrics["overwritten_frames"] += 1
+                pending[sequence] = (current, landmarks)
+
+                while next_sequence in pending:
+                    current, landmarks = pending.pop(next_sequence)
+                    item = self.items.pop(next_sequence)
+                    next_sequence += 1
+                    if current:
+                        self.metrics["frames"] += 1
+                        yield item, landmarks
+
+            if self.decoder_error is not None:
+                raise self.decoder_error
+        finally:
+            self.stop_event.set()
+            decoder.join()
+            for process in processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            self.ring.close()
+            self.wall_seconds = time.perf_counter() - started
+
+    def report(self):
+        """
+        Ring usage and stage timings for processing_metadata.
+        """
+        return {
+            "mode": "shared_memory",
+            "workers": self.workers,
+            "slots": self.slots,
+            "slot_bytes": self.slot_bytes,
+            "overrun": self.overrun,
+            "frames": self.metrics["frames"],
+            "frames_written": self.metrics["frames_written"],
+            "dropped_frames": self.metrics["dropped_frames"],
+            "overwritten_frames": self.metrics["overwritten_frames"],
+            "max_slots_in_flight": self.metrics["max_slots_in_flight"],
+            "wall_seconds": round(self.wall_seconds, 3),
+            "decode_seconds": round(self.metrics["decode_seconds"], 3),
+            "slot_wait_seconds": round(self.metrics["slot_wait_seconds"], 3),
+            "consumer_wait_seconds": round(self.metrics["consumer_wait_seconds"], 3)
+        }
+
+# Parallel segments are opt-in ("auto" or a count): each one is a process
+# with its own model. Set PARALLEL_SEGMENTS to change the default
+DEFAULT_PARALLEL_SEGMENTS = os.environ.get("PARALLEL_SEGMENTS", "1")
+
+class ProcessSlots:
+    """
+    This worker's budget of segment processes, shared by all of its concurrent
+    analyses. Each worker gets its share of the host (see
+    segment_process_budget), so together they can't oversubscribe its cores.
+    """
+    def __init__(self, limit):
+        self.limit = max(1, int(limit))
+        self.in_use = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, wanted):
+        """
+        Take up to `wanted` slots without waiting; returns how many were granted.
+        """
+        with self.lock:
+            granted = max(0, min(wanted, self.limit - self.in_use))
+            self.in_use += granted
+            return granted
+
+    def release(self, count):
+        with self.lock:
+            self.in_use = max(0, self.in_use - count)
+
+    def resize(self, limit):
+        with self.lock:
+            self.limit = max(1, int(limit))
+
+def segment_process_budget(worker_count=None):
+    """
+    Segment processes one of `worker_count` workers may run: its share of
+    SEGMENT_PROCESS_LIMIT (a host total), or by default one per
+    INFERENCE_THREADS-sized share of the CPUs it's allowed to use.
+    """
+    workers = worker_count or 1
+    if os.environ.get("SEGMENT_PROCESS_LIMIT"):
+        return max(1, int(os.environ["SEGMENT_PROCESS_LIMIT"]) // workers)
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    # WORKER_CPU_AFFINITY=auto already pinned this worker to its share
+    if not (WORKER_CPU_AFFINITY == "auto" and worker_count):
+        cpus //= workers
+    return max(1, cpus // (INFERENCE_THREADS or 1))
+
+# Sized again at startup, once the worker's CPU affinity and count are known
+segment_process_slots = ProcessSlots(segment_process_budget())
+
+def resolve_segment_count(setting, frame_count, fps, min_segment_seconds=30):
+    """
+    Number of parallel segments to split a video into.
+    "auto" uses up to this worker's segment budget but keeps segments at
+    least `min_segment_seconds` long, so short videos stay in a single process.
+    """
+    if setting == "auto":
+        if fps <= 0 or frame_count <= 0:
+            return 1
+        by_length = int(frame_count / (fps * min_segment_seconds))
+        return max(1, min(segment_process_slots.limit, by_length))
+    return max(1, int(setting or 1))
+
+def plan_video_segments(start_frame, end_frame, segment_count, overlap_frames):
+    """
+    Split [start_frame, end_frame) into `segment_count` ranges. Every segment
+    after the first starts `overlap_frames` early, so its tracker has warmed up
+    by the time the previous segment's range ends.
+    Returns a list of (segment_start, segment_end, own_start) tuples.
+    """
+    length = int(math.ceil((end_frame - start_frame) / segment_count))
+    segments = []
+    for k in range(segment_count):
+        own_start = start_frame + k * length
+        if own_start >= end_frame:
+            break
+        segment_start = max(start_frame, own_start - overlap_frames) if k > 0 else own_start
+        segments.append((segment_start, min(end_frame, own_start + length), own_start))
+    return segments
+
+# Set in segment worker processes when the analysis they work for is cancelled
+SEGMENT_CANCEL_EVENT = None
+
+def init_segment_worker(cancel_event):
+    """
+    Segment worker initializer: keep the analysis's cross-process cancel event.
+    """
+    global SEGMENT_CANCEL_EVENT
+    SEGMENT_CANCEL_EVENT = cancel_event
+
+def process_video_segment(video_path, start_frame, end_frame, settings):
+    """
+    Worker-process entry point: pose landmarks for frames in [start_frame, end_frame).
+    Each call owns its own video reader and Pose instance. Frames are sampled on
+    global frame indices so overlapping segments sample the same frames.
+    """
+    configure_process_threads()
+    started = time.time()
+    frame_skip = settings["frame_skip"]
+    scale_factor = settings["scale_factor"]
+    buffers = FrameBuffers()
+    roi_tracker = RoiTracker(buffers=buffers) if settings.get("roi_tracking", False) else None
+    duplicates = create_duplicate_filter(settings)
+    track = []
+    decoded = 0
+
+    cap = open_video_reader(video_path, settings.get("decode_short_side"))
+    try:
+        with create_pose_backend(
+            settings.get("pose_backend"),
+            static_image_mode=False,
+            model_complexity=settings.get("model_complexity", 1),
+            min_detection_confidence=settings["confidence_threshold"],
+            smooth_landmarks=settings.get("smooth_landmarks", True)
+        ) as pose:
+            if start_frame > 0:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+            frame_index = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+
+            while frame_index < end_frame:
+                if SEGMENT_CANCEL_EVENT is not None and SEGMENT_CANCEL_EVENT.is_set():
+                    raise AnalysisCancelled()
+                if frame_index % frame_skip != 0:
+                    if not cap.grab():
+                        break
+                    decoded += 1
+                    frame_index += 1
+                    continue
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                decoded += 1
+
+                if scale_factor != 1.0:
+                    h, w = frame.shape[:2]
+                    frame = buffers.resize(frame, (int(w * scale_factor), int(h * scale_factor)))
+
+                track.append((frame_index, infer_pose(pose, frame, roi_tracker, buffers, duplicates, frame_index)))
+                frame_index += 1
+    finally:
+        cap.release()
+
+    return {
+        "track": track,
+        "decoded": decoded,
+        "sampled": len(track),
+        "seconds": time.time() - started,
+        "frame_buffers": buffers.report(),
+        "duplicate_frames": duplicates.report() if duplicates is not None else None
+    }
+
+def stitch_segment_tracks(segment_tracks, segments):
+    """
+    Merge per-segment landmark tracks into one track ordered by frame.
+    Inside each overlap the earlier segment (tracking already settled) is
+    cross-faded into the later one (tracking just re-initialized after the seek),
+    so the re-initialization doesn't show up as a jump in the landmarks.
+    """
+    merged = {}
+    for k, track in enumerate(segment_tracks):
+        overlap_start, overlap_end = segments[k][0], segments[k][2]
+        for frame_index, landmarks in track:
+            if frame_index not in merged:
+                merged[frame_index] = landmarks
+                continue
+
+            previous = merged[frame_index]
+            if landmarks is None:
+                continue
+            if previous is None or overlap_end <= overlap_start:
+                merged[frame_index] = landmarks
+                continue
+
+            weight = (frame_index - overlap_start + 1) / (overlap_end - overlap_start + 1)
+            merged[frame_index] = [
+                {
+                    key: old[key] * (1 - weight) + new[key] * weight
+                    for key in ("x", "y", "z", "visibility")
+                }
+                for old, new in zip(previous, landmarks)
+            ]
+
+    return sorted(merged.items())
+
+def run_parallel_segments(video_path, start_frame, end_frame, segment_count, fps, settings, cancel_token=None):
+    """
+    Process a long video as overlapping segments in separate worker processes
+    and stitch the landmark tracks back together. Cancelling `cancel_token`
+    stops the workers at their next frame and raises AnalysisCancelled.
+    """
+    overlap_frames = int(fps) if fps > 0 else 30  # ~1 second for tracking to settle
+    segments = plan_video_segments(start_frame, end_frame, segment_count, overlap_frames)
+    started = time.time()
+
+    # Spawned (not forked) workers: forking a process that already runs
+    # MediaPipe and OpenCV threads is not safe
+    context = multiprocessing.get_context("spawn")
+    cancel_event = context.Event()
+    with ProcessPoolExecutor(max_workers=len(segments), mp_context=context,
+                             initializer=init_segment_worker, initargs=(cancel_event,)) as executor:
+        futures = [
+            executor.submit(process_video_segment, video_path, segment_start, segment_end, settings)
+            for segment_start, segment_end, _ in segments
+        ]
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.25)
+            if cancel_token is not None and cancel_token.cancelled():
+                # Leaving the block waits for the workers, which stop within a frame
+                cancel_event.set()
+                raise AnalysisCancelled()
+        outputs = [future.result() for future in futures]
+
+    track = stitch_segment_tracks([output["track"] for output in outputs], segments)
+    metadata = {
+        "segments": len(segments),
+        "overlap_frames": overlap_frames,
+        "wall_seconds": round(time.time() - started, 3),
+        "segment_seconds": [round(output["seconds"], 3) for output in outputs],
+        "decoded_frames": sum(output["decoded"] for output in outputs),
+        "sampled_frames": sum(output["sampled"] for output in outputs),
+        "frame_buffers": merge_buffer_reports([output["frame_buffers"] for output in outputs])
+    }
+    duplicate_reports = [output["duplicate_frames"] for output in outputs if output["duplicate_frames"] is not None]
+    if duplicate_reports:
+        metadata["duplicate_frames"] = merge_duplicate_reports(duplicate_reports)
+    return track, metadata
+
+def find_active_segment(video_path, coarse_interval=None, coarse_short_side=192, backend=None, cancel_token=None):
+    """
+    Fast first pass over a video to locate the active exercise segment.
+    Runs the lightest pose model on sparse, low-resolution frames and keeps the
+    longest stretch where the user is on all fours, trimming the walk-in at the
+    start and the reach for the phone at the end. Also returns approximate rep
+    turning points (hip extrema) so the second pass can sample densely there.
+    Returns None if no active segment was found.
+    """
+    start_time = time.time()
+    cap = open_video_reader(video_path, coarse_short_side)
+    if not cap.isOpened():
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps <= 0:
+        fps = 30
+    if coarse_interval is None:
+        coarse_interval = max(1, int(round(fps / 3)))  # ~3 samples per second
+
+    samples = []  # (frame_index, is_active, hip_y)
+
+    try:
+        with create_pose_backend(
+            backend,
+            static_image_mode=False,
+            model_complexity=0,
+            min_detection_confidence=0.3,
+            min_tracking_confidence=0.3
+        ) as pose:
+            frame_index = 0
+            while True:
+                # grab() skips color conversion and copying for frames we don't sample
+                if frame_index % coarse_interval != 0:
+                    if not cap.grab():
+                        break
+                    frame_index += 1
+                    continue
+
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if cancel_token is not None and cancel_token.cancelled():
+                    raise AnalysisCancelled()
+
+                landmarks = pose.infer(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), frame_index)
+
+                is_active = False
+                hip_y = None
+                if landmarks:
+                    shoulders = (landmarks[PoseLandmark.LEFT_SHOULDER.value],
+                                 landmarks[PoseLandmark.RIGHT_SHOULDER.value])
+                    hips = (landmarks[PoseLandmark.LEFT_HIP.value],
+                            landmarks[PoseLandmark.RIGHT_HIP.value])
+                    knees = (landmarks[PoseLandmark.LEFT_KNEE.value],
+                             landmarks[PoseLandmark.RIGHT_KNEE.value])
+
+                    visibility = np.mean([l["visibility"] for l in shoulders + hips + knees])
+                    shoulder_y = (shoulders[0]["y"] + shoulders[1]["y"]) / 2
+                    hip_y = (hips[0]["y"] + hips[1]["y"]) / 2
+
+                    # On all fours the torso is roughly horizontal; standing or walking it is vertical
+                    is_active = visibility > 0.5 and abs(shoulder_y - hip_y) < 0.25
+
+                samples.append((frame_index, is_active, hip_y))
+                frame_index += 1
+    finally:
+        cap.release()
+
+    # Longest run of active samples, tolerating a couple of missed detections
+    max_gap = 2
+    best_run = None
+    run_start = None
+    last_active = None
+    for i, (_, is_active, _) in enumerate(samples):
+        if not is_active:
+            continue
+        if run_start is None or i - last_active > max_gap + 1:
+            run_start = i
+        last_active = i
+        if best_run is None or (last_active - run_start) > (best_run[1] - best_run[0]):
+            best_run = (run_start, last_active)
+
+    if best_run is None:
+        return None
+
+    # Pad by one coarse step on each side so the edges of the exercise aren't cut
+    start_frame = max(0, samples[best_run[0]][0] - coarse_interval)
+    end_frame = min(frame_index - 1, samples[best_run[1]][0] + coarse_interval)
+
+    # Approximate rep boundaries from extrema of the smoothed hip height
+    active = [(idx, hip_y) for idx, is_active, hip_y in samples[best_run[0]:best_run[1] + 1]
+              if is_active and hip_y is not None]
+    smoothed = moving_average([hip_y for _, hip_y in active], 3)
+    turning_points = [
+        active[i][0] for i in range(1, len(smoothed) - 1)
+        if (smoothed[i-1] < smoothed[i] > smoothed[i+1]) or (smoothed[i-1] > smoothed[i] < smoothed[i+1])
+    ]
+
+    return {
+        "start_frame": start_frame,
+        "end_frame": end_frame,
+        "total_frames": frame_index,
+        "turning_points": turning_points,
+        "coarse_interval": coarse_interval,
+        "coarse_samples": len(samples),
+        "elapsed_seconds": time.time() - start_time
+    }
+
+def process_video_async(video_path, exercise_type, analysis_id, optimization_settings=None):
+    """
+    Process video analysis asynchronously.
+    This function is called in a background task. A cancelled analysis stops
+    at its next frame, releases its resources and ends up with status "cancelled".
+    """
+    # Keep the estimate recorded at submission so it can be checked against reality
+    estimate = analysis_results.get(analysis_id, {}).get("estimate")
+    cancel_token = cancellations.token(analysis_id)
+    cancelled = False
+    heartbeat = start_heartbeat(analysis_id)
+    
+    try:
+        # Cancelled while still queued
+        cancel_token.check()
+        
+        # Update status to processing
+        concurrent_jobs = count_active_analyses()
+        start_time = time.time()
+        # Patched rather than replaced, so a cancel marker written meanwhile survives
+        analysis_results.patch(
+            analysis_id,
+            status="processing",
+            progress=0,
+            message="Starting video analysis...",
+            started_at=start_time
+        )
         
         # Run optimized analysis
-        results = analyze_exercise(video_path, exercise_type, optimization_settings)
+        results = analyze_exercise(video_path, exercise_type, optimization_settings, analysis_id, cancel_token)
         
         # Calculate processing time
         processing_time = time.time() - start_time
@@ -920,21 +4142,40 @@ def process_video_async(video_path, exercise_type, analysis_id, optimization_set
             
             results["processing_metadata"]["processing_time_seconds"] = processing_time
             
+            # Calibrate the estimator with the measured throughput
+            if estimate:
+                processing_estimator.record(
+                    estimate["frame_count"],
+                    estimate["optimization_level"],
+                    estimate["short_side"],
+                    estimate["model_complexity"],
+                    concurrent_jobs,
+                    processing_time,
+                    estimate["estimated_time"]
+                )
+                estimate["actual_time"] = round(processing_time, 2)
+                estimate["error_seconds"] = round(estimate["estimated_time"] - processing_time, 2)
+            
             # Update status to completed
             analysis_results[analysis_id] = {
                 "status": "completed",
                 "progress": 100,
                 "results": results,
-                "message": "Video analysis completed successfully."
+                "message": "Video analysis completed successfully.",
+                "estimate": estimate
             }
         else:
             # Update status to error
             analysis_results[analysis_id] = {
                 "status": "error",
                 "progress": 100,
-                "message": "Error analyzing video: No results produced."
+                "message": "Error analyzing video: No results produced.",
+                "estimate": estimate
             }
     
+    except AnalysisCancelled:
+        cancelled = True
+    
     except Exception as e:
         print(f"Error in async video processing: {e}")
         traceback.print_exc()
@@ -943,177 +4184,466 @@ def process_video_async(video_path, exercise_type, analysis_id, optimization_set
         analysis_results[analysis_id] = {
             "status": "error",
             "progress": 100,
-            "message": f"Error analyzing video: {str(e)}"
+            "message": f"Error analyzing video: {str(e)}",
+            "estimate": estimate
         }
     
     finally:
+        heartbeat.set()
         # Cleanup: delete the temporary video file
         try:
             if os.path.exists(video_path):
                 os.remove(video_path)
         except Exception as e:
             print(f"Error cleaning up temporary file: {e}")
+        
+        # Latency covers everything up to here: Pose instances, workers and the temp file are released
+        latency = cancellations.release(analysis_id, cancelled)
+        if cancelled:
+            print(f"Analysis {analysis_id} cancelled; stopped after {latency or 0:.3f}s")
+            analysis_results.patch(
+                analysis_id,
+                status="cancelled",
+                message="Video analysis cancelled.",
+                cancellation_latency_seconds=round(latency, 3) if latency is not None else None
+            )
 
-def analyze_exercise(video_path, exercise_type, optimization_settings=None):
+def analyze_exercise(video_path, exercise_type, optimization_settings=None, analysis_id=None, cancel_token=None):
     """
     Analyze exercise video with optimized performance settings.
+    Decoding, pose inference and landmark bookkeeping run as a pipeline of
+    overlapping stages (see FramePipeline). Raises AnalysisCancelled soon after
+    `cancel_token` is cancelled; the pipelines close their Pose instances on the way out.
     """
     if optimization_settings is None:
         optimization_settings = {
             "frame_skip": 1,
             "scale_factor": 1.0,
             "max_frames": float('inf'),
-            "confidence_threshold": 0.2
+            "confidence_threshold": 0.2,
+            "adaptive_sampling": True,
+            "two_pass": True,
+            "roi_tracking": True,
+            "pipeline_workers": 1,
+            "parallel_segments": DEFAULT_PARALLEL_SEGMENTS,
+            "skip_duplicates": True,
+            "absence_backoff": True,
+            "preflight": True
         }
     
-    # Initialize MediaPipe Pose
-    mp_pose = mp.solutions.pose
+    setup_started = time.time()
+    
+    # Reject dark, blurry or empty recordings before any pose inference
+    preflight = None
+    if optimization_settings.get("preflight", False):
+        if analysis_id:
+            analysis_results.patch(analysis_id, message="Checking video quality...")
+        preflight = preflight_video_quality(video_path)
+        if cancel_token is not None:
+            cancel_token.check()
+        if preflight is not None and not preflight["usable"]:
+            return {
+                "feedback": preflight["issues"],
+                "feedback_points": [],
+                "summary": "Unable to analyze exercise due to poor video quality.",
+                "processing_metadata": {"preflight": preflight}
+            }
+    
+    # Coarse first pass: find the active exercise segment so the full-quality
+    # pass skips the walk-in and walk-out footage
+    segment = None
+    if optimization_settings.get("two_pass", False):
+        if analysis_id:
+            analysis_results.patch(analysis_id, message="Locating exercise segment...")
+        segment = find_active_segment(video_path, backend=optimization_settings.get("pose_backend"),
+                                      cancel_token=cancel_token)
+    
     pose_confidence = optimization_settings["confidence_threshold"]
+    base_frame_skip = optimization_settings["frame_skip"]
+    base_scale_factor = optimization_settings["scale_factor"]
+    base_model_complexity = optimization_settings.get("model_complexity", 1)
+    roi_tracking = optimization_settings.get("roi_tracking", False)
+    pose_backend = optimization_settings.get("pose_backend") or DEFAULT_POSE_BACKEND
+    # MediaPipe's temporal tracking needs frames in order, so parallel workers
+    # each detect independently (static image mode)
+    workers = optimization_settings.get("pipeline_workers", 1)
     
-    with mp_pose.Pose(
-        static_image_mode=False,
-        model_complexity=1,  # Use simpler model (0, 1, or 2)
-        min_detection_confidence=pose_confidence,
-        smooth_landmarks=True
-    ) as pose:
-        # Open video
-        cap = cv2.VideoCapture(video_path)
-        if not cap.isOpened():
-            return None
-        
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        frame_skip = optimization_settings["frame_skip"]
-        scale_factor = optimization_settings["scale_factor"]
-        max_frames = optimization_settings["max_frames"]
-        
-        # Store pose data for each processed frame
-        frame_data = []
-        frame_index = 0
-        processed_count = 0
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # Open video, downscaling in the decoder when a target size is set
+    cap = open_video_reader(video_path, optimization_settings.get("decode_short_side"))
+    if not cap.isOpened():
+        return None
+    
+    decode_metadata = {
+        "decoder": getattr(cap, "decoder", "opencv"),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    }
+    
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    max_frames = optimization_settings["max_frames"]
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    # Motion-adaptive sampling spends at most the inference budget of fixed
+    # frame skipping, concentrated on the moving parts of the video (clips that
+    # stay still throughout leave some of it unspent)
+    sampler = None
+    if optimization_settings.get("adaptive_sampling", False):
+        sampler = AdaptiveFrameSampler(base_interval=base_frame_skip)
+    
+    # Back off sampling while nobody is in frame
+    absence = None
+    if optimization_settings.get("absence_backoff", False):
+        max_gap_seconds = optimization_settings.get("absence_max_gap_seconds", 1.0)
+        absence = AbsenceBackoff(
+            base_gap=base_frame_skip,
+            max_gap=int(fps * max_gap_seconds) if fps > 0 else 30
+        )
+    
+    # Restrict the second pass to the active segment, sampling every frame
+    # close to the rep turning points found by the coarse pass
+    start_frame = 0
+    end_frame = max_frames
+    dense_ranges = []
+    if segment is not None:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, segment["start_frame"])
+        start_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        end_frame = min(max_frames, segment["end_frame"] + 1)
+        dense_window = segment["coarse_interval"]
+        dense_ranges = [(tp - dense_window, tp + dense_window) for tp in segment["turning_points"]]
+    
+    # Deadline-aware runs adapt quality mid-run. The clock starts here, after
+    # the preflight and the coarse pass, so they can't use up the budget
+    deadline = None
+    if optimization_settings.get("deadline_seconds"):
+        deadline = DeadlineController(optimization_settings["deadline_seconds"], time.time(),
+                                      setup_seconds=time.time() - setup_started)
+    
+    # Long videos are split into overlapping segments that run in parallel
+    # worker processes. Deadline control needs a single frame clock, so the
+    # two don't combine
+    segment_end = min(end_frame, total_frames) if total_frames > 0 else start_frame
+    segment_count = 1
+    requested_segments = 1
+    if deadline is None and segment_end > start_frame:
+        requested_segments = resolve_segment_count(
+            optimization_settings.get("parallel_segments", 1), segment_end - start_frame, fps
+        )
+    # Concurrent jobs share one process budget; with fewer than two slots left
+    # the video is analyzed in this process instead
+    if requested_segments > 1:
+        segment_count = segment_process_slots.acquire(requested_segments)
+        if segment_count < 2:
+            segment_process_slots.release(segment_count)
+            segment_count = 1
+    
+    counters = {"decoded": 0, "sampled": 0, "frame_skip": base_frame_skip}
+    roi_reports = []
+    buffer_reports = []
+    duplicate_reports = []
+    memory = MemoryMonitor()
+    
+    def decode_sampled_frames():
+        """
+        Decoder stage: read frames and choose which ones go to pose inference.
+        """
+        frame_index = start_frame
+        frame_skip = base_frame_skip
+        scale_factor = base_scale_factor
+        model_complexity = base_model_complexity
         
-        # Process video frames
-        while cap.isOpened() and frame_index < max_frames:
+        while cap.isOpened() and frame_index < end_frame:
+            # Raised here, in the decoder, the pipeline hands it to the consumer
+            # and shuts its inference workers down
+            if cancel_token is not None:
+                cancel_token.check()
+            dense = any(start <= frame_index <= end for start, end in dense_ranges)
+            
+            # Nobody in frame: grab without reading until the backoff gap passes
+            if absence is not None and not dense and not absence.allow(frame_index):
+                if not cap.grab():
+                    break
+                counters["decoded"] += 1
+                if sampler is not None:
+                    sampler.count_skipped()
+                frame_index += 1
+                continue
+            
             ret, frame = cap.read()
             if not ret:
                 break
+            counters["decoded"] += 1
             
-            # Skip frames according to optimization settings
-            if frame_index % frame_skip != 0:
-                frame_index += 1
-                continue
+            # Update progress every 30 frames
+            if frame_index % 30 == 0 and analysis_id and total_frames > 0:
+                progress = min(int(frame_index / total_frames * 90), 90)  # Max 90% for processing frames
+                analysis_results.patch(analysis_id, progress=progress,
+                                       message=f"Analyzing frame {frame_index}/{total_frames}...")
             
-            # Resize frame if needed
-            if scale_factor != 1.0:
-                h, w = frame.shape[:2]
-                new_h, new_w = int(h * scale_factor), int(w * scale_factor)
-                frame = cv2.resize(frame, (new_w, new_h))
+            # Trade quality for speed (or back) to finish within the deadline
+            if deadline is not None:
+                if deadline.expired(counters["sampled"]):
+                    break
+                level = deadline.update(frame_index, min(end_frame, total_frames) if total_frames > 0 else end_frame)
+                if level is not None:
+                    frame_skip = base_frame_skip * level["frame_skip_multiplier"]
+                    scale_factor = min(base_scale_factor, level["scale_factor"])
+                    model_complexity = min(base_model_complexity, level["model_complexity"])
+                    counters["frame_skip"] = frame_skip
+                    if sampler is not None:
+                        sampler.set_base_interval(frame_skip)
             
-            # Convert to RGB for MediaPipe
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Skip frames according to optimization settings, always sampling
+            # around rep turning points
+            if sampler is not None:
+                if not sampler.should_sample(frame, force=dense):
+                    frame_index += 1
+                    continue
+            elif not dense and frame_index % frame_skip != 0:
+                frame_index += 1
+                continue
             
-            # Process with MediaPipe
-            results = pose.process(rgb_frame)
+            counters["sampled"] += 1
             
-            if results.pose_landmarks:
-                # Create a copy of the frame for visualization
-                frame_vis = frame.copy()
-                
-                # Draw tracers from previous frames (ghost effect)
-                tracer_history = min(5, len(frame_data))  # Use last 5 frames for tracers
-                for i in range(tracer_history):
-                    if i < len(frame_data):
-                        prev_landmarks = frame_data[-(i+1)]["landmarks"]
-                        alpha = 0.2 + (0.8 * (i / tracer_history))  # Fade out older tracers
-                        
-                        # Draw connections
-                        for connection in mp.solutions.pose.POSE_CONNECTIONS:
-                            start_idx, end_idx = connection
-                            if (0 <= start_idx < len(prev_landmarks) and 
-                                0 <= end_idx < len(prev_landmarks)):
-                                start = prev_landmarks[start_idx]
-                                end = prev_landmarks[end_idx]
-                                if all(k in start and k in end for k in ['x', 'y']):
-                                    pt1 = (int(start['x'] * frame_vis.shape[1]), 
-                                           int(start['y'] * frame_vis.shape[0]))
-                                    pt2 = (int(end['x'] * frame_vis.shape[1]), 
-                                           int(end['y'] * frame_vis.shape[0]))
-                                    cv2.line(frame_vis, pt1, pt2, 
-                                            (0, 255, 0, int(255 * alpha * 0.5)), 
-                                            thickness=2, lineType=cv2.LINE_AA)
-                        
-                        # Draw landmarks
-                        for landmark in prev_landmarks:
-                            if 'x' in landmark and 'y' in landmark:
-                                center = (int(landmark['x'] * frame_vis.shape[1]), 
-                                         int(landmark['y'] * frame_vis.shape[0]))
-                                cv2.circle(frame_vis, center, 3, 
-                                          (0, 0, 255, int(255 * alpha * 0.7)), 
-                                          -1, lineType=cv2.LINE_AA)
-                
-                # Draw current pose (most prominent)
-                mp.solutions.drawing_utils.draw_landmarks(
-                    frame_vis,
-                    results.pose_landmarks,
-                    mp.solutions.pose.POSE_CONNECTIONS,
-                    landmark_drawing_spec=mp.solutions.drawing_utils.DrawingSpec(
-                        color=(0, 255, 0), thickness=2, circle_radius=2),
-                    connection_drawing_spec=mp.solutions.drawing_utils.DrawingSpec(
-                        color=(0, 255, 0), thickness=2)
-                )
-                
-                # Extract relevant landmark data
-                landmarks = results.pose_landmarks.landmark
+            # Resizing happens in the inference stage, into per-worker buffers
+            yield {
+                "frame_index": frame_index,
+                "frame": frame,
+                "dense": dense,
+                "scale_factor": scale_factor,
+                "model_complexity": model_complexity
+            }
+            frame_index += 1
+    
+    def create_worker_state():
+        buffers = FrameBuffers()
+        return {
+            "pose": None,
+            "model_complexity": None,
+            "buffers": buffers,
+            "roi_tracker": RoiTracker(buffers=buffers) if roi_tracking else None,
+            "duplicates": create_duplicate_filter(optimization_settings)
+        }
+    
+    def infer(state, item):
+        """
+        Inference stage: pose landmarks for one sampled frame.
+        """
+        # The decoder runs a queue ahead of inference, so frames it let through
+        # may have fallen into a backoff gap opened since
+        if absence is not None and not item["dense"] and not absence.allow(item["frame_index"]):
+            return None
+        
+        # (Re)create the model when the deadline controller changes its complexity
+        if state["model_complexity"] != item["model_complexity"]:
+            if state["pose"] is not None:
+                state["pose"].close()
+            state["pose"] = create_pose_backend(
+                pose_backend,
+                static_image_mode=workers > 1,
+                model_complexity=item["model_complexity"],  # Use simpler model (0, 1, or 2)
+                min_detection_confidence=pose_confidence,
+                smooth_landmarks=optimization_settings.get("smooth_landmarks", True)
+            )
+            state["model_complexity"] = item["model_complexity"]
+        
+        frame = item["frame"]
+        if item["scale_factor"] != 1.0:
+            h, w = frame.shape[:2]
+            frame = state["buffers"].resize(frame, (int(w * item["scale_factor"]), int(h * item["scale_factor"])))
+        
+        # Run pose detection, cropped to the tracked person when possible
+        landmarks = infer_pose(state["pose"], frame, state["roi_tracker"], state["buffers"], state["duplicates"],
+                               item["frame_index"])
+        # Observed here rather than in the consumer, so the decoder sees the gap
+        # before it has filled the queue with more empty frames
+        if absence is not None:
+            absence.observe(item["frame_index"], bool(landmarks))
+        return landmarks
+    
+    def close_worker_state(state):
+        buffer_reports.append(state["buffers"].report())
+        if state["duplicates"] is not None:
+            duplicate_reports.append(state["duplicates"].report())
+        if state["pose"] is not None:
+            state["pose"].close()
+        if state["roi_tracker"] is not None:
+            roi_reports.append(state["roi_tracker"].report())
+    
+    pipeline = None
+    segments_metadata = None
+    if segment_count > 1:
+        try:
+            cap.release()
+            if analysis_id:
+                analysis_results.patch(analysis_id, message=f"Analyzing {segment_count} video segments in parallel...")
+            # Segments sample on fixed global frame indices so their overlaps line up
+            sampler = None
+            absence = None
+            pose_track, segments_metadata = run_parallel_segments(
+                video_path, start_frame, segment_end, segment_count, fps,
+                dict(optimization_settings, model_complexity=base_model_complexity),
+                cancel_token=cancel_token
+            )
+        finally:
+            segment_process_slots.release(segment_count)
+        segments_metadata["requested_segments"] = requested_segments
+        counters["decoded"] = segments_metadata["decoded_frames"]
+        counters["sampled"] = segments_metadata["sampled_frames"]
+    elif optimization_settings.get("inference_processes", 0) > 0:
+        # Inference in separate processes, reading frames from a shared-memory
+        # ring sized for the largest decoded frame
+        inference_processes = optimization_settings["inference_processes"]
+        pipeline = SharedMemoryFramePipeline(
+            decode_sampled_frames(),
+            decode_metadata["width"] * decode_metadata["height"] * 3,
+            {
+                "confidence_threshold": pose_confidence,
+                "roi_tracking": roi_tracking,
+                "pose_backend": pose_backend,
+                "static_image_mode": inference_processes > 1,
+                "smooth_landmarks": optimization_settings.get("smooth_landmarks", True),
+                "skip_duplicates": optimization_settings.get("skip_duplicates", False),
+                "duplicate_threshold": optimization_settings.get("duplicate_threshold", 1.5),
+                "max_duplicate_reuses": duplicate_reuse_limit(optimization_settings)
+            },
+            workers=inference_processes,
+            slots=optimization_settings.get("frame_ring_slots", 8),
+            overrun=optimization_settings.get("frame_ring_overrun", "block")
+        )
+        pose_track = ((item["frame_index"], landmarks) for item, landmarks in pipeline)
+    else:
+        pipeline = FramePipeline(
+            decode_sampled_frames(),
+            infer,
+            workers=workers,
+            queue_size=optimization_settings.get("pipeline_queue_size", 8),
+            create_worker_state=create_worker_state,
+            close_worker_state=close_worker_state
+        )
+        pose_track = ((item["frame_index"], landmarks) for item, landmarks in pipeline)
+    
+    # Store pose data for each processed frame
+    frame_data = []
+    processed_count = 0
+    
+    try:
+        # Consumer stage: accumulate landmarks in frame order
+        for frame_index, landmarks in pose_track:
+            memory.sample()
+            # Inference in separate processes can't update the backoff itself
+            if absence is not None and isinstance(pipeline, SharedMemoryFramePipeline):
+                absence.observe(frame_index, bool(landmarks))
+            if landmarks:
                 time_sec = frame_index / fps
                 
                 # Store frame data with only necessary information
                 pose_data = {
                     "frame": processed_count,
                     "time": time_sec,
-                    "landmarks": [
-                        {
-                            "x": landmark.x,
-                            "y": landmark.y,
-                            "z": landmark.z,
-                            "visibility": landmark.visibility
-                        }
-                        for landmark in landmarks
-                    ]
+                    "landmarks": landmarks
                 }
                 frame_data.append(pose_data)
                 processed_count += 1
-            
-            # Update progress every 30 frames
-            if frame_index % 30 == 0 and analysis_id in analysis_results:
-                progress = min(int(frame_index / total_frames * 90), 90)  # Max 90% for processing frames
-                analysis_results[analysis_id]["progress"] = progress
-                analysis_results[analysis_id]["message"] = f"Analyzing frame {frame_index}/{total_frames}..."
-            
-            frame_index += 1
-        
+                
+                if sampler is not None:
+                    sampler.observe_landmarks(frame_index, landmarks)
+            elif sampler is not None:
+                sampler.observe_landmarks(frame_index, None)
+    finally:
         cap.release()
-        
-        # If we didn't get enough frames with pose data, return error
-        if len(frame_data) < 10:
-            return {
-                "feedback": ["Not enough pose data detected. Please try recording with better lighting or a clearer camera angle."],
-                "feedback_points": [],
-                "summary": "Unable to analyze exercise due to insufficient pose data."
-            }
-        
-        # Analyze the collected data based on exercise type
-        if exercise_type == ExerciseType.QUADRUPED:
-            return analyze_quadruped_rocking(frame_data, fps, frame_skip)
-        elif exercise_type == ExerciseType.TOE_DRIVE:
-            return analyze_toe_drive(frame_data, fps, frame_skip)
-        else:
-            return None
+    
+    frame_skip = counters["frame_skip"]
+    if isinstance(pipeline, SharedMemoryFramePipeline):
+        for report in pipeline.worker_reports:
+            if report["roi_tracking"] is not None:
+                roi_reports.append(report["roi_tracking"])
+            if report["duplicate_frames"] is not None:
+                duplicate_reports.append(report["duplicate_frames"])
+            buffer_reports.append(report["frame_buffers"])
+        buffer_reports.append(pipeline.buffers.report())
+    if segments_metadata is not None:
+        buffer_reports.append(segments_metadata.pop("frame_buffers"))
+        if "duplicate_frames" in segments_metadata:
+            duplicate_reports.append(segments_metadata.pop("duplicate_frames"))
+    
+    # Report how densely the video was actually sampled
+    if sampler is not None:
+        sampling_metadata = sampler.report(fps)
+    else:
+        rate = counters["sampled"] / counters["decoded"] if counters["decoded"] else 0
+        sampling_metadata = {
+            "mode": "fixed",
+            "base_interval": base_frame_skip,
+            "decoded_frames": counters["decoded"],
+            "sampled_frames": counters["sampled"],
+            "effective_sample_rate": round(rate, 4),
+            "effective_fps": round(rate * fps, 2) if fps else 0
+        }
+    
+    processing_metadata = {
+        "pose_backend": pose_backend,
+        "sampling": sampling_metadata,
+        "decode": decode_metadata,
+        "memory": memory.report(buffer_reports)
+    }
+    if pipeline is not None:
+        processing_metadata["pipeline"] = pipeline.report()
+    if segments_metadata is not None:
+        processing_metadata["segments"] = segments_metadata
+    if roi_reports:
+        roi_metadata = {
+            key: sum(report[key] for report in roi_reports)
+            for key in ("crop_inferences", "full_frame_inferences", "tracking_lost", "recentered")
+        }
+        total = roi_metadata["crop_inferences"] + roi_metadata["full_frame_inferences"]
+        roi_metadata["crop_rate"] = round(roi_metadata["crop_inferences"] / total, 4) if total else 0
+        processing_metadata["roi_tracking"] = roi_metadata
+    if "quality_tier" in optimization_settings:
+        processing_metadata["quality_tier"] = optimization_settings["quality_tier"]
+    if preflight is not None:
+        processing_metadata["preflight"] = preflight
+    if absence is not None:
+        processing_metadata["absence_backoff"] = absence.report()
+    if duplicate_reports:
+        processing_metadata["duplicate_frames"] = merge_duplicate_reports(duplicate_reports)
+    if deadline is not None:
+        processing_metadata["quality"] = deadline.report()
+    if segment is not None:
+        processing_metadata["two_pass"] = {
+            "active_segment": {
+                "start_time": segment["start_frame"] / fps if fps else 0,
+                "end_time": segment["end_frame"] / fps if fps else 0
+            },
+            "trimmed_frames": segment["total_frames"] - (segment["end_frame"] - segment["start_frame"] + 1),
+            "turning_points": len(segment["turning_points"]),
+            "coarse_samples": segment["coarse_samples"],
+            "coarse_pass_seconds": round(segment["elapsed_seconds"], 3)
+        }
+    
+    # If we didn't get enough frames with pose data, return error
+    if len(frame_data) < MIN_POSE_FRAMES:
+        return {
+            "feedback": ["Not enough pose data detected. Please try recording with better lighting or a clearer camera angle."],
+            "feedback_points": [],
+            "summary": "Unable to analyze exercise due to insufficient pose data.",
+            "processing_metadata": processing_metadata
+        }
+    
+    # Analyze the collected data based on exercise type
+    if exercise_type == ExerciseType.QUADRUPED:
+        results = analyze_quadruped_rocking(frame_data, fps, frame_skip)
+    elif exercise_type == ExerciseType.TOE_DRIVE:
+        results = analyze_toe_drive(frame_data, fps, frame_skip)
+    else:
+        return None
+    
+    results["processing_metadata"] = processing_metadata
+    return results
 
 def analyze_quadruped_rocking(frame_data, fps, frame_skip):
     """
     Analyze quadruped rocking exercise data with optimized analysis.
     """
-    mp_pose = mp.solutions.pose
     
     if not frame_data:
         return {
@@ -1124,18 +4654,18 @@ def analyze_quadruped_rocking(frame_data, fps, frame_skip):
     
     # Key landmarks to track for quadruped
     key_points = [
-        mp_pose.PoseLandmark.LEFT_SHOULDER.value,
-        mp_pose.PoseLandmark.RIGHT_SHOULDER.value,
-        mp_pose.PoseLandmark.LEFT_ELBOW.value,
-        mp_pose.PoseLandmark.RIGHT_ELBOW.value,
-        mp_pose.PoseLandmark.LEFT_WRIST.value,
-        mp_pose.PoseLandmark.RIGHT_WRIST.value,
-        mp_pose.PoseLandmark.LEFT_HIP.value,
-        mp_pose.PoseLandmark.RIGHT_HIP.value,
-        mp_pose.PoseLandmark.LEFT_KNEE.value,
-        mp_pose.PoseLandmark.RIGHT_KNEE.value,
-        mp_pose.PoseLandmark.LEFT_ANKLE.value,
-        mp_pose.PoseLandmark.RIGHT_ANKLE.value
+        PoseLandmark.LEFT_SHOULDER.value,
+        PoseLandmark.RIGHT_SHOULDER.value,
+        PoseLandmark.LEFT_ELBOW.value,
+        PoseLandmark.RIGHT_ELBOW.value,
+        PoseLandmark.LEFT_WRIST.value,
+        PoseLandmark.RIGHT_WRIST.value,
+        PoseLandmark.LEFT_HIP.value,
+        PoseLandmark.RIGHT_HIP.value,
+        PoseLandmark.LEFT_KNEE.value,
+        PoseLandmark.RIGHT_KNEE.value,
+        PoseLandmark.LEFT_ANKLE.value,
+        PoseLandmark.RIGHT_ANKLE.value
     ]
     
     # Extract movement data for key points
@@ -1146,8 +4676,8 @@ def analyze_quadruped_rocking(frame_data, fps, frame_skip):
         landmarks = frame["landmarks"]
         
         # Track hip position for movement analysis
-        left_hip = landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]
-        right_hip = landmarks[mp_pose.PoseLandmark.RIGHT_HIP.value]
+        left_hip = landmarks[PoseLandmark.LEFT_HIP.value]
+        right_hip = landmarks[PoseLandmark.RIGHT_HIP.value]
         
         # Average hip position
         avg_hip_x = (left_hip["x"] + right_hip["x"]) / 2
@@ -1161,12 +4691,12 @@ def analyze_quadruped_rocking(frame_data, fps, frame_skip):
         
         # Calculate relevant angles for this frame
         spine_angle = calculate_angle(
-            (landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]["x"], 
-             landmarks[mp_pose.PoseLandmark.LEFT_SHOULDER.value]["y"]),
-            (landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]["x"], 
-             landmarks[mp_pose.PoseLandmark.LEFT_HIP.value]["y"]),
-            (landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value]["x"], 
-             landmarks[mp_pose.PoseLandmark.LEFT_KNEE.value]["y"])
+            (landmarks[PoseLandmark.LEFT_SHOULDER.value]["x"], 
+             landmarks[PoseLandmark.LEFT_SHOULDER.value]["y"]),
+            (landmarks[PoseLandmark.LEFT_HIP.value]["x"], 
+             landmarks[PoseLandmark.LEFT_HIP.value]["y"]),
+            (landmarks[PoseLandmark.LEFT_KNEE.value]["x"], 
+             landmarks[PoseLandmark.LEFT_KNEE.value]["y"])
         )
         
         # Store movement data for this frame
@@ -1262,7 +4792,6 @@ def analyze_toe_drive(frame_data, fps, frame_skip):
     # Similar structure to analyze_quadruped_rocking, but specific to toe drive
     # This is a simplified implementation for optimization
     
-    mp_pose = mp.solutions.pose
     
     if not frame_data:
         return {
@@ -1273,271 +4802,774 @@ def analyze_toe_drive(frame_data, fps, frame_skip):
     
     # Extract movement data focusing on ankles and feet for toe drive
     ankle_positions = []
-    
-    for frame in frame_data:
-        landmarks = frame["landmarks"]
-        
-        # Track ankle positions for movement analysis
-        left_ankle = landmarks[mp_pose.PoseLandmark.LEFT_ANKLE.value]
-        right_ankle = landmarks[mp_pose.PoseLandmark.RIGHT_ANKLE.value]
-        left_foot = landmarks[mp_pose.PoseLandmark.LEFT_FOOT_INDEX.value]
-        right_foot = landmarks[mp_pose.PoseLandmark.RIGHT_FOOT_INDEX.value]
-        
-        # Check if toes are pointed (toe drive position)
-        left_toe_angle = calculate_angle(
-            (left_ankle["x"], left_ankle["y"]),
-            (left_foot["x"], left_foot["y"]),
-            (left_foot["x"], left_foot["y"] + 0.1)  # Vertical reference
-        )
-        
-        right_toe_angle = calculate_angle(
-            (right_ankle["x"], right_ankle["y"]),
-            (right_foot["x"], right_foot["y"]),
-            (right_foot["x"], right_foot["y"] + 0.1)  # Vertical reference
-        )
-        
-        # Average ankle position
-        avg_ankle_x = (left_ankle["x"] + right_ankle["x"]) / 2
-        avg_ankle_y = (left_ankle["y"] + right_ankle["y"]) / 2
-        
-        ankle_positions.append({
-            "time": frame["time"],
-            "x": avg_ankle_x,
-            "y": avg_ankle_y,
-            "left_toe_angle": left_toe_angle,
-            "right_toe_angle": right_toe_angle
-        })
-    
-    # Smooth the ankle position data
-    window_size = max(3, len(ankle_positions) // 20)
-    ankle_y_positions = [pos["y"] for pos in ankle_positions]
-    smoothed_y = moving_average(ankle_y_positions, window_size)
-    
-    # Detect movement cycles
-    cycles = detect_cycles(smoothed_y)
-    
-    # Generate feedback
-    feedback = []
-    feedback_points = []
-    
-    if cycles:
-        # Analyze each detected cycle
-        for i, (start_idx, end_idx) in enumerate(cycles):
-            start_time = ankle_positions[start_idx]["time"]
-            end_time = ankle_positions[end_idx]["time"]
-            
-            # Check toe pointing during the cycle
-            toe_angles = [(pos["left_toe_angle"] + pos["right_toe_angle"])/2 
-                         for pos in ankle_positions[start_idx:end_idx+1]]
-            
-            avg_toe_angle = sum(toe_angles) / len(toe_angles)
-            
-            rep_feedback = f"Repetition {i+1}: "
-            
-            if avg_toe_angle < 60:  # Toes not sufficiently pointed
-                rep_feedback += "Remember to point your toes more during toe drive."
-                feedback_points.append({
-                    "timestamp": start_time + (end_time - start_time) / 2,
-                    "message": "Point toes more"
-                })
-            else:
-                rep_feedback += "Good toe pointing during this repetition."
-                feedback_points.append({
-                    "timestamp": start_time + (end_time - start_time) / 2,
-                    "message": "✓ Good toe position"
-                })
-            
-            feedback.append(rep_feedback)
-    else:
-        feedback.append("Unable to detect clear toe drive movements. Try to rock forward and backward more distinctly with toes pointed.")
-    
-    # Generate summary
-    cycle_count = len(cycles)
-    
-    if cycle_count == 0:
-        summary = "No clear exercise repetitions detected. Try to make your movements more distinct with toes pointed."
-    else:
-        avg_duration = sum([(ankle_positions[end]["time"] - ankle_positions[start]["time"]) 
-                          for start, end in cycles]) / cycle_count
-        
-        # Calculate average toe angle across all cycles
-        all_toe_angles = []
-        for start, end in cycles:
-            cycle_angles = [(pos["left_toe_angle"] + pos["right_toe_angle"])/2 
-                           for pos in ankle_positions[start:end+1]]
-            all_toe_angles.extend(cycle_angles)
-        
-        avg_toe_angle = sum(all_toe_angles) / len(all_toe_angles) if all_toe_angles else 0
-        
-        toe_position = "good" if avg_toe_angle >= 60 else "needs improvement"
-        
-        summary = (
-            f"Completed {cycle_count} repetitions of toe drive. "
-            f"Average repetition duration: {avg_duration:.1f} seconds. "
-            f"Toe pointing: {toe_position}."
-        )
-    
-    return {
-        "feedback": feedback,
-        "feedback_points": feedback_points,
-        "summary": summary,
-        "repetitions": cycle_count
-    }
-
-def moving_average(data, window_size):
-    """
-    Apply a simple moving average to smooth data.
-    Optimized for performance.
-    """
-    if window_size <= 1 or len(data) <= window_size:
-        return data
-    
-    result = []
-    cumsum = [0]
-    for i, x in enumerate(data):
-        cumsum.append(cumsum[i] + x)
-        if i >= window_size:
-            result.append((cumsum[i+1] - cumsum[i+1-window_size]) / window_size)
-        else:
-            result.append((cumsum[i+1]) / (i+1))
-    
-    return result
-
-def detect_cycles(data):
-    """
-    Detect movement cycles in a time series.
-    Optimized to avoid excessive computation.
-    Returns pairs of (start_index, end_index) for each detected cycle.
-    """
-    if len(data) < 10:
-        return []
-    
-    # Find peaks (both high and low points)
-    # Simple peak detection without using external libraries
-    peaks = []
-    for i in range(1, len(data) - 1):
-        if (data[i-1] < data[i] and data[i] > data[i+1]) or (data[i-1] > data[i] and data[i] < data[i+1]):
-            peaks.append(i)
-    
-    # Need at least 3 peaks to have a complete cycle (start-peak-end)
-    if len(peaks) < 3:
-        return []
-    
-    # Group peaks into cycles
-    cycles = []
-    for i in range(0, len(peaks) - 2, 2):
-        # A cycle is from low point to low point
-        if i+2 < len(peaks):
-            cycles.append((peaks[i], peaks[i+2]))
-    
-    return cycles
-
-def calculate_angle(a, b, c):
-    """
-    Calculate angle between three points.
-    a, b, c are coordinates of three points (b is the vertex).
-    Returns angle in degrees.
-    """
-    # Calculate vectors
-    ba = (a[0] - b[0], a[1] - b[1])
-    bc = (c[0] - b[0], c[1] - b[1])
-    
-    # Calculate dot product
-    dot_product = ba[0] * bc[0] + ba[1] * bc[1]
-    
-    # Calculate magnitudes
-    magnitude_ba = math.sqrt(ba[0] ** 2 + ba[1] ** 2)
-    magnitude_bc = math.sqrt(bc[0] ** 2 + bc[1] ** 2)
-    
-    # Calculate angle in radians
-    try:
-        cos_angle = dot_product / (magnitude_ba * magnitude_bc)
-        # Clamp value to avoid numerical errors
-        cos_angle = max(min(cos_angle, 1.0), -1.0)
-        angle_rad = math.acos(cos_angle)
-    except:
-        return 0
-    
-    # Convert to degrees
-    angle_deg = math.degrees(angle_rad)
-    
-    return angle_deg
-
-# --- Static file serving ---
-# Create static directories for serving files
-current_dir = os.path.dirname(os.path.abspath(__file__))
-
-# Create a static directory in the app folder
-static_dir = os.path.join(current_dir, "static")
-os.makedirs(static_dir, exist_ok=True)
-
-# Mount static files
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
-
-@app.get("/{full_path:path}")
-async def serve_react_app(full_path: str):
-    # For API routes, we've already defined them above
-    # For anything else, we'll return the index.html from our static folder
-    index_path = os.path.join(current_dir, "static", "index.html")
-    
-    # If index.html doesn't exist in static folder, create a placeholder
-    if not os.path.exists(index_path):
-        with open(index_path, "w") as f:
-            f.write("""
-            <!DOCTYPE html>
-            <html>
-                <head>
-                    <title>AI Physical Therapy Assistant</title>
-                    <meta charset="UTF-8">
-                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-                </head>
-                <body>
-                    <h1>AI Physical Therapy Assistant API</h1>
-                    <p>This is the API server for the AI Physical Therapy Assistant. The React frontend should be served separately.</p>
-                    <p>Check documentation at <a href="/docs">/docs</a></p>
-                </body>
-            </html>
-            """)
-    
-    return FileResponse(index_path)
-
-@app.get("/api/analysis-status/{analysis_id}")
-async def get_analysis_status(analysis_id: str):
-    """
-    Check the status of a video analysis and retrieve results if complete.
-    """
-    if analysis_id not in analysis_results:
-        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
-    
-    status_data = analysis_results[analysis_id]
-    
-    # If analysis is complete, include the results in the response
-    if status_data["status"] == "completed":
-        # Return full results
-        return JSONResponse(status_data)
-    
-    # For processing or error status, just return the status info
-    return JSONResponse({
-        "status": status_data["status"],
-        "progress": status_data["progress"],
-        "message": status_data["message"]
-    })
-
-@app.delete("/api/analysis/{analysis_id}")
-async def delete_analysis(analysis_id: str):
-    """
-    Delete analysis results to free up server memory.
-    """
-    if analysis_id not in analysis_results:
-        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
-    
-    # Remove the analysis results
-    del analysis_results[analysis_id]
-    
-    return JSONResponse({
-        "status": "success",
-        "message": f"Analysis ID {analysis_id} has been deleted"
-    })
-
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    
+    for frame in frame_data:
+        landmarks = frame["landmarks"]
+        
+        # Track ankle positions for movement analysis
+        left_ankle = landmarks[PoseLandmark.LEFT_ANKLE.value]
+        right_ankle = landmarks[PoseLandmark.RIGHT_ANKLE.value]
+        left_foot = landmarks[PoseLandmark.LEFT_FOOT_INDEX.value]
+        right_foot = landmarks[PoseLandmark.RIGHT_FOOT_INDEX.value]
+        
+        # Check if toes are pointed (toe drive position)
+        left_toe_angle = calculate_angle(
+            (left_ankle["x"], left_ankle["y"]),
+            (left_foot["x"], left_foot["y"]),
+            (left_foot["x"], left_foot["y"] + 0.1)  # Vertical reference
+        )
+        
+        right_toe_angle = calculate_angle(
+            (right_ankle["x"], right_ankle["y"]),
+            (right_foot["x"], right_foot["y"]),
+            (right_foot["x"], right_foot["y"] + 0.1)  # Vertical reference
+        )
+        
+        # Average ankle position
+        avg_ankle_x = (left_ankle["x"] + right_ankle["x"]) / 2
+        avg_ankle_y = (left_ankle["y"] + right_ankle["y"]) / 2
+        
+        ankle_positions.append({
+            "time": frame["time"],
+            "x": avg_ankle_x,
+            "y": avg_ankle_y,
+            "left_toe_angle": left_toe_angle,
+            "right_toe_angle": right_toe_angle
+        })
+    
+    # Smooth the ankle position data
+    window_size = max(3, len(ankle_positions) // 20)
+    ankle_y_positions = [pos["y"] for pos in ankle_positions]
+    smoothed_y = moving_average(ankle_y_positions, window_size)
+    
+    # Detect movement cycles
+    cycles = detect_cycles(smoothed_y)
+    
+    # Generate feedback
+    feedback = []
+    feedback_points = []
+    
+    if cycles:
+        # Analyze each detected cycle
+        for i, (start_idx, end_idx) in enumerate(cycles):
+            start_time = ankle_positions[start_idx]["time"]
+            end_time = ankle_positions[end_idx]["time"]
+            
+            # Check toe pointing during the cycle
+            toe_angles = [(pos["left_toe_angle"] + pos["right_toe_angle"])/2 
+                         for pos in ankle_positions[start_idx:end_idx+1]]
+            
+            avg_toe_angle = sum(toe_angles) / len(toe_angles)
+            
+            rep_feedback = f"Repetition {i+1}: "
+            
+            if avg_toe_angle < 60:  # Toes not sufficiently pointed
+                rep_feedback += "Remember to point your toes more during toe drive."
+                feedback_points.append({
+                    "timestamp": start_time + (end_time - start_time) / 2,
+                    "message": "Point toes more"
+                })
+            else:
+                rep_feedback += "Good toe pointing during this repetition."
+                feedback_points.append({
+                    "timestamp": start_time + (end_time - start_time) / 2,
+                    "message": "✓ Good toe position"
+                })
+            
+            feedback.append(rep_feedback)
+    else:
+        feedback.append("Unable to detect clear toe drive movements. Try to rock forward and backward more distinctly with toes pointed.")
+    
+    # Generate summary
+    cycle_count = len(cycles)
+    
+    if cycle_count == 0:
+        summary = "No clear exercise repetitions detected. Try to make your movements more distinct with toes pointed."
+    else:
+        avg_duration = sum([(ankle_positions[end]["time"] - ankle_positions[start]["time"]) 
+                          for start, end in cycles]) / cycle_count
+        
+        # Calculate average toe angle across all cycles
+        all_toe_angles = []
+        for start, end in cycles:
+            cycle_angles = [(pos["left_toe_angle"] + pos["right_toe_angle"])/2 
+                           for pos in ankle_positions[start:end+1]]
+            all_toe_angles.extend(cycle_angles)
+        
+        avg_toe_angle = sum(all_toe_angles) / len(all_toe_angles) if all_toe_angles else 0
+        
+        toe_position = "good" if avg_toe_angle >= 60 else "needs improvement"
+        
+        summary = (
+            f"Completed {cycle_count} repetitions of toe drive. "
+            f"Average repetition duration: {avg_duration:.1f} seconds. "
+            f"Toe pointing: {toe_position}."
+        )
+    
+    return {
+        "feedback": feedback,
+        "feedback_points": feedback_points,
+        "summary": summary,
+        "repetitions": cycle_count
+    }
+
+def moving_average(data, window_size):
+    """
+    Apply a simple moving average to smooth data.
+    Optimized for performance.
+    """
+    if window_size <= 1 or len(data) <= window_size:
+        return data
+    
+    result = []
+    cumsum = [0]
+    for i, x in enumerate(data):
+        cumsum.append(cumsum[i] + x)
+        if i >= window_size:
+            result.append((cumsum[i+1] - cumsum[i+1-window_size]) / window_size)
+        else:
+            result.append((cumsum[i+1]) / (i+1))
+    
+    return result
+
+def detect_cycles(data):
+    """
+    Detect movement cycles in a time series.
+    Optimized to avoid excessive computation.
+    Returns pairs of (start_index, end_index) for each detected cycle.
+    """
+    if len(data) < 10:
+        return []
+    
+    # Find peaks (both high and low points)
+    # Simple peak detection without using external libraries
+    peaks = []
+    for i in range(1, len(data) - 1):
+        if (data[i-1] < data[i] and data[i] > data[i+1]) or (data[i-1] > data[i] and data[i] < data[i+1]):
+            peaks.append(i)
+    
+    # Need at least 3 peaks to have a complete cycle (start-peak-end)
+    if len(peaks) < 3:
+        return []
+    
+    # Group peaks into cycles
+    cycles = []
+    for i in range(0, len(peaks) - 2, 2):
+        # A cycle is from low point to low point
+        if i+2 < len(peaks):
+            cycles.append((peaks[i], peaks[i+2]))
+    
+    return cycles
+
+def calculate_angle(a, b, c):
+    """
+    Calculate angle between three points.
+    a, b, c are coordinates of three points (b is the vertex).
+    Returns angle in degrees.
+    """
+    # Calculate vectors
+    ba = (a[0] - b[0], a[1] - b[1])
+    bc = (c[0] - b[0], c[1] - b[1])
+    
+    # Calculate dot product
+    dot_product = ba[0] * bc[0] + ba[1] * bc[1]
+    
+    # Calculate magnitudes
+    magnitude_ba = math.sqrt(ba[0] ** 2 + ba[1] ** 2)
+    magnitude_bc = math.sqrt(bc[0] ** 2 + bc[1] ** 2)
+    
+    # Calculate angle in radians
+    try:
+        cos_angle = dot_product / (magnitude_ba * magnitude_bc)
+        # Clamp value to avoid numerical errors
+        cos_angle = max(min(cos_angle, 1.0), -1.0)
+        angle_rad = math.acos(cos_angle)
+    except:
+        return 0
+    
+    # Convert to degrees
+    angle_deg = math.degrees(angle_rad)
+    
+    return angle_deg
+
+def get_optimization_settings(optimization_level):
+    """
+    Map an optimization level (1 = best quality, 3 = fastest) to analysis settings.
+    """
+    if optimization_level == 1:
+        settings = {"frame_skip": 1, "decode_short_side": 720}
+    elif optimization_level == 2:
+        settings = {"frame_skip": 2, "decode_short_side": 540}
+    else:
+        settings = {"frame_skip": 3, "decode_short_side": 360}
+    
+    settings.update({
+        "scale_factor": 1.0,  # Downscaling already happens in the decoder
+        "max_frames": float('inf'),
+        "confidence_threshold": 0.2,
+        "adaptive_sampling": True,
+        "two_pass": True,
+        "roi_tracking": True,
+        "pipeline_workers": 1,
+        "parallel_segments": DEFAULT_PARALLEL_SEGMENTS,  # "auto" splits long videos across processes
+        "skip_duplicates": True,
+        "absence_backoff": True,
+        "preflight": True
+    })
+    return settings
+
+@app.post("/api/analyze-video")
+async def start_video_analysis(
+    background_tasks: BackgroundTasks,
+    video: UploadFile = File(...),
+    exercise_type: str = Form(default=ExerciseType.QUADRUPED),
+    optimization_level: int = Form(default=2),
+    deadline_seconds: Optional[float] = Form(default=None),
+    quality_tier: Optional[str] = Form(default=None),
+    skip_duplicates: bool = Form(default=True)
+):
+    """
+    Start an asynchronous video analysis and return an analysis ID to poll.
+    An optional processing deadline (or the server default) makes the analysis
+    lower its quality mid-run to finish on time. Reports default to the most
+    accurate quality tier the current load allows. `skip_duplicates=false`
+    turns off landmark reuse for near-identical frames.
+    """
+    if exercise_type not in [e.value for e in ExerciseType]:
+        exercise_type = ExerciseType.QUADRUPED
+    optimization_level = max(1, min(3, optimization_level))
+    
+    video_path = os.path.join(tempfile.gettempdir(), f"exercise_video_{str(uuid.uuid4())}.mp4")
+    
+    try:
+        with open(video_path, "wb") as buffer:
+            shutil.copyfileobj(video.file, buffer)
+        
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        short_side = min(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        cap.release()
+    except Exception as e:
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        print(f"Error receiving video: {e}")
+        raise HTTPException(status_code=500, detail=f"Error receiving video: {str(e)}")
+    
+    deadline = deadline_seconds or DEFAULT_ANALYSIS_DEADLINE
+    queue_depth = count_active_analyses() + 1
+    tier = select_quality_tier("report", quality_tier)
+    
+    def estimate_for(level):
+        return processing_estimator.estimate(
+            frame_count, fps, level, short_side, tier["model_complexity"], queue_depth)
+    
+    # Use the same model to pick a faster level up front when the requested one can't meet the deadline
+    estimated_time, estimate_source = estimate_for(optimization_level)
+    if deadline:
+        while estimated_time > deadline and optimization_level < 3:
+            optimization_level += 1
+            estimated_time, estimate_source = estimate_for(optimization_level)
+    
+    optimization_settings = apply_quality_tier(get_optimization_settings(optimization_level), tier)
+    optimization_settings["skip_duplicates"] = skip_duplicates
+    if deadline:
+        optimization_settings["deadline_seconds"] = deadline
+    
+    analysis_id = str(uuid.uuid4())
+    # Registered before queuing, so this worker counts it as active until it finishes
+    cancellations.token(analysis_id)
+    analysis_results[analysis_id] = {
+        "status": "queued",
+        "progress": 0,
+        "message": "Video queued for analysis...",
+        "estimate": {
+            "estimated_time": estimated_time,
+            "source": estimate_source,
+            "queue_depth": queue_depth,
+            "frame_count": frame_count,
+            "optimization_level": optimization_level,
+            "short_side": short_side,
+            "model_complexity": optimization_settings.get("model_complexity", 1)
+        }
+    }
+    background_tasks.add_task(process_video_async, video_path, exercise_type, analysis_id, optimization_settings)
+    
+    return JSONResponse({
+        "analysis_id": analysis_id,
+        "status": "queued",
+        "estimated_time": estimated_time,
+        "estimate_source": estimate_source,
+        "optimization_level": optimization_level,
+        "quality_tier": tier["name"],
+        "deadline_seconds": deadline
+    })
+
+def status_document(analysis_id, status_data, include_results=False):
+    """
+    Client-facing view of a result-store entry. Completed analyses point to
+    their results instead of embedding them unless `include_results` is set,
+    so status polls stay small; otherwise just status, progress, message and the ETA.
+    """
+    estimate = status_data.get("estimate")
+    
+    if status_data["status"] == "completed":
+        response = {k: v for k, v in status_data.items() if k not in ("started_at", "results")}
+        response["results_url"] = f"/api/analysis-results/{analysis_id}"
+        if include_results:
+            response["results"] = status_data.get("results")
+        return response
+    
+    # For processing or error status, just return the status info
+    response = {
+        "status": status_data["status"],
+        "progress": status_data["progress"],
+        "message": status_data["message"]
+    }
+    if estimate:
+        response["estimated_time"] = estimate["estimated_time"]
+        response["estimate_source"] = estimate["source"]
+        if status_data.get("started_at"):
+            elapsed = time.time() - status_data["started_at"]
+            response["eta_seconds"] = max(0, int(round(estimate["estimated_time"] - elapsed)))
+    return response
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header against our ETag.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def not_modified(request, etag, updated_at):
+    """
+    Whether the client's cached copy (If-None-Match, or failing that
+    If-Modified-Since) is still current.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and updated_at is not None:
+        try:
+            return int(updated_at) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def stable_last_modified(status_data, updated_at):
+    """
+    Last-Modified for an entry, or None when If-Modified-Since can't be trusted
+    with it: HTTP dates have one-second resolution, so only a finished entry
+    last written in an earlier second than now can't change unseen within it.
+    """
+    if status_data["status"] not in ("completed", "error", "cancelled") or updated_at is None:
+        return None
+    return updated_at if int(updated_at) < int(time.time()) else None
+
+def validator_headers(etag, updated_at):
+    """
+    ETag/Last-Modified headers for 200 and 304 responses alike. Clients must
+    revalidate before reusing a cached copy.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if updated_at is not None:
+        headers["Last-Modified"] = formatdate(updated_at, usegmt=True)
+    return headers
+
+# Width of the ETA buckets in status ETags: a cached status goes stale once
+# its ETA has moved into another bucket
+ETA_ETAG_BUCKET_SECONDS = 5
+
+@app.get("/api/analysis-status/{analysis_id}")
+async def get_analysis_status(analysis_id: str, request: Request, include_results: bool = False):
+    """
+    Check the status of a video analysis. Once it's completed the status links
+    to /api/analysis-results (pass include_results=true to embed them instead).
+    Supports If-None-Match, answering 304 when unchanged, and
+    If-Modified-Since once the analysis has finished.
+    """
+    # Whether a document has an ETA is fixed per version, so a matching
+    # ETA-less tag answers a revalidation without loading the entry
+    version, _ = analysis_results.stat(analysis_id)
+    if not version:
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    variant = "-results" if include_results else ""
+    etag = f'W/"{analysis_id}-{version}{variant}"'
+    if not_modified(request, etag, None):
+        return Response(status_code=304, headers=validator_headers(etag, None))
+    
+    status_data, version, updated_at = analysis_results.get_versioned(analysis_id)
+    if status_data is None:
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    document = status_document(analysis_id, status_data, include_results)
+    etag = f'W/"{analysis_id}-{version}{variant}"'
+    if "eta_seconds" in document:
+        # The ETA drifts with the clock between writes: tag its bucket
+        etag = f'W/"{analysis_id}-{version}{variant}-eta{document["eta_seconds"] // ETA_ETAG_BUCKET_SECONDS}"'
+    updated_at = stable_last_modified(status_data, updated_at)
+    if not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=validator_headers(etag, updated_at))
+    return JSONResponse(document, headers=validator_headers(etag, updated_at))
+
+@app.get("/api/analysis-results/{analysis_id}")
+async def get_analysis_results(analysis_id: str, request: Request):
+    """
+    Results (feedback, landmarks, summary) of a completed analysis.
+    Supports If-None-Match / If-Modified-Since, answering 304 when unchanged.
+    """
+    version, _ = analysis_results.stat(analysis_id)
+    if not version:
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    etag = f'"{analysis_id}-{version}"'
+    if not_modified(request, etag, None):
+        return Response(status_code=304, headers=validator_headers(etag, None))
+    
+    status_data, version, updated_at = analysis_results.get_versioned(analysis_id)
+    if status_data is None:
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    if status_data["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Analysis {analysis_id} is {status_data['status']}, not completed")
+    etag = f'"{analysis_id}-{version}"'
+    updated_at = stable_last_modified(status_data, updated_at)
+    if not_modified(request, etag, updated_at):
+        return Response(status_code=304, headers=validator_headers(etag, updated_at))
+    return JSONResponse(status_data["results"], headers=validator_headers(etag, updated_at))
+
+# How often the event stream checks the result store, and how long it may stay
+# silent before sending a keep-alive comment through proxies
+EVENT_STREAM_INTERVAL_SECONDS = 0.25
+EVENT_STREAM_KEEPALIVE_SECONDS = 15
+
+def format_sse(event, data, event_id=None):
+    """
+    Encode one Server-Sent Events message.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.get("/api/analysis-events/{analysis_id}")
+async def stream_analysis_events(analysis_id: str, request: Request, last_event_id: Optional[int] = None):
+    """
+    Server-Sent Events stream of an analysis: a `status` event whenever its
+    progress or stage changes, then a final `completed` (with results),
+    `error` or `cancelled` event. Event IDs are the entry's version, so a client reconnecting
+    with Last-Event-ID only receives what changed since (just an `end` event
+    if it already has the final one).
+    """
+    if not analysis_results.stat(analysis_id)[0]:
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    
+    # EventSource sends the header on reconnect; the query parameter is for other clients
+    header_id = request.headers.get("last-event-id")
+    if header_id and header_id.isdigit():
+        last_event_id = int(header_id)
+    
+    async def events():
+        sent_version = last_event_id or 0
+        checked = False
+        last_sent_at = time.time()
+        yield "retry: 2000\n\n"
+        
+        while not await request.is_disconnected():
+            # Poll the cheap version; only load the entry once it has changed
+            # (or once up front, to spot a reconnect after the final event)
+            version, _ = analysis_results.stat(analysis_id)
+            if not version:
+                yield format_sse("deleted", {"analysis_id": analysis_id})
+                return
+            
+            if version > sent_version or not checked:
+                status_data, version, _ = analysis_results.get_versioned(analysis_id)
+                if status_data is None:
+                    yield format_sse("deleted", {"analysis_id": analysis_id})
+                    return
+                checked = True
+                
+                finished = status_data["status"] in ("completed", "error", "cancelled")
+                if version > sent_version:
+                    event = status_data["status"] if finished else "status"
+                    yield format_sse(event, status_document(analysis_id, status_data, include_results=True), version)
+                    sent_version = version
+                    last_sent_at = time.time()
+                elif finished:
+                    # Reconnected after the final event: tell the client to stop retrying
+                    yield format_sse("end", {"status": status_data["status"]}, version)
+                if finished:
+                    return
+            
+            if time.time() - last_sent_at > EVENT_STREAM_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n"
+                last_sent_at = time.time()
+            await asyncio.sleep(EVENT_STREAM_INTERVAL_SECONDS)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Don't let nginx buffer the stream
+    })
+
+@app.get("/api/processing-estimator")
+async def get_processing_estimator():
+    """
+    Report the calibrated throughput model and its recent prediction error.
+    """
+    report = processing_estimator.report()
+    report["active_analyses"] = count_active_analyses()
+    return JSONResponse(report)
+
+@app.on_event("startup")
+async def report_thread_layout():
+    """
+    Apply the configured thread/CPU layout to this worker and log it.
+    """
+    worker_index = int(os.environ["WORKER_INDEX"]) if os.environ.get("WORKER_INDEX") else None
+    worker_count = int(os.environ["WORKER_COUNT"]) if os.environ.get("WORKER_COUNT") else None
+    layout = apply_thread_layout(worker_index, worker_count)
+    segment_process_slots.resize(segment_process_budget(worker_count))
+    layout["segment_processes"] = segment_process_slots.limit
+    print(f"Thread layout: {json.dumps(layout)}")
+
+@app.get("/api/thread-layout")
+async def get_thread_layout():
+    """
+    Report the effective thread layout of the worker serving this request.
+    """
+    worker_index = int(os.environ["WORKER_INDEX"]) if os.environ.get("WORKER_INDEX") else None
+    worker_count = int(os.environ["WORKER_COUNT"]) if os.environ.get("WORKER_COUNT") else None
+    layout = thread_layout_report(worker_index, worker_count)
+    layout["segment_processes"] = segment_process_slots.limit
+    return JSONResponse(layout)
+
+@app.get("/api/inference-scheduler")
+async def get_inference_scheduler():
+    """
+    Report batch-size and wait-time histograms of the position-check batching scheduler.
+    """
+    return JSONResponse(inference_scheduler.report())
+
+@app.get("/api/cancellations")
+async def get_cancellations():
+    """
+    Report how many analyses were cancelled and how long they took to stop.
+    """
+    return JSONResponse(cancellations.report())
+
+@app.get("/api/result-store")
+async def get_result_store():
+    """
+    Report which result store backs analysis status and how many entries it holds.
+    """
+    return JSONResponse(analysis_results.report())
+
+@app.get("/api/position-cache")
+async def get_position_cache():
+    """
+    Report hit ratio and size of the position-check result cache.
+    """
+    return JSONResponse(position_cache.report())
+
+@app.delete("/api/analysis/{analysis_id}")
+async def delete_analysis(analysis_id: str):
+    """
+    Delete analysis results to free up server memory.
+    A queued or running analysis is cancelled instead (202): it stops at its
+    next frame and its status becomes "cancelled", reporting how long stopping took.
+    """
+    status_data = analysis_results.get(analysis_id)
+    if status_data is None:
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    
+    if status_data["status"] in ("queued", "processing"):
+        # The marker reaches the job even when it runs in another worker process
+        requested_at = time.time()
+        analysis_results.patch(analysis_id, cancel_requested_at=requested_at, message="Cancelling video analysis...")
+        cancellations.cancel(analysis_id, requested_at)
+        return JSONResponse({
+            "status": "cancelling",
+            "message": f"Analysis ID {analysis_id} is being cancelled"
+        }, status_code=202)
+    
+    # Remove the analysis results
+    if not analysis_results.delete(analysis_id):
+        raise HTTPException(status_code=404, detail=f"Analysis ID {analysis_id} not found")
+    
+    return JSONResponse({
+        "status": "success",
+        "message": f"Analysis ID {analysis_id} has been deleted"
+    })
+
+# --- Multi-worker launcher ---
+
+def warm_up_models():
+    """
+    Run each pose model once so the first request doesn't pay for model
+    download and graph initialization. Called in each worker after the fork:
+    MediaPipe graphs and OpenCV thread pools must not exist in the launcher
+    (the same reason run_parallel_segments spawns its workers).
+    """
+    if DEFAULT_POSE_BACKEND != MediaPipePoseBackend.name or mp is None:
+        return
+    blank = np.zeros((256, 256, 3), dtype=np.uint8)
+    for model_complexity in (0, 1, 2):
+        with create_pose_backend(static_image_mode=True, model_complexity=model_complexity) as pose:
+            pose.infer(blank)
+
+def _run_worker(sock, worker_index, worker_count, max_jobs):
+    """
+    Body of a forked worker: serve the app on the inherited socket.
+    """
+    # Only the launcher reacts to SIGHUP; workers get SIGTERM to drain and exit
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    os.environ["WORKER_INDEX"] = str(worker_index)
+    os.environ["WORKER_COUNT"] = str(worker_count)
+    if max_jobs:
+        os.environ["MAX_JOBS_PER_WORKER"] = str(max_jobs)
+    warm_up_models()
+    server = uvicorn.Server(uvicorn.Config(app, log_level="info"))
+    server.run(sockets=[sock])
+
+def run_preforked(host="0.0.0.0", port=8000, workers=2, max_jobs=None):
+    """
+    Bind the listening socket once and fork `workers` server processes that
+    share it, along with the already-imported modules (copy-on-write). The
+    launcher never creates a pose graph or thread pool itself, so forking it
+    is safe; each worker loads its own models. The launcher replaces workers that exit (crashed,
+    or recycled after `max_jobs` jobs). SIGHUP does a rolling restart: each
+    worker is replaced by a fresh one and then told to drain and exit.
+    SIGTERM/SIGINT drain and stop all workers.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    
+    children = {}  # pid -> worker index
+    retiring = set()  # pids asked to exit that must not be replaced
+    state = {"stopping": False, "reload": False}
+    
+    def spawn(worker_index):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _run_worker(sock, worker_index, workers, max_jobs)
+            finally:
+                os._exit(0)
+        children[pid] = worker_index
+        print(f"Started worker {worker_index} (pid {pid})")
+    
+    def request_stop(signum, frame):
+        state["stopping"] = True
+    
+    def request_reload(signum, frame):
+        state["reload"] = True
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGHUP, request_reload)
+    
+    for worker_index in range(workers):
+        spawn(worker_index)
+    
+    while children:
+        if state["stopping"]:
+            for pid in children:
+                if pid not in retiring:
+                    os.kill(pid, signal.SIGTERM)
+                    retiring.add(pid)
+        elif state["reload"]:
+            state["reload"] = False
+            print("Reloading workers...")
+            for pid, worker_index in list(children.items()):
+                if pid in retiring:
+                    continue
+                spawn(worker_index)
+                os.kill(pid, signal.SIGTERM)
+                retiring.add(pid)
+        
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        
+        worker_index = children.pop(pid, None)
+        if pid in retiring:
+            retiring.discard(pid)
+        elif worker_index is not None and not state["stopping"]:
+            print(f"Worker {worker_index} (pid {pid}) exited with status {status}; replacing it")
+            spawn(worker_index)
+    
+    sock.close()
+
+# --- Static file serving ---
+# Create static directories for serving files
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Create a static directory in the app folder
+static_dir = os.path.join(current_dir, "static")
+os.makedirs(static_dir, exist_ok=True)
+
+# Mount static files
+app.mount("/static", StaticFiles(directory=static_dir), name="static")
+
+@app.get("/{full_path:path}")
+async def serve_react_app(full_path: str):
+    # For API routes, we've already defined them above
+    # For anything else, we'll return the index.html from our static folder
+    index_path = os.path.join(current_dir, "static", "index.html")
+    
+    # If index.html doesn't exist in static folder, create a placeholder
+    if not os.path.exists(index_path):
+        with open(index_path, "w") as f:
+            f.write("""
+            <!DOCTYPE html>
+            <html>
+                <head>
+                    <title>AI Physical Therapy Assistant</title>
+                    <meta charset="UTF-8">
+                    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+                </head>
+                <body>
+                    <h1>AI Physical Therapy Assistant API</h1>
+                    <p>This is the API server for the AI Physical Therapy Assistant. The React frontend should be served separately.</p>
+                    <p>Check documentation at <a href="/docs">/docs</a></p>
+                </body>
+            </html>
+            """)
+    
+    return FileResponse(index_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Movement Feedback API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 1)),
+                        help="Worker processes forked from a preloaded parent")
+    parser.add_argument("--max-jobs", type=int, default=None,
+                        help="Recycle a worker after this many jobs")
+    args = parser.parse_args()
+    
+    if args.workers > 1 or args.max_jobs:
+        # Workers only see each other's analyses (and a recycled worker's
+        # results survive it) through a shared store
+        if not os.environ.get("RESULT_STORE"):
+            os.environ["RESULT_STORE"] = SQLiteResultStore.name
+            analysis_results = create_result_store()
+        run_preforked(args.host, args.port, args.workers, args.max_jobs)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -42,6 +42,8 @@ function Video() {
     const mediaRecorderRef = useRef(null)
     const recordingIntervalRef = useRef(null)
     const animationFrameRef = useRef(null)
+    // Identifies this camera session so the server can reuse results for unchanged frames
+    const positionSessionIdRef = useRef(Math.random().toString(36).slice(2))
     const positionCheckIntervalRef = useRef(null)
     const analysisTimerRef = useRef(null)
     const chunksRef = useRef([])
@@ -435,6 +437,7 @@ function Video() {
                         const formData = new FormData();
                         formData.append('image', blob, 'position_check.jpg');
                         formData.append('exercise_type', selectedExercise);
+                        formData.append('session_id', positionSessionIdRef.current);
                         
                         try {
                             if (!checkVisibilityIssues()) {